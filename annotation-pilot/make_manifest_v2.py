@@ -1,138 +1,338 @@
 """
 Generate IIIF v2 manifests for usage in Recogito.
+
+Every v2 manifest combines the canvases of all manifests in one or more
+IIIF Presentation 3.0 collections. The manifests are loaded
+concurrently, and each of them only once, also if it is in several
+collections. The canvases are written to the v2 manifest as soon as they
+are converted, in the order of the collections, so that only a bounded
+number of manifests is in memory at a time.
+
+Usage:
+
+    python make_manifest_v2.py Taiwan maps/4.VEL/B/B.3/B.3.16.json
+    python make_manifest_v2.py India https://.../4.VEL/B/B.3/B.3.2.json ...
+    python make_manifest_v2.py --config ../data/manifests_v2.json --maps-dir ../maps/
+
+Collections and manifests can be paths or URLs. With `--maps-dir`,
+URLs under `--maps-url` are read from that folder instead.
 """
 
+import argparse
 import json
-from iiif_prezi.factory import ManifestFactory
+import os
+import sys
+import textwrap
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import requests
 
-IIIF_BASE_URL = "https://service.archief.nl/iipsrv?IIIF="
-
-# Define our Manifest factory
-fac = ManifestFactory()
-fac.set_base_prezi_uri("https://globalise-huygens.github.io/maps/manifests/v2/")
-fac.set_base_image_uri(IIIF_BASE_URL)
-# fac.set_base_prezi_dir("./")
-fac.set_iiif_image_info(2.0, 2)  # Version, ComplianceLevel
-# fac.set_debug("warn")
-
-collections = [
-    (
-        "Taiwan",
-        ["/home/leon/Documents/GLOBALISE/maps/maps/4.VEL/B/B.3/B.3.16.json"],
-    ),
-    (
-        "China_Japan",
-        ["/home/leon/Documents/GLOBALISE/maps/maps/4.VEL/B/B.3/B.3.10.json"],
-    ),
-    (
-        "Indonesia",
-        ["/home/leon/Documents/GLOBALISE/maps/maps/4.VEL/B/B.3/B.3.20/java.json"],
-    ),
-    (
-        "India",
-        [
-            "/home/leon/Documents/GLOBALISE/maps/maps/4.VEL/B/B.3/B.3.2.json",
-            "/home/leon/Documents/GLOBALISE/maps/maps/4.VEL/B/B.3/B.3.6.json",
-        ],
-    ),
-]
-
-
-def get_manifest_data(files):
-    manifest_data = []
-
-    for i in files:
-        # r = requests.get(i)
-        # data = r.json()
-        with open(i) as f:
-            data = json.load(f)
-
-        for manifest in data["items"]:
-            manifest_id = manifest["id"]
-            label = manifest["label"]["en"][0].strip()
-
-            with open(
-                manifest_id.replace(
-                    "https://data.globalise.huygens.knaw.nl/manifests/maps/",
-                    "/home/leon/Documents/GLOBALISE/maps/maps/",
-                )
-            ) as f:
-                manifest = json.load(f)
-
-            metadata = manifest["metadata"]
-            if metadata == []:
-                metadata = data["metadata"]
-            # Example [{'label': {'en': ['Identifier']}, 'value': {'en': ['234']}}, {'label': {'en': ['Title']}, 'value': {'en': ['1e exemplaar']}}, {'label': {'en': ['Date']}, 'value': {'en': ['?']}}, {'label': {'en': ['Permalink']}, 'value': {'en': ['<a href="http://hdl.handle.net/10648/27284337-5324-4daf-8125-2f97cfdd0be9">http://hdl.handle.net/10648/27284337-5324-4daf-8125-2f97cfdd0be9</a>']}}]
-
-            metadata = {m["label"]["en"][0]: m["value"]["en"][0] for m in metadata}
-
-            for canvas in manifest["items"]:
-                canvas_id = canvas["id"]
-                canvas_label = canvas["label"]["en"][0].strip()
-                service = (
-                    canvas["items"][0]["items"][0]["body"]["service"][0]["@id"]
-                    + "/info.json"
-                )
+# The v2 layout is shared with the build, see `iiif_v2` in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import iiif_v2  # noqa: E402
+
+MAPS_URL = "https://data.globalise.huygens.knaw.nl/manifests/maps/"
+BASE_URL = "https://globalise-huygens.github.io/maps/manifests/v2/"
+
+
+class ManifestLoader:
+    """
+    Load collections and manifests from disk or the web, concurrently.
+
+    The canvases of every manifest are memoized by its id until its
+    last occurrence in the collections is converted, so that a manifest
+    in several collections is loaded once.
+    """
+
+    def __init__(self, maps_dir: str = "", maps_url: str = MAPS_URL, workers: int = 8):
+        """
+        Args:
+            maps_dir (str, optional): Folder to read the documents under
+            maps_url from, or "" to fetch them. Defaults to "".
+            maps_url (str, optional): Base URL of the documents in maps_dir.
+            workers (int, optional): Number of manifests loaded at once.
+            Defaults to 8.
+        """
+        self.maps_dir = maps_dir
+        self.maps_url = maps_url
+        self.workers = workers
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
-                manifest_data.append(
-                    (label, metadata, service, canvas_id, canvas_label)
+        self.executor = ThreadPoolExecutor(workers)
+
+        self._lock = threading.Lock()
+        self._manifests = {}  # id -> Future of `manifest_data`
+        self._remaining = Counter()  # id -> occurrences still to convert
+
+    def load(self, location: str) -> dict:
+        """Load a JSON document from a path or URL."""
+        if self.maps_dir and location.startswith(self.maps_url):
+            location = os.path.join(self.maps_dir, location[len(self.maps_url) :])
+
+        if location.startswith(("http://", "https://")):
+            response = self.session.get(location)
+            response.raise_for_status()
+
+            return response.json()
+
+        with open(location, "rb") as infile:
+            return json.load(infile)
+
+    def manifest(self, manifest_id: str, collection: dict) -> Future:
+        """The (memoized) `manifest_data` of a manifest, loaded in the pool."""
+        with self._lock:
+            future = self._manifests.get(manifest_id)
+            if future is None:
+                future = self.executor.submit(
+                    self._load_manifest, manifest_id, collection
                 )
+                self._manifests[manifest_id] = future
 
-    return manifest_data
+        return future
 
+    def _load_manifest(self, manifest_id: str, collection: dict) -> list[dict]:
+        return manifest_data(self.load(manifest_id), collection)
 
-def main():
-    for name, files in collections:
-        print(f"Processing {name}")
-        manifest_data = get_manifest_data(files)
+    def release(self, manifest_id: str) -> None:
+        """Forget the canvases of a manifest after its last occurrence."""
+        with self._lock:
+            self._remaining[manifest_id] -= 1
+            if self._remaining[manifest_id] <= 0:
+                del self._remaining[manifest_id]
+                self._manifests.pop(manifest_id, None)
 
-        # Create the manifest
-        manifest = make_manifest_v2(manifest_data, name)
+    def canvases(self, collections: list[str]):
+        """
+        For each canvas of the manifests in some collections, yield its
+        v2 version, in order.
 
-        # And save it
-        with open(
-            f"/home/leon/Documents/GLOBALISE/maps/static/manifests/v2/{name}.json", "w"
-        ) as f:
-            manifest_json = manifest.toJSON(top=True)
-            manifest_json["@id"] = manifest_json["@id"].replace(
-                "manifest.json", f"{name}.json"
-            )
+        Args:
+            collections (list[str]): Paths or URLs of the collections.
 
-            json.dump(manifest_json, f, indent=4)
+        Yields:
+            Iterator[dict]: The v2 canvases.
+        """
+        # The collections only have references, so they are read first
+        items = []
+        for location in collections:
+            items += self.manifest_items(self.load(location))
 
+        with self._lock:
+            self._remaining.update(manifest_id for manifest_id, _ in items)
 
-def make_manifest_v2(manifest_data, label):
-    # Create the manifest itself with basic metadata
-    manifest = fac.manifest(label=label)
-    manifest.viewingDirection = "left-to-right"
+        # Keep the pool busy, but only a few manifests ahead
+        pending = deque()
+        for manifest_id, metadata in items:
+            pending.append((manifest_id, self.manifest(manifest_id, metadata)))
 
-    # And then the canvases in a sequence
-    seq = manifest.sequence()
+            if len(pending) > 2 * self.workers:
+                yield from self._converted(*pending.popleft())
 
-    for label, metadata, service, canvas_id, canvas_label in manifest_data:
-        print(label)
+        while pending:
+            yield from self._converted(*pending.popleft())
 
-        cvs = seq.canvas(
-            ident=canvas_id,
-            label=f"{canvas_label} - {label}",
-        )
+    def manifest_items(
+        self, collection: dict, metadata: list | None = None
+    ) -> list[tuple]:
+        """
+        The manifests in a collection, in order.
+
+        The pages of a paged collection (see `page_collection` in
+        make_iiif_manifests.py) are only referenced, so they are loaded
+        and their manifests are part of the collection. Sub-collections
+        that are embedded are left out, as in a collection without pages.
+
+        Args:
+            collection (dict): The collection.
+            metadata (list, optional): Metadata of the paged collection,
+            for a page. Defaults to None.
+
+        Returns:
+            list[tuple]: For every manifest, its id and its collection
+            (with the metadata for `manifest_data`).
+        """
+        metadata = collection.get("metadata") or metadata or []
+
+        items = []
+        for item in collection["items"]:
+            if item["type"] == "Manifest":
+                items.append((item["id"], {"metadata": metadata}))
+            elif item["type"] == "Collection" and "items" not in item:
+                items += self.manifest_items(self.load(item["id"]), metadata)
+
+        return items
 
-        print(service)
-        cvs.set_image_annotation(
-            imgid=service.replace("/info.json", "").replace(
-                "https://service.archief.nl/iipsrv?IIIF=", ""
-            ),
-            iiif=True,
+    def _converted(self, manifest_id: str, future: Future):
+        yield from future.result()
+        self.release(manifest_id)
+
+
+def manifest_data(manifest: dict, collection: dict) -> list[dict]:
+    """
+    Convert the canvases of a IIIF Presentation 3.0 manifest to v2.
+
+    Every canvas gets the label of the manifest in its label, and the
+    metadata of the manifest (or of its collection, if the manifest has
+    none) as its metadata. Canvases without image are left out.
+
+    Args:
+        manifest (dict): The manifest.
+        collection (dict): Its collection, for the metadata.
+
+    Returns:
+        list[dict]: The v2 canvases.
+    """
+    label = manifest["label"]["en"][0].strip()
+
+    metadata = manifest.get("metadata") or collection.get("metadata", [])
+    metadata = {m["label"]["en"][0]: m["value"]["en"][0] for m in metadata}
+
+    canvases = []
+    for canvas in manifest["items"]:
+        if not canvas.get("items"):
+            continue  # placeholder
+
+        canvas_label = canvas["label"]["en"][0].strip()
+        body = canvas["items"][0]["items"][0]["body"]
+        service = body["service"][0]
+        service_id = service.get("@id", service.get("id"))
+
+        canvases.append(
+            iiif_v2.canvas(
+                canvas["id"],
+                f"{canvas_label} - {label}",
+                {"Label": canvas_label, **metadata},
+                service_id,
+                body["height"],
+                body["width"],
+            )
         )
 
-        metadata = {"Label": canvas_label, **metadata}
+    return canvases
+
+
+def write_manifest_v2(path: str, manifest_id: str, label: str, canvases) -> int:
+    """
+    Write a v2 manifest, one canvas at a time.
+
+    The file is the same as `json.dump(manifest, outfile, indent=4)` of
+    the whole manifest.
 
-        print(metadata)
-        cvs.set_metadata(metadata)
+    Args:
+        path (str): Path of the manifest.
+        manifest_id (str): Id of the manifest.
+        label (str): Label of the manifest.
+        canvases (Iterator[dict]): The v2 canvases.
 
-    return manifest
+    Returns:
+        int: Number of canvases.
+    """
+    manifest = iiif_v2.manifest(manifest_id, label, ["CANVASES"])
+    head, tail = json.dumps(manifest, indent=4).split('"CANVASES"')
+    indent = head[head.rindex("\n") + 1 :]
+
+    n = 0
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w") as outfile:
+            for canvas in canvases:
+                outfile.write(head if n == 0 else ",\n" + indent)
+                outfile.write(
+                    textwrap.indent(json.dumps(canvas, indent=4), indent).lstrip()
+                )
+                n += 1
+
+            if n == 0:
+                outfile.write(head.rstrip() + "]" + tail.split("]", 1)[1])  # as "[]"
+            else:
+                outfile.write(tail)
+    except BaseException:
+        os.remove(tmp_path)  # keep the previous manifest
+        raise
+
+    os.replace(tmp_path, path)
+
+    return n
+
+
+def main(
+    manifests: dict[str, list[str]],
+    output_dir: str = ".",
+    base_url: str = BASE_URL,
+    maps_dir: str = "",
+    maps_url: str = MAPS_URL,
+    workers: int = 8,
+):
+    """
+    Convert collections to v2 manifests.
+
+    Args:
+        manifests (dict[str, list[str]]): For the name of every v2
+        manifest, the paths or URLs of its collections.
+        output_dir (str, optional): Folder to write the manifests to
+        (`<name>.json`). Defaults to ".".
+        base_url (str, optional): Base URL of the v2 manifests.
+        maps_dir (str, optional): Folder to read the documents under
+        maps_url from. Defaults to "" (fetch them).
+        maps_url (str, optional): Base URL of the documents in maps_dir.
+        workers (int, optional): Number of manifests loaded at once.
+        Defaults to 8.
+    """
+    loader = ManifestLoader(maps_dir, maps_url=maps_url, workers=workers)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Shut the threads down, also if a manifest fails
+    with loader.executor:
+        for name, collections in manifests.items():
+            print(f"Processing {name}")
+
+            n = write_manifest_v2(
+                os.path.join(output_dir, f"{name}.json"),
+                f"{base_url}{name}.json",
+                name,
+                loader.canvases(collections),
+            )
+            print(f"{n} canvases")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("name", nargs="?", help="Name of the v2 manifest")
+    parser.add_argument("collections", nargs="*", help="Paths or URLs")
+    parser.add_argument(
+        "--config",
+        help="JSON file with the collections of every v2 manifest, "
+        "relative to --maps-url",
+    )
+    parser.add_argument("--output-dir", default="../static/manifests/v2/")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--maps-dir", default="")
+    parser.add_argument("--maps-url", default=MAPS_URL)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.config:
+        with open(args.config) as infile:
+            manifests = {
+                name: [args.maps_url + path for path in paths]
+                for name, paths in json.load(infile).items()
+            }
+    elif args.name and args.collections:
+        manifests = {args.name: args.collections}
+    else:
+        parser.error("Give a name and collections, or --config")
+
+    main(
+        manifests,
+        output_dir=args.output_dir,
+        base_url=args.base_url,
+        maps_dir=args.maps_dir,
+        maps_url=args.maps_url,
+        workers=args.workers,
+    )
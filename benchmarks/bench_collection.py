@@ -0,0 +1,99 @@
+"""
+Compare reading the header of a collection with loading all of it.
+
+`make_collection` used to `json.load` every collection in the folder
+to get its id, type and label. `read_header` stops after the header,
+so its time should not grow with the number of items.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.bench_collection [--items 100 1000 10000]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from iiif_files import read_header
+
+BASE_URL = "https://example.org/iiif/"
+
+
+def synthetic_collection(n_items: int) -> dict:
+    return {
+        "@context": "http://iiif.io/api/presentation/3/context.json",
+        "id": f"{BASE_URL}BENCH.json",
+        "type": "Collection",
+        "label": {"en": ["BENCH - Synthetic collection"]},
+        "items": [
+            {
+                "id": f"{BASE_URL}BENCH/{k}.json",
+                "type": "Manifest",
+                "label": {"en": [f"{k} - Kaart van het eiland Ceylon, blad {k}"]},
+            }
+            for k in range(n_items)
+        ],
+    }
+
+
+def best_of(func, runs: int) -> float:
+    best = float("inf")
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def load(path):
+    with open(path) as infile:
+        return json.load(infile)
+
+
+def main(sizes=(100, 1000, 10000), runs=5):
+    results = []
+
+    with tempfile.TemporaryDirectory() as folder:
+        for n in sizes:
+            path = os.path.join(folder, f"{n}.json")
+            with open(path, "w") as outfile:
+                json.dump(synthetic_collection(n), outfile, indent=2)
+
+            full = load(path)
+            assert read_header(path) == {k: full[k] for k in ("id", "type", "label")}
+
+            results.append(
+                {
+                    "items": n,
+                    "bytes": os.path.getsize(path),
+                    "json_load": best_of(lambda: load(path), runs),
+                    "read_header": best_of(lambda: read_header(path), runs),
+                }
+            )
+
+    print(f"{'items':>8} {'KB':>8} {'json.load ms':>13} {'read_header ms':>15}")
+    for r in results:
+        print(
+            f"{r['items']:>8} {r['bytes'] // 1024:>8} {r['json_load'] * 1000:>13.3f} "
+            f"{r['read_header'] * 1000:>15.3f}"
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = main(args.items, runs=args.runs)
+
+    if args.json:
+        with open(args.json, "w") as outfile:
+            json.dump(results, outfile, indent=2)
@@ -0,0 +1,87 @@
+"""
+Compare parsing an EAD file with loading its pre-parsed snapshot.
+
+Times `parse_ead`, `iterparse_ead` and `load_ead` with a warm snapshot
+cache (the best of several runs), and checks that all three give the
+same hierarchy.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.bench_ead [--runs 5] [ead files...]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from cache import FileCache
+from make_iiif_manifests import iterparse_ead, load_ead, parse_ead
+
+DEFAULT_EAD = "data/NA/ead/4.AANW.xml"
+
+
+def best_of(func, runs: int) -> float:
+    best = float("inf")
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main(ead_file_paths, runs=5):
+    results = []
+
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        snapshots = FileCache(snapshot_dir, suffix=".pickle")
+
+        for path in ead_file_paths:
+            fonds = parse_ead(path)
+            assert iterparse_ead(path) == fonds
+            assert load_ead(path, snapshots=snapshots) == fonds  # fills the cache
+            assert load_ead(path, snapshots=snapshots) == fonds
+
+            result = {
+                "ead": os.path.basename(path),
+                "ead_bytes": os.path.getsize(path),
+                "snapshot_bytes": snapshots.stats()["bytes_written"],
+                "parse_ead": best_of(lambda: parse_ead(path), runs),
+                "iterparse_ead": best_of(lambda: iterparse_ead(path), runs),
+                "snapshot": best_of(lambda: load_ead(path, snapshots=snapshots), runs),
+            }
+            result["speedup"] = result["parse_ead"] / result["snapshot"]
+            results.append(result)
+
+            snapshots.bytes_written = 0
+
+    print(
+        f"{'EAD':<12} {'EAD KB':>8} {'snap KB':>8} {'parse_ead':>10} "
+        f"{'iterparse':>10} {'snapshot':>10} {'speedup':>8}"
+    )
+    for r in results:
+        print(
+            f"{r['ead']:<12} {r['ead_bytes'] // 1024:>8} "
+            f"{r['snapshot_bytes'] // 1024:>8} "
+            f"{r['parse_ead']:>10.4f} {r['iterparse_ead']:>10.4f} "
+            f"{r['snapshot']:>10.4f} {r['speedup']:>7.1f}x"
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("ead_files", nargs="*", default=[DEFAULT_EAD])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = main(args.ead_files, runs=args.runs)
+
+    if args.json:
+        with open(args.json, "w") as outfile:
+            json.dump(results, outfile, indent=2)
@@ -0,0 +1,153 @@
+"""
+Compare the peak memory of a build with and without `low_memory`.
+
+Builds a synthetic fonds (one series with many files, every file with
+1 to 4 scans) against the local stand-in server. The METS files and
+image information are fetched once up front, after which every build
+runs in a fresh process, so that its peak resident memory can be
+attributed to the build alone.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.bench_memory [--files 2000] [--fast-json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from benchmarks import standin
+
+BASE_URL = "https://example.org/iiif/"
+
+
+def _peak_rss() -> int:
+    """Peak resident set size of this process in KiB (Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def synthetic_fonds(n_files: int):
+    from make_iiif_manifests import File, Fonds, Series
+
+    files = [
+        File(
+            code=f"{k}",
+            title=f"Kaart van het eiland Ceylon, blad {k}",
+            uri=f"http://hdl.handle.net/10648/{k:08d}",
+            date="1700/1799",
+            metsid=f"bench-{k}",
+        )
+        for k in range(1, n_files + 1)
+    ]
+
+    return Fonds(
+        code="BENCH",
+        title="Synthetic fonds",
+        hasPart=[Series(code="1", title="Kaarten", hasPart=files)],
+    )
+
+
+def _run(n_files, work_dir, mets_url, options, queue):
+    import make_iiif_manifests as m
+    from cache import FileCache, ImageInfoCache
+
+    sys.stdout = open(os.devnull, "w")
+
+    fonds = synthetic_fonds(n_files)
+    cache = FileCache(os.path.join(work_dir, "cache"))
+    image_info = ImageInfoCache(os.path.join(work_dir, "cache", "image_info.sqlite"))
+
+    mets_scans = m.prefetch(
+        fonds,
+        cache=cache,
+        image_info=image_info,
+        mets_url=mets_url,
+        requester=m.make_requester(rate=None),
+    )
+    rss_before = _peak_rss()
+
+    start = time.perf_counter()
+    if options.get("build", True):
+        config = m.BuildConfig(
+            base_url=BASE_URL,
+            target_dir=os.path.join(work_dir, "iiif", ""),
+            mets_scans=mets_scans,
+            cache=cache,
+            mets_url=mets_url,
+            image_info=image_info,
+            quiet=True,
+            **{k: v for k, v in options.items() if k != "build"},
+        )
+        m.to_collection(fonds, config)
+    seconds = time.perf_counter() - start
+
+    queue.put(
+        {
+            "canvases": sum(len(scans) for scans in mets_scans.values()),
+            "seconds": seconds,
+            "peak_rss_kb": _peak_rss(),
+            "build_peak_rss_kb": _peak_rss() - rss_before,
+        }
+    )
+
+
+def main(n_files=2000, fast_json=False):
+    server = standin.serve()
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+
+    def run(work_dir, options):
+        p = ctx.Process(
+            target=_run, args=(n_files, work_dir, server.mets_url, options, queue)
+        )
+        p.start()
+        result = queue.get()
+        p.join()
+
+        return result
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Fill the caches
+        run(work_dir, {"build": False})
+
+        for low_memory in (False, True):
+            result = run(work_dir, {"low_memory": low_memory, "fast_json": fast_json})
+            result["low_memory"] = low_memory
+            result["fast_json"] = fast_json
+            results.append(result)
+
+    server.shutdown()
+
+    print(f"{n_files} manifests, {results[0]['canvases']} canvases")
+    print(
+        f"{'low_memory':<11} {'seconds':>8} {'peak RSS KB':>12} "
+        f"{'build growth KB':>16}"
+    )
+    for r in results:
+        print(
+            f"{str(r['low_memory']):<11} {r['seconds']:>8.2f} "
+            f"{r['peak_rss_kb']:>12} {r['build_peak_rss_kb']:>16}"
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--fast-json", action="store_true")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = main(args.files, fast_json=args.fast_json)
+
+    if args.json:
+        with open(args.json, "w") as outfile:
+            json.dump(results, outfile, indent=2)
@@ -0,0 +1,103 @@
+"""
+Compare the METS parsing of `get_scans` with the per-file structMap search.
+
+The previous implementation searched the structMap with a fresh
+`find` for every file in the DISPLAY fileGrp, which is quadratic in
+the number of scans. `parse_mets` indexes the structMap once.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.bench_mets [--scans 10 100 1000 5000]
+"""
+
+import argparse
+import json
+import time
+
+from lxml import etree as ET
+
+from benchmarks import synthetic
+from make_iiif_manifests import METS_NS, parse_mets
+
+
+def parse_mets_find(mets) -> list[tuple[str, str]]:
+    """The METS parsing of get_scans before the structMap index."""
+    scans = []
+
+    for file_el in mets.findall(
+        "mets:fileSec/mets:fileGrp[@USE='DISPLAY']/mets:file",
+        namespaces=METS_NS,
+    ):
+        file_id = file_el.attrib["ID"][:-3]  # without IIP
+        service_info_url = file_el.find(
+            "./mets:FLocat[@LOCTYPE='URL']",
+            namespaces=METS_NS,
+        ).attrib["{http://www.w3.org/1999/xlink}href"]
+
+        service_info_url = service_info_url.replace("/iip/", "/iipsrv?IIIF=/")
+
+        file_name = (
+            mets.find(
+                "mets:structMap/mets:div/mets:div[@ID='" + file_id + "']",
+                namespaces=METS_NS,
+            )
+            .attrib["LABEL"]
+            .split("/")[-1]
+        )
+
+        scans.append((file_name, service_info_url))
+
+    return scans
+
+
+def _time(function, mets, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(mets)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main(sizes=(10, 100, 1000, 5000), repeat=3):
+    results = []
+
+    for n in sizes:
+        mets = ET.fromstring(
+            synthetic.mets_xml(f"bench-{n}", "https://service.archief.nl", n=n)
+        )
+
+        if parse_mets(mets) != parse_mets_find(mets):
+            raise AssertionError(f"Different scans for {n} files")
+
+        results.append(
+            {
+                "scans": n,
+                "find_seconds": _time(parse_mets_find, mets, repeat),
+                "index_seconds": _time(parse_mets, mets, repeat),
+            }
+        )
+
+    print(f"{'scans':>6} {'find (s)':>10} {'index (s)':>10} {'speedup':>8}")
+    for r in results:
+        print(
+            f"{r['scans']:>6} {r['find_seconds']:>10.4f} {r['index_seconds']:>10.4f} "
+            f"{r['find_seconds'] / r['index_seconds']:>7.1f}x"
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scans", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = main(args.scans, repeat=args.repeat)
+
+    if args.json:
+        with open(args.json, "w") as outfile:
+            json.dump(results, outfile, indent=2)
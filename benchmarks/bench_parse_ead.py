@@ -0,0 +1,97 @@
+"""
+Compare `parse_ead` (full tree) with `iterparse_ead` (streaming).
+
+Every parse runs in a fresh process, so that the peak resident memory
+(including the memory of libxml2, which tracemalloc does not see) can
+be attributed to a single parse.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.bench_parse_ead [--repeat 3] [ead files...]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import time
+
+import make_iiif_manifests
+
+NA_EAD_FOLDER = "data/NA/ead"
+
+PARSERS = {
+    "parse_ead": make_iiif_manifests.parse_ead,
+    "iterparse_ead": make_iiif_manifests.iterparse_ead,
+}
+
+
+def _peak_rss() -> int:
+    """Peak resident set size of this process in KiB (Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run(parser_name, ead_file_path, repeat, queue):
+    parser = PARSERS[parser_name]
+
+    rss_before = _peak_rss()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fonds = parser(ead_file_path)
+        timings.append(time.perf_counter() - start)
+        del fonds
+
+    queue.put(
+        {
+            "parser": parser_name,
+            "ead": os.path.basename(ead_file_path),
+            "size_kb": os.path.getsize(ead_file_path) // 1024,
+            "seconds": min(timings),
+            "peak_rss_kb": _peak_rss() - rss_before,
+        }
+    )
+
+
+def main(ead_file_paths, repeat=3):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+
+    results = []
+    for ead_file_path in ead_file_paths:
+        for parser_name in PARSERS:
+            p = ctx.Process(
+                target=_run, args=(parser_name, ead_file_path, repeat, queue)
+            )
+            p.start()
+            results.append(queue.get())
+            p.join()
+
+    print(f"{'EAD':<12} {'KB':>6} {'parser':<14} {'seconds':>8} {'peak RSS KB':>12}")
+    for r in results:
+        print(
+            f"{r['ead']:<12} {r['size_kb']:>6} {r['parser']:<14} "
+            f"{r['seconds']:>8.3f} {r['peak_rss_kb']:>12}"
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("ead_files", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    ead_files = args.ead_files or [
+        os.path.join(NA_EAD_FOLDER, f) for f in sorted(os.listdir(NA_EAD_FOLDER))
+    ]
+
+    results = main(ead_files, repeat=args.repeat)
+
+    if args.json:
+        with open(args.json, "w") as outfile:
+            json.dump(results, outfile, indent=2)
@@ -0,0 +1,242 @@
+"""
+End-to-end benchmark of the manifest pipeline, without network access.
+
+Builds the collections and manifests of the bundled EAD files against
+a local stand-in server (`benchmarks.standin`) with synthetic METS
+documents and image information. Every fonds is built in a fresh
+process with a cold cache (and, with --warm, once more with the cache
+of the first run), and the results are reported per stage:
+
+    parse     iterparse_ead
+    prefetch  METS files and image information
+    build     to_collection (manifests and collections)
+    retry     retry_placeholders (only with errors)
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.bench_pipeline [--latency 0.02] [--error-rate 0.01]
+        [--warm] [--json results.json] [ead files...]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from benchmarks import standin
+
+NA_EAD_FOLDER = "data/NA/ead"
+BASE_URL = "https://data.globalise.huygens.knaw.nl/manifests/maps/"
+
+
+def _peak_rss() -> int:
+    """Peak resident set size of this process in KiB (Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _count_manifests(target_dir: str) -> int:
+    manifests = 0
+
+    for root, _, files in os.walk(target_dir):
+        for f in files:
+            with open(os.path.join(root, f), "rb") as infile:
+                if json.load(infile)["type"] == "Manifest":
+                    manifests += 1
+
+    return manifests
+
+
+def _run(ead_file_path, work_dir, mets_url, options, queue):
+    import make_iiif_manifests as m
+    from cache import FileCache, ImageInfoCache
+
+    # Progress output of the pipeline
+    sys.stdout = open(os.devnull, "w")
+
+    stages = {}
+
+    start = time.perf_counter()
+    fonds = m.iterparse_ead(ead_file_path)
+    stages["parse"] = time.perf_counter() - start
+
+    cache = FileCache(os.path.join(work_dir, "cache"))
+    image_info = ImageInfoCache(os.path.join(work_dir, "cache", "image_info.sqlite"))
+    requester = m.make_requester(options["max_workers"], rate=options["rate"])
+    target_dir = os.path.join(work_dir, "iiif", "")
+
+    start = time.perf_counter()
+    mets_scans = m.prefetch(
+        fonds,
+        max_workers=options["max_workers"],
+        cache=cache,
+        image_info=image_info,
+        mets_url=mets_url,
+        requester=requester,
+    )
+    stages["prefetch"] = time.perf_counter() - start
+
+    config = m.BuildConfig(
+        base_url=BASE_URL,
+        target_dir=target_dir,
+        base_url_manifests=BASE_URL,
+        use_filegroup=True,
+        mets_scans=mets_scans,
+        cache=cache,
+        mets_url=mets_url,
+        image_info=image_info,
+        fast_json=options["fast_json"],
+        requester=requester,
+        retry_queue=[],
+    )
+
+    start = time.perf_counter()
+    m.to_collection(fonds, config)
+    stages["build"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if config.retry_queue:
+        m.retry_placeholders(
+            config.retry_queue, config, max_workers=options["max_workers"]
+        )
+    stages["retry"] = time.perf_counter() - start
+
+    queue.put(
+        {
+            "stages": stages,
+            "requests": requester.stats(),
+            "manifests": _count_manifests(target_dir),
+            "peak_rss_kb": _peak_rss(),
+        }
+    )
+
+
+def run(ead_file_path, work_dir, server, options, ctx, queue) -> dict:
+    """Build one fonds in a fresh process and collect its measurements."""
+    counts_before = dict(server.counts)
+
+    p = ctx.Process(
+        target=_run,
+        args=(ead_file_path, work_dir, server.mets_url, options, queue),
+    )
+    p.start()
+    result = queue.get()
+    p.join()
+
+    seconds = sum(result["stages"].values())
+    network_seconds = result["stages"]["prefetch"] + result["stages"]["retry"]
+    requests = {k: server.counts[k] - counts_before[k] for k in server.counts}
+    n_requests = sum(requests.values())
+
+    return {
+        "ead": os.path.basename(ead_file_path),
+        "seconds": seconds,
+        "stages": result["stages"],
+        "requests": requests,
+        "requests_per_second": n_requests / network_seconds if network_seconds else 0,
+        "retries": result["requests"]["retries"],
+        "manifests": result["manifests"],
+        "manifests_per_second": result["manifests"] / seconds,
+        "peak_rss_kb": result["peak_rss_kb"],
+    }
+
+
+def main(
+    ead_file_paths,
+    latency=0.0,
+    jitter=0.0,
+    error_rate=0.0,
+    throttle_rate=0.0,
+    max_workers=8,
+    rate=None,
+    fast_json=False,
+    warm=False,
+):
+    server = standin.serve(
+        latency=latency,
+        jitter=jitter,
+        error_rate=error_rate,
+        throttle_rate=throttle_rate,
+        seed=0,
+    )
+
+    options = {"max_workers": max_workers, "rate": rate, "fast_json": fast_json}
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+
+    results = []
+    for ead_file_path in ead_file_paths:
+        with tempfile.TemporaryDirectory() as work_dir:
+            for cache in ("cold", "warm") if warm else ("cold",):
+                result = run(ead_file_path, work_dir, server, options, ctx, queue)
+                result["cache"] = cache
+                results.append(result)
+
+    server.shutdown()
+
+    print(
+        f"{'EAD':<12} {'cache':<5} {'parse':>7} {'prefetch':>8} {'build':>7} "
+        f"{'retry':>7} {'req/s':>7} {'manifests':>9} {'man/s':>7} {'peak RSS KB':>11}"
+    )
+    for r in results:
+        s = r["stages"]
+        print(
+            f"{r['ead']:<12} {r['cache']:<5} {s['parse']:>7.2f} {s['prefetch']:>8.2f} "
+            f"{s['build']:>7.2f} {s['retry']:>7.2f} {r['requests_per_second']:>7.0f} "
+            f"{r['manifests']:>9} {r['manifests_per_second']:>7.1f} "
+            f"{r['peak_rss_kb']:>11}"
+        )
+
+    return {
+        "options": {
+            "latency": latency,
+            "jitter": jitter,
+            "error_rate": error_rate,
+            "throttle_rate": throttle_rate,
+            **options,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("ead_files", nargs="*")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument(
+        "--rate", type=float, help="Requests per second (no limit by default)"
+    )
+    parser.add_argument("--fast-json", action="store_true")
+    parser.add_argument(
+        "--warm", action="store_true", help="Also build with a warm cache"
+    )
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    ead_files = args.ead_files or [
+        os.path.join(NA_EAD_FOLDER, f) for f in sorted(os.listdir(NA_EAD_FOLDER))
+    ]
+
+    results = main(
+        ead_files,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        max_workers=args.max_workers,
+        rate=args.rate,
+        fast_json=args.fast_json,
+        warm=args.warm,
+    )
+
+    if args.json:
+        with open(args.json, "w") as outfile:
+            json.dump(results, outfile, indent=2)
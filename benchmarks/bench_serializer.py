@@ -0,0 +1,150 @@
+"""
+Compare the iiif_prezi3 models with the lightweight `iiif_json` emitter.
+
+Builds synthetic manifests (with ranges, metadata and placeholder
+canvases) and a collection of them with both, checks that the output
+is identical when serialized with an indentation of 2, and reports the
+time needed to build and serialize them.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.bench_serializer [--manifests 200] [--canvases 20]
+"""
+
+import argparse
+import json
+import time
+
+import iiif_prezi3
+
+import iiif_json
+import make_iiif_manifests
+
+BASE_URL = "https://example.org/maps/"
+
+
+def synthetic_canvases(manifest_id: str, n: int) -> list[dict]:
+    canvases = []
+
+    for k in range(1, n + 1):
+        f = make_iiif_manifests.File(
+            code=f"{k}",
+            title=f"Kaart van het eiland Ceylon, blad {k}",
+            uri=f"http://hdl.handle.net/10648/{k:08d}",
+            date="1700/1799",
+            metsid="",
+        )
+        service = f"https://service.archief.nl/iipsrv?IIIF=/{k:032x}.jp2"
+
+        canvases.append(
+            {
+                "id": f"{manifest_id}/canvas/p{k}",
+                "label": f"NL-HaNA_4.VEL_{k:04d}",
+                "anno_id": f"{manifest_id}/canvas/p{k}/anno",
+                "anno_page_id": f"{manifest_id}/canvas/p{k}/annotationpage",
+                "metadata": make_iiif_manifests.file_metadata(f),
+                # Every tenth canvas is a placeholder
+                "info": None
+                if k % 10 == 0
+                else {
+                    "@id": service,
+                    "profile": ["http://iiif.io/api/image/2/level1.json", {}],
+                    "width": 4000 + k,
+                    "height": 3000 + k,
+                },
+                "range_id": f"{manifest_id}/range/r{(k - 1) // 5 + 1}",
+                "range_label": f"{(k - 1) // 5 + 1} - Blad",
+            }
+        )
+
+    return canvases
+
+
+def build_prezi3(manifests):
+    collection = iiif_prezi3.Collection(id=BASE_URL + "collection.json", label="Test")
+    texts = []
+
+    for manifest_id, canvases in manifests:
+        manifest = make_iiif_manifests.make_manifest(
+            manifest_id,
+            "Test manifest",
+            make_iiif_manifests.file_metadata(
+                make_iiif_manifests.File(
+                    code="1", title="Test", uri="", date="", metsid=""
+                )
+            ),
+            "https://creativecommons.org/publicdomain/mark/1.0/",
+            canvases,
+        )
+        texts.append(manifest.json(indent=2))
+        collection.add_item(manifest)
+
+    texts.append(collection.json(indent=2))
+
+    return texts
+
+
+def build_iiif_json(manifests, indent=None):
+    items = []
+    texts = []
+
+    for manifest_id, canvases in manifests:
+        manifest = iiif_json.manifest(
+            manifest_id,
+            "Test manifest",
+            make_iiif_manifests.file_metadata(
+                make_iiif_manifests.File(
+                    code="1", title="Test", uri="", date="", metsid=""
+                )
+            ),
+            "https://creativecommons.org/publicdomain/mark/1.0/",
+            canvases,
+        )
+        texts.append(iiif_json.dumps(manifest, indent=indent).decode("utf-8"))
+        items.append(manifest)
+
+    collection = iiif_json.collection(BASE_URL + "collection.json", "Test", items)
+    texts.append(iiif_json.dumps(collection, indent=indent).decode("utf-8"))
+
+    return texts
+
+
+def main(n_manifests=200, n_canvases=20):
+    manifests = []
+    for m in range(n_manifests):
+        manifest_id = f"{BASE_URL}{m}.json"
+        manifests.append((manifest_id, synthetic_canvases(manifest_id, n_canvases)))
+
+    # Parity
+    if build_prezi3(manifests) != build_iiif_json(manifests, indent=2):
+        raise AssertionError("iiif_json output differs from iiif_prezi3 output")
+
+    results = {}
+    for name, build in (
+        ("iiif_prezi3 (indent=2)", build_prezi3),
+        ("iiif_json (indent=2)", lambda m: build_iiif_json(m, indent=2)),
+        ("iiif_json (compact)", build_iiif_json),
+    ):
+        start = time.perf_counter()
+        texts = build(manifests)
+        seconds = time.perf_counter() - start
+
+        results[name] = {
+            "seconds": seconds,
+            "manifests_per_second": n_manifests / seconds,
+            "bytes": sum(len(t.encode("utf-8")) for t in texts),
+        }
+
+    print(f"{n_manifests} manifests of {n_canvases} canvases, output identical")
+    print(json.dumps(results, indent=2))
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--manifests", type=int, default=200)
+    parser.add_argument("--canvases", type=int, default=20)
+    args = parser.parse_args()
+
+    main(args.manifests, args.canvases)
@@ -0,0 +1,127 @@
+"""
+Latency of the on-demand manifest server, cold and hot.
+
+Starts `manifest_server.ManifestServer` for an EAD file against the
+local stand-in (`benchmarks.standin`), with empty caches, and requests
+every collection and manifest three times: cold (made on request, with
+the METS files and image information fetched from the stand-in), hot
+(from the LRU cache) and revalidated with If-None-Match (304).
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.bench_server [--latency 0.02] [--cache-mb 256]
+        [--json results.json] [ead file]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import make_iiif_manifests as m
+from benchmarks import standin
+from cache import FileCache, ImageInfoCache
+from manifest_server import ManifestServer
+
+DEFAULT_EAD = "data/NA/ead/4.AKF.xml"
+
+
+def request(url: str, etag: str = "") -> tuple[int, str, float]:
+    """GET a URL, and return the status, ETag and latency in seconds."""
+    headers = {"If-None-Match": etag} if etag else {}
+
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as r:
+            r.read()
+            status, etag = r.status, r.headers["ETag"]
+    except urllib.error.HTTPError as e:
+        status, etag = e.code, e.headers["ETag"] or ""
+
+    return status, etag, time.perf_counter() - start
+
+
+def summarize(latencies: list[float]) -> dict:
+    latencies = sorted(latencies)
+
+    return {
+        "requests": len(latencies),
+        "median_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+def main(ead_file_path=DEFAULT_EAD, latency=0.0, cache_mb=256):
+    standin_server = standin.serve(latency=latency, seed=0)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        server = ManifestServer(
+            [ead_file_path],
+            port=0,
+            max_bytes=cache_mb * 2**20,
+            mets_url=standin_server.mets_url,
+            cache=FileCache(os.path.join(work_dir, "cache")),
+            image_info=ImageInfoCache(os.path.join(work_dir, "image_info.sqlite")),
+            requester=m.make_requester(rate=None),
+        ).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+        # Manifests first, so that the collections do not fetch the METS files
+        filenames = sorted(
+            server.routes, key=lambda f: server.routes[f][0] != "manifest"
+        )
+
+        results = {}
+        etags = {}  # of the hot run
+        for run in ("cold", "hot", "revalidate"):
+            latencies = []
+            statuses = {}
+
+            for filename in filenames:
+                if run == "revalidate":
+                    status, _, seconds = request(url + filename, etags[filename])
+                else:
+                    status, etags[filename], seconds = request(url + filename)
+                latencies.append(seconds)
+                statuses[status] = statuses.get(status, 0) + 1
+
+            results[run] = summarize(latencies) | {"statuses": statuses}
+
+        results["cache"] = server.documents.stats()
+
+        server.shutdown()
+
+    standin_server.shutdown()
+
+    print(
+        f"{'run':<11} {'requests':>8} {'median ms':>10} {'p95 ms':>8} "
+        f"{'max ms':>8}  statuses"
+    )
+    for run in ("cold", "hot", "revalidate"):
+        r = results[run]
+        print(
+            f"{run:<11} {r['requests']:>8} {r['median_ms']:>10.2f} {r['p95_ms']:>8.2f} "
+            f"{r['max_ms']:>8.2f}  {r['statuses']}"
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("ead_file", nargs="?", default=DEFAULT_EAD)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--cache-mb", type=int, default=256)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = main(args.ead_file, latency=args.latency, cache_mb=args.cache_mb)
+
+    if args.json:
+        with open(args.json, "w") as outfile:
+            json.dump(results, outfile, indent=2)
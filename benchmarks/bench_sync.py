@@ -0,0 +1,167 @@
+"""
+Time of a differential publish compared with copying the whole tree.
+
+Writes a synthetic tree of collections and manifests, publishes it with
+`sync.py` to the local HTTP PUT stand-in (`benchmarks.upload_standin`),
+and then publishes it again: unchanged, and after changing, adding and
+removing some manifests (and their collections). A full copy of the
+tree (every file PUT, in parallel) is the reference.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.bench_sync [--manifests 5000] [--changed 50]
+        [--latency 0.005] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import upload_standin
+from sync import HTTPTarget, INVENTORY_FILENAME, make_inventory, sync
+
+BASE_URL = "https://example.org/iiif/"
+
+
+def manifest(path: str, n: int, version: int = 0) -> dict:
+    return {
+        "@context": "http://iiif.io/api/presentation/3/context.json",
+        "id": BASE_URL + path,
+        "type": "Manifest",
+        "label": {"en": [f"{n} - Kaart van Ceylon, blad {n} (versie {version})"]},
+        "items": [
+            {
+                "id": f"{BASE_URL}{path}/canvas/p{k}",
+                "type": "Canvas",
+                "height": 4000,
+                "width": 6000,
+            }
+            for k in range(1, 4)
+        ],
+    }
+
+
+def collection(path: str, items: list[str]) -> dict:
+    return {
+        "@context": "http://iiif.io/api/presentation/3/context.json",
+        "id": BASE_URL + path,
+        "type": "Collection",
+        "label": {"en": [path]},
+        "items": [{"id": BASE_URL + p, "type": "Manifest"} for p in items],
+    }
+
+
+def write_tree(folder: str, manifests: dict[str, int]) -> None:
+    """Write the manifests (path -> version) and their collections."""
+    series = {}
+    for path in manifests:
+        series.setdefault(path.rsplit("/", 1)[0], []).append(path)
+
+    for path, version in manifests.items():
+        n = int(os.path.basename(path).removesuffix(".json"))
+        write_json(folder, path, manifest(path, n, version))
+    for s, items in series.items():
+        write_json(folder, f"{s}.json", collection(f"{s}.json", items))
+    write_json(
+        folder, "BENCH.json", collection("BENCH.json", [f"{s}.json" for s in series])
+    )
+
+
+def write_json(folder: str, path: str, document: dict) -> None:
+    path = os.path.join(folder, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "w") as outfile:
+        json.dump(document, outfile, indent=2)
+
+
+def full_copy(folder: str, target: HTTPTarget, workers: int) -> None:
+    def put(path):
+        with open(os.path.join(folder, path), "rb") as infile:
+            target.put(path, infile.read())
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(put, make_inventory(folder)))
+
+
+def main(n_manifests=5000, n_changed=50, latency=0.005, workers=8):
+    server = upload_standin.serve(latency=latency)
+    url = server.base_url
+
+    manifests = {f"BENCH/{k // 100}/{k}.json": 0 for k in range(n_manifests)}
+    results = {}
+
+    def measure(name, func):
+        before = dict(server.counts)
+        start = time.perf_counter()
+        totals = func()
+        results[name] = {
+            "seconds": time.perf_counter() - start,
+            "requests": sum(
+                server.counts[m] - before[m] for m in ("GET", "PUT", "DELETE")
+            ),
+            "bytes": server.counts["received"] - before["received"],
+        } | (totals or {})
+
+    with tempfile.TemporaryDirectory() as folder:
+        write_tree(folder, manifests)
+
+        copy_target = HTTPTarget(url + "copy/", workers)
+        measure("full copy", lambda: full_copy(folder, copy_target, workers))
+
+        target = HTTPTarget(url + "sync/", workers)
+        measure("first sync", lambda: sync(folder, target, max_workers=workers))
+        measure("unchanged", lambda: sync(folder, target, max_workers=workers))
+
+        # Change, add and remove some manifests, as a rebuild would
+        paths = list(manifests)
+        for path in paths[: n_changed // 2]:
+            manifests[path] += 1
+        for path in paths[-(n_changed // 4) :]:
+            del manifests[path]
+            os.remove(os.path.join(folder, path))
+        for k in range(n_manifests, n_manifests + n_changed // 4):
+            manifests[f"BENCH/{k // 100}/{k}.json"] = 0
+        write_tree(folder, manifests)
+
+        measure("changed", lambda: sync(folder, target, max_workers=workers))
+
+        # The target is the same as the folder
+        published = {
+            p.removeprefix("sync/"): data
+            for p, data in server.files.items()
+            if p.startswith("sync/") and p != f"sync/{INVENTORY_FILENAME}"
+        }
+        assert sorted(published) == sorted(make_inventory(folder))
+
+    server.shutdown()
+
+    print(f"{'run':<11} {'seconds':>8} {'requests':>9} {'bytes':>12}")
+    for name, r in results.items():
+        print(f"{name:<11} {r['seconds']:>8.2f} {r['requests']:>9} {r['bytes']:>12,}")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--manifests", type=int, default=5000)
+    parser.add_argument("--changed", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = main(
+        args.manifests,
+        n_changed=args.changed,
+        latency=args.latency,
+        workers=args.workers,
+    )
+
+    if args.json:
+        with open(args.json, "w") as outfile:
+            json.dump(results, outfile, indent=2)
@@ -0,0 +1,174 @@
+"""
+Local stand-in for the GAF METS API and the IIIF image server.
+
+Serves the synthetic METS documents and info.json files of
+`benchmarks.synthetic` with a configurable latency and rate of errors
+(500/503) and throttled responses (429), so that the manifest pipeline
+can be run without service.archief.nl.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.standin [--port 8765] [--latency 0.05]
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks import synthetic
+
+METS_PATH = "/gaf/api/mets/v1/"
+IIIF_PATH = "/iipsrv?IIIF=/"
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server with the behaviour of the stand-in.
+
+    Attributes:
+        counts (dict[str, int]): Number of requests per kind ("mets",
+        "info", "error", "throttled" and "not_found").
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        """
+        Args:
+            port (int, optional): Port to listen on. Defaults to 0 (any
+            free port).
+            latency (float, optional): Delay of every response in
+            seconds. Defaults to 0.
+            jitter (float, optional): Random extra delay of up to this
+            many seconds. Defaults to 0.
+            error_rate (float, optional): Fraction of requests that fail
+            with a 500 or 503 error. Defaults to 0.
+            throttle_rate (float, optional): Fraction of requests that are
+            throttled with a 429 response. Defaults to 0.
+            seed (int, optional): Seed of the random errors and delays.
+        """
+        super().__init__(("127.0.0.1", port), StandInHandler)
+
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"mets": 0, "info": 0, "error": 0, "throttled": 0, "not_found": 0}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def mets_url(self) -> str:
+        """Base URL of the METS API, for the `mets_url` of `main`."""
+        return self.base_url + METS_PATH
+
+    def count(self, kind: str) -> None:
+        with self.lock:
+            self.counts[kind] += 1
+
+    def start(self) -> "StandInServer":
+        """Serve in a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+        return self
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status: int, body: bytes = b"", content_type: str = "", headers={}):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+
+        with server.lock:
+            delay = server.latency + server.random.uniform(0, server.jitter)
+            draw = server.random.random()
+
+        time.sleep(delay)
+
+        if draw < server.throttle_rate:
+            server.count("throttled")
+            return self.send(429, headers={"Retry-After": "1"})
+
+        if draw < server.throttle_rate + server.error_rate:
+            server.count("error")
+            return self.send(server.random.choice((500, 503)))
+
+        if self.path.startswith(METS_PATH):
+            server.count("mets")
+            metsid = self.path[len(METS_PATH) :]
+            body = synthetic.mets_xml(metsid, server.base_url)
+
+            return self.send(200, body, "text/xml")
+
+        if self.path.startswith(IIIF_PATH) and self.path.endswith("/info.json"):
+            server.count("info")
+            identifier = self.path[len(IIIF_PATH) : -len("/info.json")]
+            info = synthetic.image_info(identifier, server.base_url)
+
+            return self.send(200, json.dumps(info).encode("utf-8"), "application/json")
+
+        server.count("not_found")
+        self.send(404)
+
+
+def serve(**kwargs) -> StandInServer:
+    """
+    Start a stand-in server in a background thread.
+
+    Args:
+        **kwargs: See `StandInServer`.
+
+    Returns:
+        StandInServer: The running server.
+    """
+    return StandInServer(**kwargs).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StandInServer(
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+    )
+    print("Serving METS at", server.mets_url)
+    server.serve_forever()
@@ -0,0 +1,87 @@
+"""
+Synthetic METS documents and IIIF image information for benchmarks.
+
+The documents are derived from a hash of their identifier, so that
+every run (and every process) sees the same data.
+"""
+
+import hashlib
+
+
+def _digest(s: str) -> str:
+    return hashlib.md5(s.encode("utf-8")).hexdigest()
+
+
+def n_scans(metsid: str, maximum: int = 4) -> int:
+    """Number of scans (1 to maximum) of a synthetic METS document."""
+    return int(_digest(metsid), 16) % maximum + 1
+
+
+def mets_xml(metsid: str, iip_base_url: str, n: int | None = None) -> bytes:
+    """
+    Make a METS document in the structure of the GAF METS API.
+
+    Args:
+        metsid (str): METS identifier.
+        iip_base_url (str): Base URL of the image server (without /iip/).
+        n (int, optional): Number of scans. Defaults to `n_scans(metsid)`.
+
+    Returns:
+        bytes: The METS document.
+    """
+    if n is None:
+        n = n_scans(metsid)
+
+    files = []
+    divs = []
+    for k in range(n):
+        uuid = _digest(f"{metsid}{k}")
+        file_id = f"F{uuid[:12]}{k}"
+
+        files.append(
+            f'<mets:file ID="{file_id}IIP" MIMETYPE="image/jp2">'
+            f'<mets:FLocat LOCTYPE="URL" xlink:href="{iip_base_url}/iip/{uuid}.jp2"/>'
+            "</mets:file>"
+        )
+        divs.append(
+            f'<mets:div ID="{file_id}" ORDER="{k + 1}" '
+            f'LABEL="NL-HaNA/4.VEL/{metsid}_{k:04d}.tif"/>'
+        )
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<mets:mets xmlns:mets="http://www.loc.gov/METS/" '
+        'xmlns:xlink="http://www.w3.org/1999/xlink">'
+        '<mets:fileSec><mets:fileGrp USE="DISPLAY">'
+        + "".join(files)
+        + "</mets:fileGrp></mets:fileSec>"
+        '<mets:structMap><mets:div TYPE="physical">'
+        + "".join(divs)
+        + "</mets:div></mets:structMap></mets:mets>"
+    ).encode("utf-8")
+
+
+def image_info(identifier: str, base_url: str) -> dict:
+    """
+    Make the info.json (IIIF Image API 2) of a synthetic image.
+
+    Args:
+        identifier (str): Identifier of the image (e.g. "<uuid>.jp2").
+        base_url (str): Base URL of the image server.
+
+    Returns:
+        dict: The image information.
+    """
+    h = int(_digest(identifier), 16)
+
+    return {
+        "@context": "http://iiif.io/api/image/2/context.json",
+        "@id": f"{base_url}/iipsrv?IIIF=/{identifier}",
+        "protocol": "http://iiif.io/api/image",
+        "width": 1000 + h % 5000,
+        "height": 1000 + h % 3000,
+        "profile": [
+            "http://iiif.io/api/image/2/level1.json",
+            {"formats": ["jpg"], "qualities": ["native", "color", "gray"]},
+        ],
+    }
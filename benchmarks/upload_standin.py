@@ -0,0 +1,133 @@
+"""
+Local stand-in for a hosting target that accepts HTTP PUT and DELETE.
+
+Keeps the uploaded files in memory and serves them with GET, with a
+configurable latency per request, so that `sync.py` can be tried and
+measured without a web server.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.upload_standin [--port 8766] [--latency 0.02]
+    python sync.py maps/ http://127.0.0.1:8766/maps/
+"""
+
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+
+class UploadServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server that stores what is PUT.
+
+    Attributes:
+        files (dict[str, bytes]): The uploaded files, by path.
+        counts (dict[str, int]): Number of requests per method ("GET",
+        "PUT" and "DELETE") and the number of bytes "received".
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.0):
+        """
+        Args:
+            port (int, optional): Port to listen on. Defaults to 0 (any
+            free port).
+            latency (float, optional): Delay of every response in
+            seconds. Defaults to 0.
+        """
+        super().__init__(("127.0.0.1", port), UploadHandler)
+
+        self.latency = latency
+
+        self.lock = threading.Lock()
+        self.files = {}
+        self.counts = {"GET": 0, "PUT": 0, "DELETE": 0, "received": 0}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def count(self, kind: str, n: int = 1) -> None:
+        with self.lock:
+            self.counts[kind] += n
+
+    def start(self) -> "UploadServer":
+        """Serve in a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+        return self
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status: int, body: bytes = b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self):
+        self.server.count(self.command)
+        time.sleep(self.server.latency)
+
+        return unquote(self.path.split("?")[0]).lstrip("/")
+
+    def do_GET(self):
+        path = self.handle_request()
+
+        data = self.server.files.get(path)
+        if data is None:
+            return self.send(404)
+
+        self.send(200, data)
+
+    def do_PUT(self):
+        path = self.handle_request()
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+
+        with self.server.lock:
+            created = path not in self.server.files
+            self.server.files[path] = data
+        self.server.count("received", len(data))
+
+        self.send(201 if created else 204)
+
+    def do_DELETE(self):
+        path = self.handle_request()
+
+        with self.server.lock:
+            data = self.server.files.pop(path, None)
+
+        self.send(404 if data is None else 204)
+
+
+def serve(**kwargs) -> UploadServer:
+    """
+    Start an upload stand-in in a background thread.
+
+    Args:
+        **kwargs: See `UploadServer`.
+
+    Returns:
+        UploadServer: The running server.
+    """
+    return UploadServer(**kwargs).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = UploadServer(port=args.port, latency=args.latency)
+    print("Accepting uploads at", server.base_url)
+    server.serve_forever()
@@ -0,0 +1,545 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class FileCache:
+    """
+    Sharded on-disk cache for documents such as METS files.
+
+    Every entry is stored in its own file in a subfolder named after
+    the first characters of the hash of its key (e.g. `ab/<key>.xml`),
+    so that a lookup is a single file open instead of a listing of
+    the whole cache folder. Writes go to a temporary file that is
+    atomically moved into place, which makes it safe for several
+    threads or processes to use the same cache at once.
+
+    Files from the old flat layout (`<path>/<key>.xml`) are still
+    read, and can be moved into the sharded layout with `migrate`.
+    """
+
+    def __init__(
+        self,
+        path: str = "data/cache/",
+        suffix: str = ".xml",
+        compress: bool = False,
+        shard_length: int = 2,
+    ):
+        """
+        Args:
+            path (str, optional): Root folder of the cache. Defaults to
+            "data/cache/".
+            suffix (str, optional): File extension of the cached
+            documents. Defaults to ".xml".
+            compress (bool, optional): Store new entries gzip compressed.
+            Defaults to False.
+            shard_length (int, optional): Number of hash characters used
+            for the shard folder name. Defaults to 2 (256 folders).
+        """
+        self.path = path
+        self.suffix = suffix
+        self.compress = compress
+        self.shard_length = shard_length
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def _shard(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+        return os.path.join(self.path, digest[: self.shard_length])
+
+    def _paths(self, key: str) -> list[str]:
+        """Candidate file paths for a key, the preferred one first."""
+        shard = self._shard(key)
+        plain = os.path.join(shard, key + self.suffix)
+        compressed = plain + ".gz"
+
+        if self.compress:
+            paths = [compressed, plain]
+        else:
+            paths = [plain, compressed]
+
+        # Flat layout of earlier versions
+        paths.append(os.path.join(self.path, key + self.suffix))
+
+        return paths
+
+    def get(self, key: str) -> bytes | None:
+        """
+        Get a document from the cache.
+
+        Args:
+            key (str): Key of the document (e.g. a METS id).
+
+        Returns:
+            bytes | None: The document, or None if it is not cached.
+        """
+        for path in self._paths(key):
+            try:
+                with open(path, "rb") as infile:
+                    data = infile.read()
+            except FileNotFoundError:
+                continue
+
+            if path.endswith(".gz"):
+                data = gzip.decompress(data)
+
+            with self._lock:
+                self.hits += 1
+                self.bytes_read += len(data)
+
+            return data
+
+        with self._lock:
+            self.misses += 1
+
+        return None
+
+    def set(self, key: str, data: bytes) -> None:
+        """
+        Atomically store a document in the cache.
+
+        Args:
+            key (str): Key of the document (e.g. a METS id).
+            data (bytes): Document to store.
+        """
+        path = self._paths(key)[0]
+        shard = os.path.dirname(path)
+        os.makedirs(shard, exist_ok=True)
+
+        content = gzip.compress(data) if self.compress else data
+
+        fd, tmp_path = tempfile.mkstemp(dir=shard, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as outfile:
+                outfile.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            self.bytes_written += len(content)
+
+    def __contains__(self, key: str) -> bool:
+        return any(os.path.exists(path) for path in self._paths(key))
+
+    def migrate(self) -> int:
+        """
+        Move documents from the flat layout into the sharded layout.
+
+        Returns:
+            int: Number of moved documents.
+        """
+        moved = 0
+
+        for entry in os.scandir(self.path):
+            if not entry.is_file() or not entry.name.endswith(self.suffix):
+                continue
+
+            key = entry.name[: -len(self.suffix)]
+
+            with open(entry.path, "rb") as infile:
+                self.set(key, infile.read())
+            os.unlink(entry.path)
+
+            moved += 1
+
+        return moved
+
+    def stats(self) -> dict[str, int]:
+        """
+        Statistics of the cache usage since it was created.
+
+        Returns:
+            dict[str, int]: Number of hits and misses, and the number of
+            bytes read from and written to disk.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes_read": self.bytes_read,
+                "bytes_written": self.bytes_written,
+            }
+
+
+class LRUCache:
+    """
+    Bounded in-memory cache of documents, least recently used first out.
+
+    The cache holds at most `max_bytes` of documents. Documents that
+    are evicted can be spilled to a FileCache, from which they are
+    read back (and kept in memory again) on their next use.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 2**20, spill: FileCache | None = None):
+        """
+        Args:
+            max_bytes (int, optional): Maximum total size of the documents
+            in memory. Defaults to 256 MiB.
+            spill (FileCache, optional): Cache for evicted documents, or
+            None to drop them. Defaults to None.
+        """
+        self.max_bytes = max_bytes
+        self.spill = spill
+
+        self._lock = threading.Lock()
+        self._documents = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.spill_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> bytes | None:
+        """
+        Get a document, from memory or else from the spill cache.
+
+        Args:
+            key (str): Key of the document.
+
+        Returns:
+            bytes | None: The document, or None if it is not cached.
+        """
+        with self._lock:
+            data = self._documents.get(key)
+            if data is not None:
+                self._documents.move_to_end(key)
+                self.hits += 1
+                return data
+
+        if self.spill is not None:
+            data = self.spill.get(key)
+            if data is not None:
+                with self._lock:
+                    self.spill_hits += 1
+                self.set(key, data)
+                return data
+
+        with self._lock:
+            self.misses += 1
+
+        return None
+
+    def set(self, key: str, data: bytes) -> None:
+        """
+        Store a document, evicting the least recently used ones if needed.
+
+        Args:
+            key (str): Key of the document.
+            data (bytes): The document.
+        """
+        evicted = []
+
+        with self._lock:
+            previous = self._documents.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+
+            self._documents[key] = data
+            self.bytes += len(data)
+
+            # Always keep the newest document, even if it is too large
+            while self.bytes > self.max_bytes and len(self._documents) > 1:
+                evicted_key, evicted_data = self._documents.popitem(last=False)
+                self.bytes -= len(evicted_data)
+                self.evictions += 1
+                evicted.append((evicted_key, evicted_data))
+
+        if self.spill is not None:
+            for evicted_key, evicted_data in evicted:
+                if evicted_key not in self.spill:
+                    self.spill.set(evicted_key, evicted_data)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Statistics of the cache usage since it was created.
+
+        Returns:
+            dict[str, int]: Number of documents and bytes in memory, and
+            the number of hits (in memory and spilled), misses and
+            evictions.
+        """
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "spill_hits": self.spill_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class KeyValueStore:
+    """
+    Persistent key-value store for JSON values, backed by SQLite.
+
+    SQLite takes care of locking, so that the store can be shared
+    between threads and processes.
+    """
+
+    table = "store"
+    columns = ("key", "value")
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Path of the SQLite database.
+        """
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._connection = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # Connect lazily, so that creating a store does not touch the disk
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            self._connection = sqlite3.connect(
+                self.path,
+                timeout=30,
+                check_same_thread=False,
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                f"({self.columns[0]} TEXT PRIMARY KEY, {self.columns[1]} TEXT NOT NULL)"
+            )
+
+        return self._connection
+
+    def get(self, key: str):
+        """
+        Get a value from the store.
+
+        Args:
+            key (str): Key of the value.
+
+        Returns:
+            The value, or None if the key is not in the store.
+        """
+        with self._lock:
+            row = self.connection.execute(
+                f"SELECT {self.columns[1]} FROM {self.table} "
+                f"WHERE {self.columns[0]} = ?",
+                (key,),
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def set(self, key: str, value) -> None:
+        """
+        Store a value.
+
+        Args:
+            key (str): Key of the value.
+            value: Value that can be serialized to JSON.
+        """
+        with self._lock:
+            with self.connection:
+                self.connection.execute(
+                    f"INSERT OR REPLACE INTO {self.table} "
+                    f"({self.columns[0]}, {self.columns[1]}) VALUES (?, ?)",
+                    (key, json.dumps(value)),
+                )
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            row = self.connection.execute(
+                f"SELECT 1 FROM {self.table} WHERE {self.columns[0]} = ?", (key,)
+            ).fetchone()
+
+        return row is not None
+
+    def stats(self) -> dict[str, int]:
+        """
+        Statistics of the store usage since it was created.
+
+        Returns:
+            dict[str, int]: Number of hits and misses.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+class ImageInfoCache(KeyValueStore):
+    """
+    Persistent cache of IIIF image information, keyed by service URL.
+
+    Only the fields that are needed to build a canvas are kept from
+    the info.json (id, type, profile, width and height).
+    """
+
+    table = "image_info"
+    columns = ("url", "info")
+
+    FIELDS = ("@id", "id", "type", "profile", "width", "height")
+
+    def __init__(self, path: str = "data/cache/image_info.sqlite"):
+        """
+        Args:
+            path (str, optional): Path of the SQLite database. Defaults
+            to "data/cache/image_info.sqlite".
+        """
+        super().__init__(path)
+
+    def set(self, url: str, info: dict) -> None:
+        """
+        Store the image information of an image service.
+
+        Args:
+            url (str): URL of the IIIF image service.
+            info (dict): The info.json of the service.
+        """
+        info = {k: v for k, v in info.items() if k in self.FIELDS}
+
+        super().set(url, info)
+
+
+class BuildState(KeyValueStore):
+    """
+    Hashes of the inputs of every written collection and manifest.
+
+    Keyed by the path of the written file, so that an incremental
+    build can skip files whose inputs did not change.
+    """
+
+    table = "build_state"
+
+    def __init__(self, path: str = "data/cache/build_state.sqlite"):
+        """
+        Args:
+            path (str, optional): Path of the SQLite database. Defaults
+            to "data/cache/build_state.sqlite".
+        """
+        super().__init__(path)
+
+
+def input_hash(*inputs) -> str:
+    """
+    Hash the inputs of a build step.
+
+    Args:
+        *inputs: Values that can be serialized to JSON.
+
+    Returns:
+        str: Hexadecimal SHA-256 digest.
+    """
+    data = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class InventoryIndex(KeyValueStore):
+    """
+    Index of the files in the EADs, by inventory number, handle and METS id.
+
+    Every file is stored under each of its identifiers, together with
+    the code of its fonds (`<identifier>\\t<fonds>`), since inventory
+    numbers are only unique within a fonds. The values are lists of
+    entries (an identifier can occur more than once in a fonds), see
+    `make_iiif_manifests.index_ead`. The hash of every indexed EAD file
+    is kept under `ead:<path>`, so that stale entries can be detected.
+    """
+
+    table = "inventory_index"
+
+    def __init__(self, path: str = "data/cache/inventory_index.sqlite"):
+        """
+        Args:
+            path (str, optional): Path of the SQLite database. Defaults
+            to "data/cache/inventory_index.sqlite".
+        """
+        super().__init__(path)
+
+    def add_fonds(
+        self,
+        fonds_code: str,
+        ead_file_path: str,
+        digest: str,
+        entries: list[dict],
+    ) -> None:
+        """
+        Replace the entries of a fonds in one transaction.
+
+        Args:
+            fonds_code (str): Code of the fonds.
+            ead_file_path (str): Path of the indexed EAD file.
+            digest (str): Hash of the indexed EAD file.
+            entries (list[dict]): Entries of the files, with their
+            "inventory", "handle" and "metsid".
+        """
+        rows = {}
+        for entry in entries:
+            for identifier in (entry["inventory"], entry["handle"], entry["metsid"]):
+                if identifier:
+                    rows.setdefault(f"{identifier}\t{fonds_code}", []).append(entry)
+
+        with self._lock:
+            with self.connection:
+                self.connection.execute(
+                    f"DELETE FROM {self.table} WHERE {self.columns[0]} LIKE ?",
+                    (f"%\t{fonds_code}",),
+                )
+                self.connection.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} "
+                    f"({self.columns[0]}, {self.columns[1]}) VALUES (?, ?)",
+                    [(k, json.dumps(v)) for k, v in rows.items()]
+                    + [(f"ead:{ead_file_path}", json.dumps(digest))],
+                )
+
+    def lookup(self, identifier: str, fonds_code: str = "") -> list[dict]:
+        """
+        Find the files with an inventory number, handle or METS id.
+
+        Args:
+            identifier (str): Inventory number, handle or METS id.
+            fonds_code (str, optional): Only look in this fonds. Defaults
+            to all fondses.
+
+        Returns:
+            list[dict]: Entries of the matching files.
+        """
+        if fonds_code:
+            query = f"{self.columns[0]} = ?"
+            args = (f"{identifier}\t{fonds_code}",)
+        else:
+            # Keys from "<identifier>\t" up to (not including) "<identifier>\n"
+            query = f"{self.columns[0]} >= ? AND {self.columns[0]} < ?"
+            args = (f"{identifier}\t", f"{identifier}\n")
+
+        with self._lock:
+            rows = self.connection.execute(
+                f"SELECT {self.columns[1]} FROM {self.table} WHERE {query} "
+                f"ORDER BY {self.columns[0]}",
+                args,
+            ).fetchall()
+
+            if rows:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return [entry for (value,) in rows for entry in json.loads(value)]
@@ -0,0 +1,199 @@
+"""
+IIIF Change Discovery 1.0 activity stream of the published files.
+
+Every publish run diffs the hashes of the files (see `publish.py`)
+against those of the previous run, and adds a Create, Update or Delete
+activity for every collection and manifest that was added, changed or
+removed. The activities are appended to an Activity Streams
+OrderedCollection in the `activity/` folder:
+
+    activity/all-changes.json  the collection, with the first and last page
+    activity/page-<n>.json     `PAGE_SIZE` activities per page, oldest first
+
+Earlier pages do not change when activities are added (only the last
+full page gets a `next` link), so a harvester can start at the last
+page and follow `prev` back to its last sync.
+See https://iiif.io/api/discovery/1.0/.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+CONTEXT = "http://iiif.io/api/discovery/1/context.json"
+
+ACTIVITY_FOLDER = "activity"
+COLLECTION_FILENAME = "all-changes.json"
+PAGE_SIZE = 500
+
+
+def document_type(document) -> str | None:
+    """
+    Get the type of a IIIF document, of Presentation 3.0 or 2.x.
+
+    Args:
+        document: The parsed JSON document.
+
+    Returns:
+        str | None: Its type without prefix (e.g. "Manifest" for a 2.x
+        "sc:Manifest"), or None if it is not a IIIF document.
+
+    >>> document_type({"@type": "sc:Collection"})
+    'Collection'
+    """
+    if not isinstance(document, dict):
+        return None
+
+    object_type = document.get("type") or document.get("@type")
+    if not isinstance(object_type, str):
+        return None
+
+    return object_type.rpartition(":")[2]
+
+
+def diff_hashes(previous: dict, hashes: dict) -> list[tuple[str, str, str]]:
+    """
+    Compare the hashes of two publish runs.
+
+    Args:
+        previous (dict): Entries of the previous run, by path.
+        hashes (dict): Entries of this run, by path.
+
+    Returns:
+        list[tuple[str, str, str]]: For every added, changed or removed
+        file, sorted by path: the activity ("Create", "Update" or
+        "Delete"), its path and its type (e.g. "Manifest"). Files that
+        are not IIIF documents are left out.
+    """
+    changes = []
+
+    for path in sorted(previous.keys() | hashes.keys()):
+        if path not in hashes:
+            activity, entry = "Delete", previous[path]
+        elif path not in previous:
+            activity, entry = "Create", hashes[path]
+        elif previous[path]["sha256"] != hashes[path]["sha256"]:
+            activity, entry = "Update", hashes[path]
+        else:
+            continue
+
+        # Entries of runs before the type was recorded are manifests
+        object_type = entry.get("type", "Manifest")
+        if object_type is None:
+            continue
+
+        changes.append((activity, path, object_type))
+
+    return changes
+
+
+def page_reference(base_url: str, n: int) -> dict:
+    return {
+        "id": f"{base_url}{ACTIVITY_FOLDER}/page-{n}.json",
+        "type": "OrderedCollectionPage",
+    }
+
+
+def write_json(path: str, document: dict) -> None:
+    """Replace a JSON file of the stream atomically."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+
+    with open(tmp_path, "w") as outfile:
+        json.dump(document, outfile, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def update_activity_stream(
+    folder: str,
+    base_url: str,
+    changes: list[tuple[str, str, str]],
+    end_time: datetime | None = None,
+    page_size: int = PAGE_SIZE,
+) -> int:
+    """
+    Append activities to the activity stream of a folder.
+
+    Args:
+        folder (str): Folder of the published files.
+        base_url (str): URL of the folder, so that the path of a file
+        appended to it is the id of its collection or manifest.
+        changes (list[tuple[str, str, str]]): Result of `diff_hashes`.
+        end_time (datetime, optional): Time of the changes. Defaults to
+        now.
+        page_size (int, optional): Number of activities per page.
+        Defaults to PAGE_SIZE.
+
+    Returns:
+        int: Number of activities in the stream.
+    """
+    activity_dir = os.path.join(folder, ACTIVITY_FOLDER)
+    collection_path = os.path.join(activity_dir, COLLECTION_FILENAME)
+    collection_id = f"{base_url}{ACTIVITY_FOLDER}/{COLLECTION_FILENAME}"
+
+    try:
+        with open(collection_path, "rb") as infile:
+            total = json.load(infile)["totalItems"]
+    except FileNotFoundError:
+        total = 0
+
+    if not changes:
+        return total
+
+    end_time = end_time or datetime.now(timezone.utc)
+    end_time = end_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+    activities = [
+        {
+            "type": activity,
+            "object": {"id": base_url + path, "type": object_type},
+            "endTime": end_time,
+        }
+        for activity, path, object_type in changes
+    ]
+
+    os.makedirs(activity_dir, exist_ok=True)
+
+    # Fill up the last page (or only link it to the next one, if it is
+    # full), then add new ones
+    n = max(total - 1, 0) // page_size
+    if total:
+        with open(os.path.join(activity_dir, f"page-{n}.json"), "rb") as infile:
+            items = json.load(infile)["orderedItems"]
+    else:
+        items = []
+
+    total += len(activities)
+    last = (total - 1) // page_size
+
+    while activities:
+        space = page_size - len(items)
+        items, activities = items + activities[:space], activities[space:]
+
+        page = {
+            "@context": CONTEXT,
+            "id": page_reference(base_url, n)["id"],
+            "type": "OrderedCollectionPage",
+            "partOf": {"id": collection_id, "type": "OrderedCollection"},
+        }
+        if n > 0:
+            page["prev"] = page_reference(base_url, n - 1)
+        if n < last:
+            page["next"] = page_reference(base_url, n + 1)
+        page["orderedItems"] = items
+
+        write_json(os.path.join(activity_dir, f"page-{n}.json"), page)
+
+        n, items = n + 1, []
+
+    write_json(
+        collection_path,
+        {
+            "@context": CONTEXT,
+            "id": collection_id,
+            "type": "OrderedCollection",
+            "totalItems": total,
+            "first": page_reference(base_url, 0),
+            "last": page_reference(base_url, last),
+        },
+    )
+
+    return total
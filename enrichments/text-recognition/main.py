@@ -1,6 +1,12 @@
 import os
 import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 import requests
+from urllib3.util import Retry
 
 from svgpathtools import svgstr2paths
 from PIL import Image
@@ -14,37 +20,203 @@ MINIMUM_WIDTH = 35
 MINIMUM_HEIGHT = 25
 # import pytesseract
 
+CACHE_FOLDER = "cache/http"
+WORKERS = 16  # requests at once
+TIMEOUT = 60
+
+
+class Crawler:
+    """
+    Fetch IIIF JSON documents concurrently, with an on-disk HTTP cache.
+
+    Every document is kept in the cache folder with its ETag and
+    Last-Modified headers, and revalidated with a conditional request,
+    so that a re-run only downloads the documents that changed.
+    """
+
+    def __init__(self, cache_folder: str = CACHE_FOLDER, workers: int = WORKERS):
+        """
+        Args:
+            cache_folder (str, optional): Folder of the cached documents.
+            Defaults to CACHE_FOLDER.
+            workers (int, optional): Number of requests at once. Defaults
+            to WORKERS.
+        """
+        self.cache_folder = cache_folder
+
+        retry = Retry(
+            total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)
+        )
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=workers, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.executor = ThreadPoolExecutor(workers)
+
+        self._lock = threading.Lock()
+        self.downloaded = 0
+        self.not_modified = 0
+
+    def cache_path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+        return os.path.join(self.cache_folder, key[:2], f"{key}.json")
+
+    def get(self, url: str) -> dict:
+        """
+        Fetch a JSON document, or take it from the cache if it did not change.
+
+        Args:
+            url (str): URL of the document.
+
+        Returns:
+            dict: The document.
+        """
+        path = self.cache_path(url)
+
+        try:
+            with open(path, "rb") as infile:
+                cached = json.load(infile)
+        except (FileNotFoundError, ValueError):
+            cached = None
+
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        r = self.session.get(url, headers=headers, timeout=TIMEOUT)
+
+        if r.status_code == 304 and cached:
+            with self._lock:
+                self.not_modified += 1
+            return cached["document"]
+
+        r.raise_for_status()
+        document = r.json()
+        with self._lock:
+            self.downloaded += 1
+
+        etag = r.headers.get("ETag")
+        last_modified = r.headers.get("Last-Modified")
+        if etag or last_modified:  # otherwise it cannot be revalidated
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            tmp_path = f"{path}.tmp-{threading.get_ident()}"
+            with open(tmp_path, "w") as outfile:
+                json.dump(
+                    {
+                        "url": url,
+                        "etag": etag,
+                        "last_modified": last_modified,
+                        "document": document,
+                    },
+                    outfile,
+                )
+            os.replace(tmp_path, path)
+
+        return document
+
+    def map(self, func, iterable):
+        """Like `map`, in the thread pool."""
+        return self.executor.map(func, iterable)
+
+    def close(self) -> None:
+        self.executor.shutdown()
+        self.session.close()
+
+
+def fetch(url, crawler=None):
+    """Fetch a JSON document with the crawler, or without cache."""
+    if crawler is not None:
+        return crawler.get(url)
+
+    r = requests.get(url, timeout=TIMEOUT)
+    r.raise_for_status()
+
+    return r.json()
+
+
+def parse_iiif_prezi(iiif_prezi_id, crawler=None):
+    """
+    Get the canvasses of a collection (recursively) or manifest.
+
+    The collections are fetched level by level and the manifests all
+    at once, in the thread pool of the crawler.
+
+    Args:
+        iiif_prezi_id (str): URL of the collection or manifest.
+        crawler (Crawler, optional): Crawler to fetch the documents
+        with. Defaults to a new one.
+
+    Returns:
+        list[dict]: The canvasses, see `parse_manifest`, in the order of
+        the collections.
+    """
+    if crawler is None:
+        crawler = Crawler()
+        try:
+            return parse_iiif_prezi(iiif_prezi_id, crawler)
+        finally:
+            crawler.close()
+
+    manifest_ids = collection_manifests(iiif_prezi_id, crawler)
+
+    canvasses = []
+    for manifest_canvasses in crawler.map(
+        partial(parse_manifest, crawler=crawler), manifest_ids
+    ):
+        canvasses += manifest_canvasses
+
+    return canvasses
+
 
-def parse_iiif_prezi(iiif_prezi_id):
+def collection_manifests(iiif_prezi_id, crawler, iiif_prezi=None):
+    """
+    The ids of the manifests in a collection (recursively), in order.
 
+    Args:
+        iiif_prezi_id (str): URL of the collection or manifest.
+        crawler (Crawler): Crawler to fetch the documents with.
+        iiif_prezi (dict, optional): The document, if it was fetched.
+
+    Returns:
+        list[str]: The manifest ids.
+    """
     print("Parsing: ", iiif_prezi_id)
 
-    canvasses = []
+    if iiif_prezi is None:
+        iiif_prezi = crawler.get(iiif_prezi_id)
 
-    r = requests.get(iiif_prezi_id)
-    iiif_prezi = r.json()
+    if iiif_prezi.get("type") == "Manifest":
+        return [iiif_prezi["id"]]
+    elif iiif_prezi.get("type") != "Collection":
+        return []
 
-    if iiif_prezi.get("type") == "Collection":
-        for i in iiif_prezi["items"]:
-            if i["type"] == "Collection":
-                canvasses += parse_iiif_prezi(i["id"], [])
-            elif i["type"] == "Manifest":
-                canvasses += parse_manifest(i["id"])
-    elif iiif_prezi.get("type") == "Manifest":
-        canvasses += parse_manifest(iiif_prezi["id"])
+    collection_ids = [i["id"] for i in iiif_prezi["items"] if i["type"] == "Collection"]
+    collections = dict(zip(collection_ids, crawler.map(crawler.get, collection_ids)))
 
-    return canvasses
+    manifest_ids = []
+    for i in iiif_prezi["items"]:
+        if i["type"] == "Collection":
+            manifest_ids += collection_manifests(i["id"], crawler, collections[i["id"]])
+        elif i["type"] == "Manifest":
+            manifest_ids.append(i["id"])
+
+    return manifest_ids
 
 
-def parse_manifest(manifest_id):
+def parse_manifest(manifest_id, crawler=None):
 
     print("Parsing: ", manifest_id)
 
-    r = requests.get(manifest_id)
-    manifest = r.json()
+    manifest = fetch(manifest_id, crawler)
 
     canvasses = []
-
     for i in manifest["items"]:
 
         if i["type"] == "Canvas":
@@ -71,7 +243,9 @@ def parse_manifest(manifest_id):
                 annotation_page_id = ap["id"]
 
                 if "mapkurator" in annotation_page_id:
-                    annotation2svg = parse_annotation_page(annotation_page_id)
+                    annotation2svg = parse_annotation_page(
+                        annotation_page_id, crawler
+                    )
 
                     canvas["annotations"] = annotation2svg
 
@@ -80,14 +254,13 @@ def parse_manifest(manifest_id):
     return canvasses
 
 
-def parse_annotation_page(annotation_page_id):
+def parse_annotation_page(annotation_page_id, crawler=None):
 
     print("Parsing: ", annotation_page_id)
 
     annotation2svg = dict()
 
-    r = requests.get(annotation_page_id)
-    annotation_page = r.json()
+    annotation_page = fetch(annotation_page_id, crawler)
 
     for annotation in annotation_page.get("items", []):
         if annotation["type"] == "Annotation":
@@ -162,12 +335,14 @@ if __name__ == "__main__":
     IMAGE_FOLDER = "/media/leon/HDE0069/GLOBALISE/maps/download/"
     SNIPPET_FOLDER = "snippets"
 
+    crawler = Crawler()
+
     for uri in [
         "https://data.globalise.huygens.knaw.nl/manifests/maps/4.VEL/A.json",
         "https://data.globalise.huygens.knaw.nl/manifests/maps/4.VEL/B.json",
         "https://data.globalise.huygens.knaw.nl/manifests/maps/4.VEL/C.json",
     ]:
-        canvasses = parse_iiif_prezi(uri)
+        canvasses = parse_iiif_prezi(uri, crawler)
 
         # with open("canvasses.json", "w") as f:
         #     json.dump(canvasses, f, indent=2)
@@ -183,3 +358,9 @@ if __name__ == "__main__":
 
             if annotations:
                 extract_snippets(image_uuid, annotations, SNIPPET_FOLDER)
+
+    crawler.close()
+    print(
+        f"{crawler.downloaded} documents downloaded, "
+        f"{crawler.not_modified} not modified"
+    )
@@ -0,0 +1,95 @@
+"""
+Read the IIIF files of a build, without dependencies.
+
+Shared by the build, `make_collection.py` and `sync.py`, so that the
+tools that only look at the written files do not import the build.
+"""
+
+import codecs
+import json
+import re
+
+# File names of the pages of a collection, see `page_collection` in
+# make_iiif_manifests.py
+PAGE_FILENAME = "page-{n}.json"
+PAGE_FILENAME_PATTERN = re.compile(r"page-\d+\.json")
+
+WHITESPACE = " \t\n\r"
+
+
+def read_header(
+    file_path: str, fields=("id", "type", "label"), chunk_size=4096
+) -> dict:
+    """
+    Read the first fields of a IIIF JSON document, without parsing the rest.
+
+    The document is read in chunks, and its top-level keys are decoded
+    one by one until all fields are found. Since `id`, `type` and
+    `label` come before the `items` of a collection or manifest, this
+    takes the same time for every document, however large.
+
+    Args:
+        file_path (str): Path of the JSON document.
+        fields (tuple, optional): Top-level keys to read. Defaults to
+        ("id", "type", "label").
+        chunk_size (int, optional): Number of bytes to read at a time.
+        Defaults to 4096.
+
+    Returns:
+        dict: The fields that were found.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    text = ""
+    with open(file_path, "rb") as infile:
+        while True:
+            chunk = infile.read(chunk_size)
+            text += utf8.decode(chunk, final=not chunk)
+
+            try:
+                return _decode_header(text, fields, decoder)
+            except (json.JSONDecodeError, IndexError):
+                if not chunk:
+                    raise  # not valid JSON
+
+                continue  # read more
+
+
+def _decode_header(text: str, fields, decoder: json.JSONDecoder) -> dict:
+    """Decode the top-level keys of a (partial) JSON object until all are found."""
+
+    def skip(pos):
+        while text[pos] in WHITESPACE:
+            pos += 1
+        return pos
+
+    header = {}
+
+    pos = skip(0)
+    if text[pos] != "{":
+        raise ValueError("Not a JSON object")
+    pos += 1
+
+    while len(header) < len(fields):
+        pos = skip(pos)
+        if text[pos] == "}":
+            break
+
+        key, pos = decoder.raw_decode(text, pos)
+        pos = skip(pos)
+        if text[pos] != ":":
+            raise json.JSONDecodeError("Expecting ':' delimiter", text, pos)
+
+        value, pos = decoder.raw_decode(text, skip(pos + 1))
+        if key in fields:
+            header[key] = value
+
+        # A value must be followed by a delimiter, otherwise it may be cut off
+        pos = skip(pos)
+        if text[pos] == ",":
+            pos += 1
+        elif text[pos] != "}":
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+
+    return header
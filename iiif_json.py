@@ -0,0 +1,219 @@
+"""
+Lightweight emitter for IIIF Presentation 3.0 JSON.
+
+Builds the same collections and manifests as `make_iiif_manifests`
+does with `iiif_prezi3`, but as plain dictionaries, without model
+construction and validation for every label, canvas and annotation.
+Serialized with an indentation of 2, the output is identical to that
+of `iiif_prezi3`.
+
+orjson is used for serialization if it is installed.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CONTEXT = "http://iiif.io/api/presentation/3/context.json"
+LANGUAGE = "en"
+
+
+def dumps(obj, indent: int | None = None) -> bytes:
+    """
+    Serialize IIIF JSON.
+
+    Args:
+        obj: Collection or manifest.
+        indent (int, optional): Indentation. Defaults to None (compact).
+
+    Returns:
+        bytes: UTF-8 encoded JSON.
+    """
+    if orjson and indent in (None, 2):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+
+    separators = None if indent else (",", ":")
+
+    return json.dumps(
+        obj, indent=indent, ensure_ascii=False, separators=separators
+    ).encode("utf-8")
+
+
+def language_map(value: str) -> dict:
+    return {LANGUAGE: [value]}
+
+
+def reference(id: str, label: str, type: str) -> dict:
+    """
+    Shallow reference to a manifest.
+
+    Args:
+        id (str): Id of the manifest.
+        label (str): Label of the manifest.
+        type (str): Type of the referenced resource.
+
+    Returns:
+        dict: The reference.
+    """
+    return {"id": id, "label": language_map(label), "type": type}
+
+
+def collection(id: str, label: str, items: list) -> dict:
+    """
+    Make a collection.
+
+    Manifests are added as a reference, sub-collections are embedded.
+
+    Args:
+        id (str): Id of the collection.
+        label (str): Label of the collection.
+        items (list): Manifests (or references) and sub-collections.
+
+    Returns:
+        dict: The collection.
+    """
+    collection_items = []
+
+    for item in items:
+        if item["type"] == "Manifest":
+            item = reference(item["id"], item["label"][LANGUAGE][0], "Manifest")
+        else:
+            item = {k: v for k, v in item.items() if k != "@context"}
+
+        collection_items.append(item)
+
+    return {
+        "@context": CONTEXT,
+        "id": id,
+        "type": "Collection",
+        "label": language_map(label),
+        "items": collection_items,
+    }
+
+
+def manifest(
+    id: str,
+    label: str,
+    metadata: list,
+    rights: str,
+    canvases,
+) -> dict | None:
+    """
+    Make a manifest.
+
+    Args:
+        id (str): Id of the manifest.
+        label (str): Label of the manifest.
+        metadata (list): Metadata of the manifest.
+        rights (str): License URI.
+        canvases (Iterable[dict]): Canvases as yielded by
+        `make_iiif_manifests.iter_canvases`.
+
+    Returns:
+        dict | None: The manifest, or None if it has no canvases.
+    """
+    items = []
+    structures = []
+
+    for c in canvases:
+        items.append(canvas(c))
+
+        if c["range_id"]:
+            if not structures or structures[-1]["id"] != c["range_id"]:
+                structures.append(
+                    {
+                        "id": c["range_id"],
+                        "type": "Range",
+                        "label": language_map(c["range_label"]),
+                        "items": [],
+                    }
+                )
+
+            structures[-1]["items"].append(
+                {"id": c["id"], "type": "Canvas", "items": []}
+            )
+
+    if not items:
+        return None
+
+    manifest = {
+        "@context": CONTEXT,
+        "id": id,
+        "type": "Manifest",
+        "label": language_map(label),
+        "metadata": metadata,
+        "rights": rights,
+        "items": items,
+    }
+
+    if structures:
+        manifest["structures"] = structures
+
+    return manifest
+
+
+def canvas(c: dict) -> dict:
+    """
+    Make a canvas, with the image of the canvas if it is available.
+
+    Args:
+        c (dict): Canvas as yielded by `make_iiif_manifests.iter_canvases`.
+
+    Returns:
+        dict: The canvas.
+    """
+    info = c["info"]
+
+    canvas = {"id": c["id"], "type": "Canvas", "label": language_map(c["label"])}
+
+    # Placeholder canvas (empty)
+    if info is None:
+        canvas["metadata"] = c["metadata"]
+        canvas["items"] = []
+
+        return canvas
+
+    if "type" not in info:
+        # IIIF Image API 2: the profile contains the URI plus extra features
+        profile = ""
+        for item in info["profile"]:
+            if isinstance(item, str):
+                profile = item
+                break
+
+        service = {"@id": info["@id"], "@type": "ImageService2", "profile": profile}
+        body_id = f'{info["@id"]}/full/full/0/default.jpg'
+    else:
+        service = {"id": info["id"], "type": info["type"], "profile": info["profile"]}
+        body_id = f'{info["id"]}/full/max/0/default.jpg'
+
+    canvas["height"] = info["height"]
+    canvas["width"] = info["width"]
+    canvas["metadata"] = c["metadata"]
+    canvas["items"] = [
+        {
+            "id": c["anno_page_id"],
+            "type": "AnnotationPage",
+            "items": [
+                {
+                    "id": c["anno_id"],
+                    "type": "Annotation",
+                    "motivation": "painting",
+                    "body": {
+                        "id": body_id,
+                        "type": "Image",
+                        "height": info["height"],
+                        "width": info["width"],
+                        "service": [service],
+                        "format": "image/jpeg",
+                    },
+                    "target": c["id"],
+                }
+            ],
+        }
+    ]
+
+    return canvas
@@ -0,0 +1,80 @@
+"""
+Emitter for IIIF Presentation 2.x JSON, for the manifests of Recogito.
+
+The manifests are laid out as `ManifestFactory` of the iiif-prezi
+package does. Both `make_iiif_manifests.write_manifests_v2` (from the
+build) and `annotation-pilot/make_manifest_v2.py` (from the 3.0 files)
+make them with these functions, so that their output is the same.
+"""
+
+CONTEXT = "http://iiif.io/api/presentation/2/context.json"
+IMAGE_CONTEXT = "http://iiif.io/api/image/2/context.json"
+IMAGE_PROFILE = "http://iiif.io/api/image/2/level2.json"
+
+
+def canvas(
+    id: str, label: str, metadata: dict, service_id: str, height: int, width: int
+) -> dict:
+    """
+    Make a canvas with one image.
+
+    Args:
+        id (str): Id of the canvas.
+        label (str): Label of the canvas.
+        metadata (dict): Metadata, by label.
+        service_id (str): Id of the image service.
+        height (int): Height of the image.
+        width (int): Width of the image.
+
+    Returns:
+        dict: The canvas.
+    """
+    return {
+        "@id": id,
+        "@type": "sc:Canvas",
+        "label": label,
+        "metadata": [{"label": k, "value": v} for k, v in metadata.items()],
+        "height": height,
+        "width": width,
+        "images": [
+            {
+                "@type": "oa:Annotation",
+                "motivation": "sc:painting",
+                "resource": {
+                    "@id": f"{service_id}/full/full/0/default.jpg",
+                    "@type": "dctypes:Image",
+                    "format": "image/jpeg",
+                    "height": height,
+                    "width": width,
+                    "service": {
+                        "@context": IMAGE_CONTEXT,
+                        "@id": service_id,
+                        "profile": IMAGE_PROFILE,
+                    },
+                },
+                "on": id,
+            }
+        ],
+    }
+
+
+def manifest(id: str, label: str, canvases: list) -> dict:
+    """
+    Make a manifest with one sequence.
+
+    Args:
+        id (str): Id of the manifest.
+        label (str): Label of the manifest.
+        canvases (list): Canvases of `canvas`.
+
+    Returns:
+        dict: The manifest.
+    """
+    return {
+        "@context": CONTEXT,
+        "@id": id,
+        "@type": "sc:Manifest",
+        "label": label,
+        "viewingDirection": "left-to-right",
+        "sequences": [{"@type": "sc:Sequence", "canvases": canvases}],
+    }
@@ -1,29 +1,76 @@
 import os
-import json
+from concurrent.futures import ThreadPoolExecutor
+
 import iiif_prezi3
 
+from iiif_files import PAGE_FILENAME_PATTERN, read_header
+
 iiif_prezi3.config.configs["helpers.auto_fields.AutoLang"].auto_lang = "en"
 
 PREFIX = "https://data.globalise.huygens.knaw.nl/manifests/maps/"
 
+# Files in the folder that are not collections or manifests
+SKIP_FILES = {"collection.json", "hashes.json"}
+
+
+def find_documents(folder: str, recursive: bool = False) -> list[str]:
+    """
+    Find the IIIF JSON documents in a folder.
+
+    Args:
+        folder (str): The folder.
+        recursive (bool, optional): Also look in its sub-folders. Defaults
+        to False.
+
+    Returns:
+        list[str]: Paths of the JSON files, sorted.
+    """
+    paths = []
+
+    for root, dirs, files in os.walk(folder):
+        paths += [
+            os.path.join(root, f)
+            for f in files
+            if f.endswith(".json") and not (root == folder and f in SKIP_FILES)
+        ]
 
-def main(folder="maps"):
+        if not recursive:
+            break
 
+    return sorted(paths)
+
+
+def main(folder="maps", recursive=False, max_workers=8):
+    """
+    Write a collection of the collections in a folder.
+
+    Args:
+        folder (str, optional): Folder of the IIIF files. Defaults to "maps".
+        recursive (bool, optional): Also add the collections in the
+        sub-folders (e.g. every Series), not only the top-level ones
+        (every Fonds). Defaults to False.
+        max_workers (int, optional): Number of files read at once.
+        Defaults to 8.
+    """
     collection = iiif_prezi3.Collection(
         id=f"{PREFIX}collection.json",
         label="Overview of map collections",
     )
 
-    # for json file in 'maps' folder
-    for f in os.listdir(folder):
+    # The pages of a paged collection are part of it, not collections of their own
+    paths = [
+        p
+        for p in find_documents(folder, recursive=recursive)
+        if not PAGE_FILENAME_PATTERN.fullmatch(os.path.basename(p))
+    ]
 
-        if not f.endswith(".json"):
-            continue
-
-        file_path = os.path.join(folder, f)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        headers = list(executor.map(read_header, paths))
 
-        with open(file_path) as infile:
-            c = json.load(infile)
+    for file_path, c in zip(paths, headers):
+        # Only collections from the sub-folders, not their manifests
+        if os.sep in os.path.relpath(file_path, folder) and c["type"] != "Collection":
+            continue
 
         c_id = c["id"]
         c_type = c["type"]
@@ -1,6 +1,17 @@
+import argparse
+import hashlib
+import io
 import json
 import os
-from dataclasses import dataclass, field
+import pickle
+import queue
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
 from itertools import count
 from unidecode import unidecode
 
@@ -8,16 +19,54 @@ import iiif_prezi3
 import requests
 from lxml import etree as ET
 
+import iiif_json
+import iiif_v2
+from iiif_files import PAGE_FILENAME
+from cache import BuildState, FileCache, ImageInfoCache, InventoryIndex, input_hash
+from metrics import METRICS
+from requester import Requester
+
 iiif_prezi3.config.configs["helpers.auto_fields.AutoLang"].auto_lang = "en"
 
+GAF_METS_URL = "https://service.archief.nl/gaf/api/mets/v1/"
 
-@dataclass(kw_only=True)
+METS_CACHE = FileCache("data/cache/")
+IMAGE_INFO_CACHE = ImageInfoCache("data/cache/image_info.sqlite")
+EAD_SNAPSHOTS = FileCache("data/cache/ead/", suffix=".pickle")
+
+# Presentation 2.x manifests for Recogito, see `write_manifests_v2`
+V2_BASE_URL = "https://globalise-huygens.github.io/maps/manifests/v2/"
+
+# Increase when the parsed hierarchy changes, to invalidate old snapshots
+EAD_SNAPSHOT_VERSION = 1
+
+METS_NS = {
+    "mets": "http://www.loc.gov/METS/",
+    "xlink": "http://www.w3.org/1999/xlink",
+}
+
+METS_DISPLAY_FILES = ET.XPath(
+    "mets:fileSec/mets:fileGrp[@USE='DISPLAY']/mets:file",
+    namespaces=METS_NS,
+)
+METS_FILE_URL = ET.XPath(
+    "mets:FLocat[@LOCTYPE='URL']/@xlink:href",
+    namespaces=METS_NS,
+    smart_strings=False,
+)
+METS_STRUCTMAP_DIVS = ET.XPath(
+    "mets:structMap/mets:div/mets:div[@ID]",
+    namespaces=METS_NS,
+)
+
+
+@dataclass(kw_only=True, slots=True)
 class Base:
     code: str
     title: str
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class Collection(Base):
     hasPart: list = field(default_factory=list)
     uri: str = field(default_factory=str)
@@ -52,22 +101,22 @@ class Collection(Base):
                 yield from i.files(use_filegroup=use_filegroup)
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class Fonds(Collection):
     pass
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class Series(Collection):
     pass
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class FileGroup(Collection):
     date: str
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class File(Base):
     uri: str
     date: str
@@ -129,18 +178,165 @@ def normalize_title(s: str) -> str:
     return s
 
 
-def to_collection(
+@dataclass(kw_only=True)
+class BuildConfig:
+    """
+    The options of a build, shared by all collections and manifests of a
+    hierarchy, see `to_collection`.
+
+    Attributes:
+        base_url (str): Base URL for the collections.
+        target_dir (str): Folder to write the IIIF files to.
+        base_url_manifests (str): Base URL for the manifests. Defaults to
+        base_url (for a File).
+        use_filegroup (bool): Make a single manifest for a FileGroup.
+        Defaults to False.
+        mets_scans (dict): Result of `prefetch_scans`.
+        cache (FileCache): Cache for METS files that were not prefetched,
+        or None to disable caching. Defaults to METS_CACHE.
+        mets_url (str): Base URL of the METS API.
+        image_info (ImageInfoCache): Image information cache.
+        build_state (BuildState): Hashes of earlier builds. If given, only
+        collections and manifests with changed inputs are written.
+        fast_json (bool): Make the collections and manifests with
+        `iiif_json` instead of iiif_prezi3. Defaults to False.
+        requester (Requester): Request layer for the METS files and image
+        information that are not prefetched.
+        retry_queue (list): Manifests with placeholder canvases are added
+        to this list, see `retry_placeholders`.
+        quiet (bool): Do not print a line for every manifest and canvas.
+        Defaults to False.
+        low_memory (bool): Return a shallow reference for a manifest once
+        it is written, so that its canvases can be freed before the rest
+        of the collection is made. Defaults to False.
+        page_size (int): Split collections with more items into pages of
+        this many items, see `page_collection`. Defaults to 0 (no pages).
+    """
+
+    base_url: str
+    target_dir: str
+    base_url_manifests: str = ""
+    use_filegroup: bool = False
+    mets_scans: dict | None = None
+    cache: FileCache | None = METS_CACHE
+    mets_url: str = GAF_METS_URL
+    image_info: ImageInfoCache | None = IMAGE_INFO_CACHE
+    build_state: BuildState | None = None
+    fast_json: bool = False
+    requester: Requester | None = None
+    retry_queue: list | None = None
+    quiet: bool = False
+    low_memory: bool = False
+    page_size: int = 0
+
+    def is_manifest(self, c: Series | FileGroup | File) -> bool:
+        """Whether a part of a collection is a manifest (or a collection)."""
+        return isinstance(c, File) or (isinstance(c, FileGroup) and self.use_filegroup)
+
+    def manifest_base_url(self, c: File | FileGroup) -> str:
+        """Base URL of the manifest of a File or FileGroup."""
+        if isinstance(c, FileGroup):
+            return self.base_url_manifests
+
+        return self.base_url_manifests or self.base_url
+
+
+def to_collection(i: Fonds | Series | FileGroup, config: BuildConfig, prefix=""):
+    """
+    Make and write the collection of a Fonds, Series or FileGroup, and
+    everything in it.
+
+    Args:
+        i (Fonds | Series | FileGroup): The collection.
+        config (BuildConfig): Options of the build.
+        prefix (str, optional): Path of the parent collection.
+
+    Returns:
+        iiif_prezi3.Collection | dict | None: The collection, or None if
+        none of its parts has scans.
+    """
+    parts_prefix = f"{prefix}{i.code}/"
+    sub_parts = [to_part(c, config, prefix=parts_prefix) for c in i.hasPart]
+
+    return write_collection(
+        i,
+        sub_parts,
+        config.base_url,
+        config.target_dir,
+        prefix=prefix,
+        build_state=config.build_state,
+        fast_json=config.fast_json,
+        page_size=config.page_size,
+    )
+
+
+def to_part(c: Series | FileGroup | File, config: BuildConfig, prefix=""):
+    """
+    Make the sub-collection or manifest for one part of a collection.
+
+    Args:
+        c (Series | FileGroup | File): Part of a collection.
+        config (BuildConfig): Options of the build.
+        prefix (str, optional): Path of the parent collection.
+
+    Returns:
+        iiif_prezi3.Collection | iiif_prezi3.Manifest | None: The
+        sub-collection or manifest (or reference to the manifest), or
+        None if it has no scans.
+    """
+    if not config.is_manifest(c):
+        return to_collection(c, config, prefix=prefix)
+
+    return to_manifest(
+        c,
+        config.manifest_base_url(c),
+        config.target_dir,
+        prefix=prefix,
+        mets_scans=config.mets_scans,
+        cache=config.cache,
+        mets_url=config.mets_url,
+        image_info=config.image_info,
+        build_state=config.build_state,
+        fast_json=config.fast_json,
+        requester=config.requester,
+        retry_queue=config.retry_queue,
+        quiet=config.quiet,
+        low_memory=config.low_memory,
+    )
+
+
+def make_collection(
     i: Fonds | Series | FileGroup,
+    sub_parts: list,
     base_url: str,
-    target_dir: str,
     prefix="",
-    base_url_manifests="",
-    use_filegroup: bool = False,
+    fast_json: bool = False,
 ):
-    collection_filename = f"{prefix}{i.code}.json"
-    collection_id = base_url + collection_filename
+    """
+    Make the collection for a Fonds, Series or FileGroup.
 
-    dirname = os.path.dirname(collection_filename)
+    Args:
+        i (Fonds | Series | FileGroup): The collection.
+        sub_parts (list): Results of `to_part` for each of its parts.
+        base_url (str): Base URL for the collections.
+        prefix (str, optional): Path of the parent collection.
+        fast_json (bool, optional): Make the collection with `iiif_json`
+        instead of iiif_prezi3. Defaults to False.
+
+    Returns:
+        iiif_prezi3.Collection | dict | None: The collection, or None if
+        none of its parts has scans.
+    """
+    collection_id = base_url + f"{prefix}{i.code}.json"
+
+    # Recursively add sub-collections and manifests if there is at least one file
+    items = [sub_part for sub_part in sub_parts if sub_part]
+    if not items:
+        return None
+
+    if fast_json:
+        with METRICS.timer("collection_construction"):
+            return iiif_json.collection(collection_id, f"{i.code} - {i.title}", items)
 
     collection = iiif_prezi3.Collection(id=collection_id, label=f"{i.code} - {i.title}")
 
@@ -163,389 +359,2546 @@ def to_collection(
             )
         )
 
-    at_least_one_file = False
-    for c in i.hasPart:
-        if isinstance(c, Series):
-            sub_part = to_collection(
-                c,
-                base_url,
-                target_dir,
-                prefix=collection_filename.replace(".json", "/"),
-                base_url_manifests=base_url_manifests,
-                use_filegroup=use_filegroup,
-            )
-
-        elif isinstance(c, FileGroup):
-            if use_filegroup:
-                sub_part = to_manifest(
-                    c,
-                    base_url_manifests,
-                    target_dir,
-                    prefix=collection_filename.replace(".json", "/"),
-                )
-            else:
-                sub_part = to_collection(
-                    c,
-                    base_url,
-                    target_dir,
-                    prefix=collection_filename.replace(".json", "/"),
-                    base_url_manifests=base_url_manifests,
-                    use_filegroup=use_filegroup,
-                )
-
-        elif isinstance(c, File):
-            if base_url_manifests:
-                sub_part = to_manifest(
-                    c,
-                    base_url_manifests,
-                    target_dir,
-                    prefix=collection_filename.replace(".json", "/"),
-                )
-            else:
-                sub_part = to_manifest(
-                    c,
-                    base_url,
-                    target_dir,
-                    prefix=collection_filename.replace(".json", "/"),
-                )
-
-        # Recursively add sub-collections and manifests if there is at least one file
-        if sub_part:
-            at_least_one_file = True
+    with METRICS.timer("collection_construction"):
+        for sub_part in items:
             collection.add_item(sub_part)
 
-    if at_least_one_file:
-        if dirname:
-            os.makedirs(os.path.join(target_dir, dirname), exist_ok=True)
-
-        with open(os.path.join(target_dir, collection_filename), "w") as outfile:
-            outfile.write(collection.json(indent=2))
-
-        return collection
-    else:
-        return None
+    return collection
 
 
-def to_manifest(
-    i: File | FileGroup,
+def write_collection(
+    i: Fonds | Series | FileGroup,
+    sub_parts: list,
     base_url: str,
-    target_dir,
+    target_dir: str,
     prefix="",
-    license_uri="https://creativecommons.org/publicdomain/mark/1.0/",
+    build_state: BuildState | None = None,
+    fast_json: bool = False,
+    page_size: int = 0,
 ):
-    print("Making manifest for", i.__class__.__name__, i.code)
-
-    manifest_filename = f"{prefix}{i.code}.json"
-    manifest_id = base_url + manifest_filename
-
-    # If file already exists, skip
-    if os.path.exists(manifest_filename):
-        # return Reference (shallow) only
-        return iiif_prezi3.Reference(
-            id=manifest_id,
-            label=f"{i.code} - {i.title}",
-            type="Manifest",
+    """
+    Make and write the collection for a Fonds, Series or FileGroup.
+
+    Args:
+        i (Fonds | Series | FileGroup): The collection.
+        sub_parts (list): Results of `to_part` for each of its parts.
+        base_url (str): Base URL for the collections.
+        target_dir (str): Folder to write the IIIF files to.
+        prefix (str, optional): Path of the parent collection.
+        build_state (BuildState, optional): Hashes of earlier builds. If
+        given, the collection is only written if its parts changed.
+        fast_json (bool, optional): Make the collection with `iiif_json`
+        instead of iiif_prezi3. Defaults to False.
+        page_size (int, optional): Split the collection into pages of
+        this many items if it has more, see `page_collection`. Defaults
+        to 0 (no pages).
+
+    Returns:
+        iiif_prezi3.Collection | dict | None: The collection, or None if
+        none of its parts has scans.
+    """
+    collection_filename = f"{prefix}{i.code}.json"
+    collection_id = base_url + collection_filename
+    collection_path = os.path.join(target_dir, collection_filename)
+
+    dirname = os.path.dirname(collection_filename)
+
+    # The inputs of a collection are its own fields and those of its parts
+    if build_state is not None:
+        parts_prefix = collection_filename.replace(".json", "/")
+        digest = input_hash(
+            collection_id,
+            i.code,
+            i.title,
+            [
+                build_state.get(
+                    os.path.join(target_dir, f"{parts_prefix}{c.code}.json")
+                )
+                if sub_part
+                else None
+                for c, sub_part in zip(i.hasPart, sub_parts)
+            ],
+            *([page_size] if page_size else []),
+        )
+        state = build_state.get(collection_path)
+        unchanged = (
+            state is not None
+            and state["hash"] == digest
+            and os.path.exists(collection_path)
         )
+    else:
+        unchanged = False
 
-    manifest = iiif_prezi3.Manifest(
-        id=manifest_id,
-        label=[
-            f"{i.code} - {i.title}",
-        ],
-        metadata=[
-            iiif_prezi3.KeyValueString(
-                label="Identifier",
-                value={"en": [i.code]},
-            ),
-            iiif_prezi3.KeyValueString(
-                label="Title",
-                value={"en": [i.title]},
-            ),
-            iiif_prezi3.KeyValueString(
-                label="Date",
-                value={"en": [i.date or "?"]},
-            ),
-            iiif_prezi3.KeyValueString(
-                label="Permalink",
-                value={"en": [f'<a href="{i.uri}">{i.uri}</a>']},
-            ),
-        ],
-        # seeAlso={"id": i.uri, "label": "Permalink"},
-        rights=license_uri,
+    collection = make_collection(
+        i, sub_parts, base_url, prefix=prefix, fast_json=fast_json
     )
 
-    ranges = []  # {"scans": [], "metadata": [], "code": "", "title": ""}
+    if collection is None:
+        if build_state is not None:
+            build_state.set(collection_path, {"hash": digest, "written": False})
 
-    # Get scan-URIs from GAF
-    if isinstance(i, FileGroup):
-        for f in i.files(use_filegroup=True):
-            # Is it a filegrp with filegrps? Then we need a range
-            if isinstance(f, FileGroup):
-                range_code = f.code
-                range_title = f.title
+        return None
 
-                scans = []
-                metadata = []
+    pages = []
+    if page_size:
+        collection, pages = page_collection(
+            i,
+            collection,
+            base_url,
+            prefix=prefix,
+            page_size=page_size,
+            fast_json=fast_json,
+        )
 
-                for f2 in f.files():
-                    new_scans = get_scans(f2.metsid)
-                    scans += new_scans
-                    metadata += [
-                        [
-                            iiif_prezi3.KeyValueString(
-                                label="Identifier",
-                                value={"en": [f2.code]},
-                            ),
-                            iiif_prezi3.KeyValueString(
-                                label="Title",
-                                value={"en": [f2.title]},
-                            ),
-                            iiif_prezi3.KeyValueString(
-                                label="Date",
-                                value={"en": [f2.date or "?"]},
-                            ),
-                            iiif_prezi3.KeyValueString(
-                                label="Permalink",
-                                value={"en": [f'<a href="{f2.uri}">{f2.uri}</a>']},
-                            ),
-                        ]
-                        for _ in new_scans
-                    ]
+    # Only write the collection if one of its parts changed
+    if unchanged:
+        METRICS.count("collections_unchanged")
 
-                if scans:
-                    ranges.append(
-                        {
-                            "scans": scans,
-                            "metadata": metadata,
-                            "code": range_code,
-                            "title": range_title,
-                        }
-                    )
+        return collection
 
-            else:
-                scans = get_scans(f.metsid)
-                metadata = [
-                    [
-                        iiif_prezi3.KeyValueString(
-                            label="Identifier",
-                            value={"en": [f.code]},
-                        ),
-                        iiif_prezi3.KeyValueString(
-                            label="Title",
-                            value={"en": [f.title]},
-                        ),
-                        iiif_prezi3.KeyValueString(
-                            label="Date",
-                            value={"en": [f.date or "?"]},
-                        ),
-                        iiif_prezi3.KeyValueString(
-                            label="Permalink",
-                            value={"en": [f'<a href="{f.uri}">{f.uri}</a>']},
-                        ),
-                    ]
-                    for _ in scans
-                ]
+    if dirname:
+        os.makedirs(os.path.join(target_dir, dirname), exist_ok=True)
 
-                if scans:
-                    ranges.append(
-                        {
-                            "scans": scans,
-                            "metadata": metadata,
-                            "code": f.code,
-                            "title": f.title,
-                        }
-                    )
+    with METRICS.timer("serialization"):
+        data = serialize(collection, fast_json=fast_json)
 
-    else:
-        scans = get_scans(i.metsid)
-        metadata = [[] for _ in scans]
+    with METRICS.timer("write"), open(collection_path, "wb") as outfile:
+        outfile.write(data)
 
-        if scans:
-            ranges.append(
-                {
-                    "scans": scans,
-                    "metadata": metadata,
-                    "code": "",  # Structure not needed here
-                    "title": "",
-                }
-            )
+    METRICS.count("collections_written")
 
-    canvas_counter = count(1)
-    for nr, r in enumerate(ranges, 1):
-        if r["code"]:
-            make_range = True
+    write_pages(
+        pages,
+        target_dir,
+        collection_filename.replace(".json", "/"),
+        fast_json=fast_json,
+    )
 
-            range = manifest.make_range(
-                id=f"{manifest_id}/range/r{nr}",
-                label=f"{r['code']} - {r['title']}",
-            )
-        else:
-            make_range = False
+    if build_state is not None:
+        build_state.set(collection_path, {"hash": digest, "written": True})
 
-        # Add scans
-        for (file_name, iiif_service_info), metadata in zip(r["scans"], r["metadata"]):
-            if file_name.endswith((".tif", ".tiff", ".jpg", ".jpeg")):
-                base_file_name = file_name.rsplit(".", 1)[0]
-            else:
-                base_file_name = file_name
+    return collection
 
-            n = next(canvas_counter)
-            canvas_id = f"{manifest_id}/canvas/p{n}"
 
-            print("Making canvas for", iiif_service_info)
-            try:
-                manifest.make_canvas_from_iiif(
-                    url=iiif_service_info,
-                    id=canvas_id,
-                    label=base_file_name,
-                    anno_id=f"{manifest_id}/canvas/p{n}/anno",
-                    anno_page_id=f"{manifest_id}/canvas/p{n}/annotationpage",
-                    metadata=metadata,
-                )
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 404:
-                    print("404 error, skipping")
-
-                    # Add placeholder canvas (empty)
-                    manifest.make_canvas(
-                        id=canvas_id,
-                        label=base_file_name,
-                        anno_id=f"{manifest_id}/canvas/p{n}/anno",
-                        anno_page_id=f"{manifest_id}/canvas/p{n}/annotationpage",
-                        metadata=metadata,
-                    )
-                elif e.response.status_code == 500:
-                    print("500 error, skipping")
-
-                    # Add placeholder canvas (empty)
-                    manifest.make_canvas(
-                        id=canvas_id,
-                        label=base_file_name,
-                        anno_id=f"{manifest_id}/canvas/p{n}/anno",
-                        anno_page_id=f"{manifest_id}/canvas/p{n}/annotationpage",
-                        metadata=metadata,
-                    )
-                else:
-                    raise e
+def serialize(resource, fast_json: bool = False) -> bytes:
+    """
+    Serialize a collection or manifest as it is written to disk.
 
-            if make_range:
-                range.add_item(
-                    iiif_prezi3.Reference(
-                        id=canvas_id,
-                        type="Canvas",
-                    )
-                )  # shallow only
+    Args:
+        resource (iiif_prezi3.Collection | iiif_prezi3.Manifest | dict):
+        Result of `make_collection` or `construct_manifest`.
+        fast_json (bool, optional): The resource was made with
+        `iiif_json`. Defaults to False.
 
-    if next(canvas_counter) == 1:
-        return  # empty manifests are not useful
+    Returns:
+        bytes: The JSON document.
+    """
+    if fast_json:
+        return iiif_json.dumps(resource)
 
-    os.makedirs(
-        os.path.join(target_dir, os.path.dirname(manifest_filename)), exist_ok=True
-    )
-    with open(os.path.join(target_dir, manifest_filename), "w") as outfile:
-        outfile.write(manifest.json(indent=2))
+    return resource.json(indent=2).encode("utf-8")
 
-    return manifest
 
+def page_collection(
+    i: Fonds | Series | FileGroup,
+    collection,
+    base_url: str,
+    prefix="",
+    page_size: int = 100,
+    fast_json: bool = False,
+) -> tuple:
+    """
+    Split a large collection into pages.
 
-def get_scans(metsid: str, cache_path="data/cache/") -> list[tuple[str, str]]:
-    NS = {"mets": "http://www.loc.gov/METS/"}
+    A collection with more than page_size items is replaced by a
+    collection of pages: sub-collections of page_size items each, in
+    order, that are referenced (not embedded), so that a viewer only
+    needs to load the page it shows. The pages are written next to the
+    sub-collections and manifests of the collection, as `page-<n>.json`.
 
-    scans = []
+    Args:
+        i (Fonds | Series | FileGroup): The collection.
+        collection (iiif_prezi3.Collection | dict): Result of
+        `make_collection`.
+        base_url (str): Base URL for the collections.
+        prefix (str, optional): Path of the parent collection.
+        page_size (int, optional): Maximum number of items per page.
+        Defaults to 100.
+        fast_json (bool, optional): The collection was made with
+        `iiif_json`. Defaults to False.
 
-    if metsid:
-        if cache_path and metsid + ".xml" in os.listdir(cache_path):
-            mets = ET.parse(os.path.join(cache_path, metsid + ".xml"))
+    Returns:
+        tuple: The (paged) collection, and the pages as (file name,
+        page) pairs, empty if the collection is small enough.
+    """
+    items = collection["items"] if fast_json else collection.items
+    if len(items) <= page_size:
+        return collection, []
+
+    label = f"{i.code} - {i.title}"
+    parts_prefix = f"{prefix}{i.code}/"
+
+    pages = []
+    references = []
+    for n, start in enumerate(range(0, len(items), page_size), 1):
+        page_items = items[start : start + page_size]
+        page_filename = PAGE_FILENAME.format(n=n)
+        page_id = base_url + parts_prefix + page_filename
+        page_label = f"{label} ({start + 1}-{start + len(page_items)})"
+
+        if fast_json:
+            page = iiif_json.collection(page_id, page_label, page_items)
+            reference = iiif_json.reference(page_id, page_label, "Collection")
         else:
-            url = "https://service.archief.nl/gaf/api/mets/v1/" + metsid
-            xml = requests.get(url).text
-            mets = ET.fromstring(bytes(xml, encoding="utf-8"))
-
-            if cache_path:
-                with open(os.path.join(cache_path, metsid + ".xml"), "w") as outfile:
-                    outfile.write(xml)
-
-        for file_el in mets.findall(
-            "mets:fileSec/mets:fileGrp[@USE='DISPLAY']/mets:file",
-            namespaces=NS,
-        ):
-            file_id = file_el.attrib["ID"][:-3]  # without IIP
-            service_info_url = file_el.find(
-                "./mets:FLocat[@LOCTYPE='URL']",
-                namespaces=NS,
-            ).attrib["{http://www.w3.org/1999/xlink}href"]
-
-            service_info_url = service_info_url.replace("/iip/", "/iipsrv?IIIF=/")
-
-            file_name = (
-                mets.find(
-                    "mets:structMap/mets:div/mets:div[@ID='" + file_id + "']",
-                    namespaces=NS,
-                )
-                .attrib["LABEL"]
-                .split("/")[-1]
+            page = iiif_prezi3.Collection(
+                id=page_id, label=page_label, items=page_items
+            )
+            reference = iiif_prezi3.Reference(
+                id=page_id, label=page_label, type="Collection"
             )
 
-            scans.append((file_name, service_info_url))
+        pages.append((page_filename, page))
+        references.append(reference)
 
-    return scans
+    if fast_json:
+        collection = iiif_json.collection(collection["id"], label, references)
+    else:
+        collection = iiif_prezi3.Collection(
+            id=collection.id, label=label, items=references
+        )
 
+    return collection, pages
 
-def parse_ead(ead_file_path: str, filter_codes: set = set()) -> Fonds:
-    tree = ET.parse(ead_file_path)
 
-    fonds_code = tree.find("eadheader/eadid").text
-    fonds_title = tree.find("eadheader/filedesc/titlestmt/titleproper").text
-    permalink = tree.find("eadheader/eadid[@url]").attrib["url"]
+def write_pages(
+    pages: list,
+    target_dir: str,
+    parts_prefix: str,
+    fast_json: bool = False,
+) -> None:
+    """
+    Write the pages of a collection, and remove pages that are left over
+    from an earlier build with more pages.
 
-    fonds = Fonds(
-        code=fonds_code,
-        title=fonds_title,
-        uri=permalink,
-    )
+    Args:
+        pages (list): Pages of `page_collection`.
+        target_dir (str): Folder to write the IIIF files to.
+        parts_prefix (str): Path of the sub-collections and manifests of
+        the collection.
+        fast_json (bool, optional): The pages were made with `iiif_json`.
+        Defaults to False.
+    """
+    if pages:
+        os.makedirs(os.path.join(target_dir, parts_prefix), exist_ok=True)
 
-    series_els = tree.findall(".//c[@level='series']")
-    subseries_els = tree.findall(".//dsc[@type='combined']/c[@level='subseries']")
-    dsc_el = tree.find(".//dsc[@type='combined']")
-    if series_els:
-        for series_el in series_els:
-            s = get_series(series_el, filter_codes=filter_codes)
-            fonds.hasPart.append(s)
-    elif subseries_els:
-        for subseries_el in subseries_els:
-            s = get_series(subseries_el, filter_codes=filter_codes)
-            fonds.hasPart.append(s)
-    elif dsc_el is not None:
-        parts = get_file_and_filegrp_els(dsc_el, filter_codes=filter_codes)
-        fonds.hasPart += parts
+    for page_filename, page in pages:
+        with METRICS.timer("serialization"):
+            data = serialize(page, fast_json=fast_json)
 
-    return fonds
+        with METRICS.timer("write"), open(
+            os.path.join(target_dir, parts_prefix, page_filename), "wb"
+        ) as outfile:
+            outfile.write(data)
 
+        METRICS.count("collection_pages_written")
 
-def get_series(series_el, filter_codes: set = set()) -> Series:
-    series_code_el = series_el.find("did/unitid[@type='series_code']")
-    series_title = "".join(series_el.find("did/unittitle").itertext()).strip()
+    for n in count(len(pages) + 1):
+        path = os.path.join(target_dir, parts_prefix, PAGE_FILENAME.format(n=n))
+        if not os.path.exists(path):
+            break
 
-    while "  " in series_title:  # double space
-        series_title = series_title.replace("  ", " ")
+        os.remove(path)
 
-    if series_code_el is not None:
-        series_code = normalize_id(series_code_el.text)
-    else:
-        series_code = normalize_title(series_title)
 
-    s = Series(code=series_code, title=series_title)
+def to_manifest(
+    i: File | FileGroup,
+    base_url: str,
+    target_dir,
+    prefix="",
+    license_uri="https://creativecommons.org/publicdomain/mark/1.0/",
+    mets_scans: dict | None = None,
+    cache: FileCache | None = METS_CACHE,
+    mets_url: str = GAF_METS_URL,
+    image_info: ImageInfoCache | None = IMAGE_INFO_CACHE,
+    build_state: BuildState | None = None,
+    fast_json: bool = False,
+    requester: Requester | None = None,
+    retry_queue: list | None = None,
+    quiet: bool = False,
+    low_memory: bool = False,
+):
+    if not quiet:
+        print("Making manifest for", i.__class__.__name__, i.code)
+
+    task = ManifestTask(
+        part=i,
+        base_url=base_url,
+        target_dir=target_dir,
+        prefix=prefix,
+        license_uri=license_uri,
+    )
 
-    parts = get_file_and_filegrp_els(series_el, filter_codes=filter_codes)
-    s.hasPart += parts
+    resolve_manifest(
+        task,
+        mets_scans=mets_scans,
+        cache=cache,
+        mets_url=mets_url,
+        image_info=image_info,
+        build_state=build_state,
+        fast_json=fast_json,
+        requester=requester,
+    )
+    construct_manifest(
+        task,
+        image_info=image_info,
+        fast_json=fast_json,
+        requester=requester,
+        quiet=quiet,
+    )
 
-    return s
+    return write_manifest(
+        task,
+        build_state=build_state,
+        fast_json=fast_json,
+        retry_queue=retry_queue,
+        low_memory=low_memory,
+    )
 
 
-def get_file_and_filegrp_els(series_el, filter_codes: set = set()):
-    parts = []
+@dataclass(kw_only=True)
+class ManifestTask:
+    """
+    A manifest on its way through `resolve_manifest`, `construct_manifest`
+    and `write_manifest`.
+    """
 
-    file_and_filegrp_els = series_el.xpath("child::*")
+    part: File | FileGroup
+    base_url: str
+    target_dir: str
+    prefix: str = ""
+    license_uri: str = "https://creativecommons.org/publicdomain/mark/1.0/"
+
+    digest: str = ""  # hash of the inputs, in an incremental build
+    unchanged: bool = False  # since the previous (incremental) build
+    ranges: list = field(default_factory=list)
+    manifest: iiif_prezi3.Manifest | dict | None = None
+    placeholders: list = field(default_factory=list)
+    failed_mets: list = field(default_factory=list)  # METS ids without scans
+    result: iiif_prezi3.Manifest | iiif_prezi3.Reference | dict | None = None
+
+    @property
+    def filename(self) -> str:
+        return f"{self.prefix}{self.part.code}.json"
+
+    @property
+    def id(self) -> str:
+        return self.base_url + self.filename
+
+    @property
+    def label(self) -> str:
+        return f"{self.part.code} - {self.part.title}"
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.target_dir, self.filename)
+
+
+def resolve_manifest(
+    task: ManifestTask,
+    mets_scans: dict | None = None,
+    cache: FileCache | None = METS_CACHE,
+    mets_url: str = GAF_METS_URL,
+    image_info: ImageInfoCache | None = IMAGE_INFO_CACHE,
+    build_state: BuildState | None = None,
+    fast_json: bool = False,
+    requester: Requester | None = None,
+    fetch_image_info: bool = False,
+) -> ManifestTask:
+    """
+    Collect the scans of a manifest, or skip it if it did not change.
+
+    Args:
+        task (ManifestTask): The manifest.
+        fetch_image_info (bool, optional): Also fill the image
+        information cache for all scans, so that `construct_manifest`
+        does not have to wait for the image server. Defaults to False.
+        See `BuildConfig` for the other arguments.
+
+    Returns:
+        ManifestTask: The task, with its ranges (or marked unchanged).
+    """
+    i = task.part
+
+    # In an incremental build, skip the manifest if its inputs did not change
+    if build_state is not None:
+        failed = []
+        task.digest = input_hash(
+            task.id,
+            task.license_uri,
+            asdict(i),
+            *manifest_inputs(
+                i,
+                mets_scans,
+                image_info,
+                session=requester,
+                cache=cache,
+                mets_url=mets_url,
+                failed=failed,
+            ),
+        )
+
+        state = build_state.get(task.path)
+        if state and state["hash"] == task.digest and not failed:
+            if not state["written"]:
+                METRICS.count("manifests_unchanged")
+                task.unchanged = True
+                return task  # empty manifests are not useful
+
+            if os.path.exists(task.path):
+                METRICS.count("manifests_unchanged")
+                task.unchanged = True
+
+                # return Reference (shallow) only
+                task.result = manifest_reference(
+                    task.id, task.label, fast_json=fast_json
+                )
+                return task
+
+    # Files of which the METS cannot be retrieved are left out, and the
+    # manifest is tried again at the end, as for placeholder canvases
+    task.ranges = manifest_ranges(
+        i,
+        mets_scans,
+        session=requester,
+        cache=cache,
+        mets_url=mets_url,
+        failed=task.failed_mets,
+    )
+
+    if fetch_image_info:
+        for r in task.ranges:
+            for _, url in r["scans"]:
+                try:
+                    get_image_info(url, cache=image_info, session=requester)
+                except requests.exceptions.RequestException:
+                    pass  # placeholder canvas, see iter_canvases
+
+    return task
+
+
+def construct_manifest(
+    task: ManifestTask,
+    image_info: ImageInfoCache | None = IMAGE_INFO_CACHE,
+    fast_json: bool = False,
+    requester: Requester | None = None,
+    quiet: bool = False,
+) -> ManifestTask:
+    """
+    Make the manifest (with its canvases) from the resolved scans.
+
+    Args:
+        task (ManifestTask): The manifest, after `resolve_manifest`.
+        See `BuildConfig` for the other arguments.
+
+    Returns:
+        ManifestTask: The task, with its manifest (None if it is empty).
+    """
+    if task.unchanged:
+        return task
+
+    i = task.part
+
+    canvases = iter_canvases(
+        task.id,
+        task.ranges,
+        image_info,
+        session=requester,
+        placeholders=task.placeholders,
+        quiet=quiet,
+    )
+
+    # Includes fetching the image information that is not cached
+    with METRICS.timer("manifest_construction"):
+        if fast_json:
+            task.manifest = iiif_json.manifest(
+                task.id,
+                task.label,
+                file_metadata(i),
+                task.license_uri,
+                canvases,
+            )
+        else:
+            task.manifest = make_manifest(
+                task.id,
+                task.label,
+                file_metadata(i),
+                task.license_uri,
+                canvases,
+            )
+
+    task.ranges = []
+
+    return task
+
+
+def write_manifest(
+    task: ManifestTask,
+    build_state: BuildState | None = None,
+    fast_json: bool = False,
+    retry_queue: list | None = None,
+    low_memory: bool = False,
+    write: bool = True,
+):
+    """
+    Serialize and write a manifest.
+
+    Args:
+        task (ManifestTask): The manifest, after `construct_manifest`.
+        write (bool, optional): Write the file. If False, only the
+        result for the collection is made. Defaults to True.
+        See `BuildConfig` for the other arguments.
+
+    Returns:
+        iiif_prezi3.Manifest | iiif_prezi3.Reference | dict | None: The
+        manifest (or reference to the manifest) for its collection, or
+        None if it has no scans.
+    """
+    if task.unchanged:
+        return task.result
+
+    manifest = task.manifest
+
+    # Try the image information of the placeholder canvases, and the METS
+    # files that could not be retrieved, again at the end
+    if (task.placeholders or task.failed_mets) and retry_queue is not None:
+        retry_queue.append(
+            {
+                "part": task.part,
+                "base_url": task.base_url,
+                "prefix": task.prefix,
+                "license_uri": task.license_uri,
+                "urls": task.placeholders,
+                "metsids": task.failed_mets,
+                "empty": manifest is None,
+            }
+        )
+
+    if manifest is None:
+        METRICS.count("manifests_empty")
+
+        if build_state is not None:
+            build_state.set(task.path, {"hash": task.digest, "written": False})
+
+        return  # empty manifests are not useful
+
+    if write:
+        os.makedirs(os.path.dirname(task.path), exist_ok=True)
+
+        with METRICS.timer("serialization"):
+            data = serialize(manifest, fast_json=fast_json)
+
+        with METRICS.timer("write"), open(task.path, "wb") as outfile:
+            outfile.write(data)
+
+        METRICS.count("manifests_written")
+
+        if build_state is not None:
+            build_state.set(task.path, {"hash": task.digest, "written": True})
+
+    if low_memory:
+        # The collection only needs a Reference (shallow)
+        task.manifest = None
+        task.result = manifest_reference(task.id, task.label, fast_json=fast_json)
+    else:
+        task.result = manifest
+
+    return task.result
+
+
+def manifest_reference(id: str, label: str, fast_json: bool = False):
+    """
+    Make a shallow reference to a manifest for its collection.
+
+    Args:
+        id (str): Id of the manifest.
+        label (str): Label of the manifest.
+        fast_json (bool, optional): Make an `iiif_json` reference instead
+        of an iiif_prezi3 Reference. Defaults to False.
+
+    Returns:
+        iiif_prezi3.Reference | dict: The reference.
+    """
+    if fast_json:
+        return iiif_json.reference(id, label, "Manifest")
+
+    return iiif_prezi3.Reference(id=id, label=label, type="Manifest")
+
+
+def build_pipeline(
+    i: Fonds | Series | FileGroup,
+    config: BuildConfig,
+    prefix="",
+    scan_workers: int = 8,
+    canvas_workers: int = 2,
+    write_workers: int = 2,
+    queue_size: int = 64,
+):
+    """
+    Make the collections and manifests of a hierarchy in a staged pipeline.
+
+    The manifests go through four stages, connected by bounded queues,
+    so that fetching, building and writing overlap:
+
+    1. tree walk (this thread): the manifests in document order
+    2. scan resolution (scan_workers threads): METS files and image
+       information
+    3. canvas construction (canvas_workers threads): the manifest models
+    4. serialization and write (write_workers threads)
+
+    A full queue blocks the stage before it, so at most about
+    queue_size manifests per stage are in memory. Once all manifests
+    are written, the collections are made from their references. The
+    output is the same as that of `to_collection`; the manifests are
+    always kept as references only (as with `low_memory`).
+
+    Args:
+        i (Fonds | Series | FileGroup): The collection to build.
+        config (BuildConfig): Options of the build. Scans that are not in
+        its mets_scans are fetched, and added to it.
+        prefix (str, optional): Path of the parent collection.
+        scan_workers (int, optional): Threads of the scan resolution
+        stage. Defaults to 8.
+        canvas_workers (int, optional): Threads of the canvas construction
+        stage. Defaults to 2.
+        write_workers (int, optional): Threads of the serialization and
+        write stage. Defaults to 2.
+        queue_size (int, optional): Capacity of the queues between the
+        stages. Defaults to 64.
+
+    Returns:
+        iiif_prezi3.Collection | dict | None: The collection, or None if
+        none of its parts has scans.
+    """
+    if config.mets_scans is None:
+        config.mets_scans = {}
+
+    mets_scans = config.mets_scans
+
+    # The tree of collections, with a task for every manifest
+    tasks = []
+
+    def plan(i, prefix):
+        parts_prefix = f"{prefix}{i.code}.json".replace(".json", "/")
+        parts = []
+
+        for c in i.hasPart:
+            if not config.is_manifest(c):
+                parts.append(plan(c, parts_prefix))
+            else:
+                task = ManifestTask(
+                    part=c,
+                    base_url=config.manifest_base_url(c),
+                    target_dir=config.target_dir,
+                    prefix=parts_prefix,
+                )
+                tasks.append(task)
+                parts.append(task)
+
+        return i, prefix, parts
+
+    tree = plan(i, prefix)
+
+    # A manifest can be made more than once (for a duplicate code): as in
+    # to_collection, the last one with scans is the one that is written
+    order = {id(task): n for n, task in enumerate(tasks)}
+    duplicates = {path for path, n in Counter(t.path for t in tasks).items() if n > 1}
+    duplicates_lock = threading.Lock()
+    written = {}
+
+    def resolve(task):
+        if not config.quiet:
+            print("Making manifest for", task.part.__class__.__name__, task.part.code)
+
+        files = task.part.files() if isinstance(task.part, FileGroup) else [task.part]
+        for f in files:
+            if f.metsid and f.metsid not in mets_scans:
+                try:
+                    mets_scans[f.metsid] = get_scans(
+                        f.metsid,
+                        cache=config.cache,
+                        session=config.requester,
+                        mets_url=config.mets_url,
+                    )
+                except requests.exceptions.RequestException as e:
+                    print("Could not get METS", f.metsid, e)
+                    mets_scans[f.metsid] = None  # tried again at the end
+
+        return resolve_manifest(
+            task,
+            mets_scans=mets_scans,
+            cache=config.cache,
+            mets_url=config.mets_url,
+            image_info=config.image_info,
+            build_state=config.build_state,
+            fast_json=config.fast_json,
+            requester=config.requester,
+            fetch_image_info=True,
+        )
+
+    def construct(task):
+        return construct_manifest(
+            task,
+            image_info=config.image_info,
+            fast_json=config.fast_json,
+            requester=config.requester,
+            quiet=config.quiet,
+        )
+
+    def write(task):
+        if task.path not in duplicates:
+            write_manifest(
+                task,
+                build_state=config.build_state,
+                fast_json=config.fast_json,
+                retry_queue=config.retry_queue,
+                low_memory=True,
+            )
+            return
+
+        with duplicates_lock:
+            n = order[id(task)]
+            superseded = task.manifest is not None and written.get(task.path, -1) > n
+            if task.manifest is not None and not superseded:
+                written[task.path] = n
+
+            write_manifest(
+                task,
+                build_state=config.build_state,
+                fast_json=config.fast_json,
+                retry_queue=config.retry_queue,
+                low_memory=True,
+                write=not superseded,
+            )
+
+    errors = []
+    to_resolve = queue.Queue(queue_size)
+    to_construct = queue.Queue(queue_size)
+    to_write = queue.Queue(queue_size)
+
+    threads = (
+        _run_stage(
+            resolve, to_resolve, to_construct, scan_workers, canvas_workers, errors
+        )
+        + _run_stage(
+            construct, to_construct, to_write, canvas_workers, write_workers, errors
+        )
+        + _run_stage(write, to_write, None, write_workers, 0, errors)
+    )
+
+    for task in tasks:
+        to_resolve.put(task)
+    for _ in range(scan_workers):
+        to_resolve.put(_DONE)
+
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    # Make the collections, deepest first
+    def assemble(node):
+        i, prefix, parts = node
+
+        sub_parts = [
+            part.result if isinstance(part, ManifestTask) else assemble(part)
+            for part in parts
+        ]
+
+        return write_collection(
+            i,
+            sub_parts,
+            config.base_url,
+            config.target_dir,
+            prefix=prefix,
+            build_state=config.build_state,
+            fast_json=config.fast_json,
+            page_size=config.page_size,
+        )
+
+    return assemble(tree)
+
+
+_DONE = object()  # end of the input of a pipeline stage
+
+
+def _run_stage(func, inbox, outbox, workers, next_workers, errors):
+    """
+    Start the worker threads of a pipeline stage.
+
+    Every worker takes items from inbox until it gets _DONE, and puts
+    func(item) in outbox. The last worker to finish sends a _DONE for
+    every worker of the next stage. After an error (which is added to
+    errors), the remaining items are taken but not processed, so that
+    the stages before do not block.
+
+    Returns:
+        list[threading.Thread]: The started threads.
+    """
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def work():
+        while (item := inbox.get()) is not _DONE:
+            if errors:
+                continue
+
+            try:
+                result = func(item)
+            except Exception as e:
+                errors.append(e)
+                continue
+
+            if outbox is not None:
+                outbox.put(result)
+
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+
+        if last and outbox is not None:
+            for _ in range(next_workers):
+                outbox.put(_DONE)
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    return threads
+
+
+def retry_placeholders(
+    retry_queue: list[dict], config: BuildConfig, max_workers: int = 8
+) -> list[str]:
+    """
+    Retry the image information of placeholder canvases, and the METS
+    files that could not be retrieved.
+
+    Called at the end of a build, when a server that throttled or
+    failed earlier has had time to recover. Every manifest of which a
+    METS file, or the image information of at least one placeholder
+    canvas, can now be retrieved is made again.
+
+    Args:
+        retry_queue (list[dict]): Manifests with placeholder canvases or
+        missing METS files, as collected by `to_manifest`.
+        config (BuildConfig): Options of the build. The METS files that
+        are retrieved are added to its mets_scans.
+        max_workers (int, optional): Maximum number of concurrent
+        requests. Defaults to 8.
+
+    Returns:
+        list[str]: The paths of the collections (the prefix) of the
+        manifests that had no canvases before and now have, so that
+        those collections have to be made again, see `remake_collections`.
+    """
+    if config.mets_scans is None:
+        config.mets_scans = {}
+
+    mets_scans = config.mets_scans
+    image_info = config.image_info
+
+    metsids = list(
+        dict.fromkeys(metsid for entry in retry_queue for metsid in entry["metsids"])
+    )
+    if metsids:
+        print("Retrying", len(metsids), "METS files")
+
+        mets_scans.update(
+            fetch_scans(
+                metsids,
+                max_workers=max_workers,
+                cache=config.cache,
+                session=config.requester,
+                mets_url=config.mets_url,
+            )
+        )
+
+    urls = [url for entry in retry_queue for url in entry["urls"]]
+    print("Retrying", len(urls), "placeholder canvases")
+
+    prefetch_image_info(
+        urls + [url for metsid in metsids for _, url in mets_scans[metsid] or []],
+        max_workers=max_workers,
+        cache=image_info,
+        session=config.requester,
+    )
+
+    changed = []
+
+    for entry in retry_queue:
+        retrieved = any(mets_scans[metsid] is not None for metsid in entry["metsids"])
+        if not retrieved and not any(url in image_info for url in entry["urls"]):
+            continue
+
+        manifest = to_manifest(
+            entry["part"],
+            entry["base_url"],
+            config.target_dir,
+            prefix=entry["prefix"],
+            license_uri=entry["license_uri"],
+            mets_scans=mets_scans,
+            cache=config.cache,
+            mets_url=config.mets_url,
+            image_info=image_info,
+            build_state=config.build_state,
+            fast_json=config.fast_json,
+            requester=config.requester,
+            quiet=config.quiet,
+        )
+
+        if entry["empty"] and manifest is not None:
+            changed.append(entry["prefix"])
+
+    return changed
+
+
+def remake_collections(
+    i: Fonds | Series | FileGroup | File,
+    changed: list[str],
+    config: BuildConfig,
+    prefix="",
+):
+    """
+    Make the collections of a hierarchy again after `retry_placeholders`,
+    and write the ones on the path of the manifests that changed.
+
+    The manifests are not made again: every manifest with scans is
+    referenced, as in the build, so that no requests are needed.
+
+    Args:
+        i (Fonds | Series | FileGroup | File): The collection, or a part
+        of one as in `to_part`.
+        changed (list[str]): Result of `retry_placeholders`.
+        config (BuildConfig): Options of the build, with the scans of all
+        files of the hierarchy in its mets_scans.
+        prefix (str, optional): Path of the parent collection.
+
+    Returns:
+        iiif_prezi3.Collection | iiif_prezi3.Reference | dict | None: The
+        collection, or the reference to the manifest, or None if it has
+        no scans.
+    """
+    if config.is_manifest(i):
+        files = i.files() if isinstance(i, FileGroup) else [i]
+        if not any((config.mets_scans or {}).get(f.metsid) for f in files):
+            return None
+
+        return manifest_reference(
+            f"{config.manifest_base_url(i)}{prefix}{i.code}.json",
+            f"{i.code} - {i.title}",
+            fast_json=config.fast_json,
+        )
+
+    parts_prefix = f"{prefix}{i.code}/"
+    sub_parts = [
+        remake_collections(c, changed, config, prefix=parts_prefix)
+        for c in i.hasPart
+    ]
+
+    if any(p.startswith(parts_prefix) for p in changed):
+        return write_collection(
+            i,
+            sub_parts,
+            config.base_url,
+            config.target_dir,
+            prefix=prefix,
+            build_state=config.build_state,
+            fast_json=config.fast_json,
+            page_size=config.page_size,
+        )
+
+    # Not written, only embedded in its parent collection
+    collection = make_collection(
+        i, sub_parts, config.base_url, prefix=prefix, fast_json=config.fast_json
+    )
+    if collection is not None and config.page_size:
+        collection, _ = page_collection(
+            i,
+            collection,
+            config.base_url,
+            prefix=prefix,
+            page_size=config.page_size,
+            fast_json=config.fast_json,
+        )
+
+    return collection
+
+
+def file_metadata(f: File | FileGroup) -> list[dict]:
+    """
+    Metadata of a File or FileGroup, as IIIF JSON.
+
+    Args:
+        f (File | FileGroup): File or FileGroup.
+
+    Returns:
+        list[dict]: Identifier, title, date and permalink.
+    """
+    return [
+        {"label": {"en": [label]}, "value": {"en": [value]}}
+        for label, value in (
+            ("Identifier", f.code),
+            ("Title", f.title),
+            ("Date", f.date or "?"),
+            ("Permalink", f'<a href="{f.uri}">{f.uri}</a>'),
+        )
+    ]
+
+
+def manifest_ranges(
+    i: File | FileGroup,
+    mets_scans: dict | None = None,
+    session: requests.Session | Requester | None = None,
+    cache: FileCache | None = METS_CACHE,
+    mets_url: str = GAF_METS_URL,
+    failed: list | None = None,
+) -> list[dict]:
+    """
+    Collect the scans of a manifest, grouped in ranges.
+
+    A File gives a single range without structure. In a FileGroup,
+    every File and every nested FileGroup becomes a range, and every
+    scan gets the metadata of the File it belongs to.
+
+    Args:
+        i (File | FileGroup): File or FileGroup of the manifest.
+        mets_scans (dict, optional): Result of `prefetch_scans`.
+        session (requests.Session | Requester, optional): Session for
+        METS files that were not prefetched.
+        cache (FileCache, optional): Cache for METS files that were not
+        prefetched. Defaults to METS_CACHE.
+        mets_url (str, optional): Base URL of the METS API.
+        failed (list, optional): METS ids that cannot be retrieved are
+        added to this list, and their files left out. If None, the
+        error is raised.
+
+    Returns:
+        list[dict]: Ranges with "scans", "metadata", "code" and "title".
+    """
+    ranges = []  # {"scans": [], "metadata": [], "code": "", "title": ""}
+
+    def lookup(metsid):
+        try:
+            return lookup_scans(
+                metsid, mets_scans, session=session, cache=cache, mets_url=mets_url
+            )
+        except requests.exceptions.RequestException as e:
+            if failed is None:
+                raise
+
+            print("Could not get METS", metsid, e)
+            failed.append(metsid)
+
+            return []
+
+    # Get scan-URIs from GAF
+    if isinstance(i, FileGroup):
+        for f in i.files(use_filegroup=True):
+            # Is it a filegrp with filegrps? Then we need a range
+            if isinstance(f, FileGroup):
+                range_code = f.code
+                range_title = f.title
+
+                scans = []
+                metadata = []
+
+                for f2 in f.files():
+                    new_scans = lookup(f2.metsid)
+                    scans += new_scans
+                    metadata += [file_metadata(f2) for _ in new_scans]
+
+                if scans:
+                    ranges.append(
+                        {
+                            "scans": scans,
+                            "metadata": metadata,
+                            "code": range_code,
+                            "title": range_title,
+                        }
+                    )
+
+            else:
+                scans = lookup(f.metsid)
+                metadata = [file_metadata(f) for _ in scans]
+
+                if scans:
+                    ranges.append(
+                        {
+                            "scans": scans,
+                            "metadata": metadata,
+                            "code": f.code,
+                            "title": f.title,
+                        }
+                    )
+
+    else:
+        scans = lookup(i.metsid)
+        metadata = [[] for _ in scans]
+
+        if scans:
+            ranges.append(
+                {
+                    "scans": scans,
+                    "metadata": metadata,
+                    "code": "",  # Structure not needed here
+                    "title": "",
+                }
+            )
+
+    return ranges
+
+
+def scan_label(file_name: str) -> str:
+    """The label of the canvas of a scan: its file name without extension."""
+    if file_name.endswith((".tif", ".tiff", ".jpg", ".jpeg")):
+        return file_name.rsplit(".", 1)[0]
+
+    return file_name
+
+
+def iter_canvases(
+    manifest_id: str,
+    ranges: list[dict],
+    image_info: ImageInfoCache | None = IMAGE_INFO_CACHE,
+    session: requests.Session | Requester | None = None,
+    placeholders: list | None = None,
+    quiet: bool = False,
+):
+    """
+    For each scan in the ranges of a manifest, yield its canvas.
+
+    If the image information of a scan cannot be retrieved, the canvas
+    is a placeholder without image.
+
+    Args:
+        manifest_id (str): Id of the manifest.
+        ranges (list[dict]): Result of `manifest_ranges`.
+        image_info (ImageInfoCache, optional): Image information cache.
+        session (requests.Session | Requester, optional): Session for
+        image information that is not cached.
+        placeholders (list, optional): The image service URLs of the
+        placeholder canvases are added to this list.
+        quiet (bool, optional): Do not print a line for every canvas.
+        Defaults to False.
+
+    Yields:
+        dict: Canvas with its id, label, annotation ids, metadata, image
+        information (None for a placeholder canvas) and the id and label
+        of its range (None if no structure is needed).
+    """
+    canvas_counter = count(1)
+    for nr, r in enumerate(ranges, 1):
+        if r["code"]:
+            range_id = f"{manifest_id}/range/r{nr}"
+        else:
+            range_id = None
+
+        # Add scans
+        for (file_name, iiif_service_info), metadata in zip(r["scans"], r["metadata"]):
+            n = next(canvas_counter)
+            canvas_id = f"{manifest_id}/canvas/p{n}"
+
+            if not quiet:
+                print("Making canvas for", iiif_service_info)
+            try:
+                info = get_image_info(
+                    iiif_service_info, cache=image_info, session=session
+                )
+            except requests.exceptions.HTTPError as e:
+                print(f"{e.response.status_code} error, skipping")
+                info = None  # placeholder canvas (empty)
+            except requests.exceptions.RequestException as e:
+                print(f"{e.__class__.__name__}, skipping")
+                info = None  # placeholder canvas (empty)
+
+            METRICS.count("canvases")
+
+            if info is None:
+                METRICS.count("placeholder_canvases")
+
+                if placeholders is not None:
+                    placeholders.append(iiif_service_info)
+
+            yield {
+                "id": canvas_id,
+                "label": scan_label(file_name),
+                "anno_id": f"{manifest_id}/canvas/p{n}/anno",
+                "anno_page_id": f"{manifest_id}/canvas/p{n}/annotationpage",
+                "metadata": metadata,
+                "info": info,
+                "range_id": range_id,
+                "range_label": f"{r['code']} - {r['title']}",
+            }
+
+
+def make_manifest(
+    id: str,
+    label: str,
+    metadata: list,
+    license_uri: str,
+    canvases,
+) -> iiif_prezi3.Manifest | None:
+    """
+    Make a iiif_prezi3 Manifest.
+
+    Args:
+        id (str): Id of the manifest.
+        label (str): Label of the manifest.
+        metadata (list): Metadata of the manifest, as IIIF JSON.
+        license_uri (str): License URI.
+        canvases (Iterable[dict]): Result of `iter_canvases`.
+
+    Returns:
+        iiif_prezi3.Manifest | None: The manifest, or None if it has
+        no canvases.
+    """
+    manifest = iiif_prezi3.Manifest(
+        id=id,
+        label=[label],
+        metadata=[iiif_prezi3.KeyValueString(**m) for m in metadata],
+        # seeAlso={"id": i.uri, "label": "Permalink"},
+        rights=license_uri,
+    )
+
+    range_id = None
+    at_least_one_canvas = False
+    for c in canvases:
+        at_least_one_canvas = True
+
+        if c["range_id"] and c["range_id"] != range_id:
+            range_id = c["range_id"]
+            range = manifest.make_range(id=range_id, label=c["range_label"])
+
+        canvas_metadata = [iiif_prezi3.KeyValueString(**m) for m in c["metadata"]]
+
+        if c["info"] is not None:
+            make_canvas_from_info(
+                manifest,
+                c["info"],
+                id=c["id"],
+                label=c["label"],
+                anno_id=c["anno_id"],
+                anno_page_id=c["anno_page_id"],
+                metadata=canvas_metadata,
+            )
+        else:
+            # Add placeholder canvas (empty)
+            manifest.make_canvas(
+                id=c["id"],
+                label=c["label"],
+                anno_id=c["anno_id"],
+                anno_page_id=c["anno_page_id"],
+                metadata=canvas_metadata,
+            )
+
+        if c["range_id"]:
+            range.add_item(
+                iiif_prezi3.Reference(
+                    id=c["id"],
+                    type="Canvas",
+                )
+            )  # shallow only
+
+    if not at_least_one_canvas:
+        return None
+
+    return manifest
+
+
+def manifest_inputs(
+    i: File | FileGroup,
+    mets_scans: dict | None = None,
+    image_info: ImageInfoCache | None = IMAGE_INFO_CACHE,
+    session: requests.Session | Requester | None = None,
+    cache: FileCache | None = METS_CACHE,
+    mets_url: str = GAF_METS_URL,
+    failed: list | None = None,
+) -> tuple[dict, dict]:
+    """
+    Collect the scans and image information that a manifest is made of.
+
+    Args:
+        i (File | FileGroup): File or FileGroup of the manifest.
+        mets_scans (dict, optional): Result of `prefetch_scans`.
+        image_info (ImageInfoCache, optional): Image information cache.
+        session (requests.Session | Requester, optional): Session for
+        METS files and image information that are not cached.
+        cache (FileCache, optional): Cache for METS files that were not
+        prefetched. Defaults to METS_CACHE.
+        mets_url (str, optional): Base URL of the METS API.
+        failed (list, optional): METS ids that cannot be retrieved are
+        added to this list. If None, the error is raised.
+
+    Returns:
+        tuple[dict, dict]: The scans per METS id (None if they are not
+        available), and the image information per image service (None
+        if it is not available).
+    """
+    files = i.files() if isinstance(i, FileGroup) else [i]
+
+    scans = {}
+    for f in files:
+        try:
+            scans[f.metsid] = lookup_scans(
+                f.metsid, mets_scans, session=session, cache=cache, mets_url=mets_url
+            )
+        except requests.exceptions.RequestException:
+            if failed is None:
+                raise
+
+            failed.append(f.metsid)
+            scans[f.metsid] = None
+
+    infos = {}
+    for file_scans in scans.values():
+        for _, url in file_scans or []:
+            try:
+                infos[url] = get_image_info(url, cache=image_info, session=session)
+            except requests.exceptions.RequestException:
+                infos[url] = None
+
+    return scans, infos
+
+
+def make_session(pool_size: int = 8) -> requests.Session:
+    """
+    Make a requests Session with a keep-alive connection pool.
+
+    Args:
+        pool_size (int, optional): Maximum number of connections kept
+        open per host. Defaults to 8.
+
+    Returns:
+        requests.Session: Session that can be shared between threads.
+    """
+    session = requests.Session()
+
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def make_requester(max_workers: int = 8, rate: float | None = 25.0) -> Requester:
+    """
+    Make the request layer for the GAF API and the image server.
+
+    Args:
+        max_workers (int, optional): Maximum number of concurrent
+        requests (and size of the connection pool). Defaults to 8.
+        rate (float, optional): Maximum number of requests per second,
+        or None for no limit. Defaults to 25.
+
+    Returns:
+        Requester: Requester that can be shared between threads.
+    """
+    return Requester(
+        make_session(max_workers),
+        rate=rate,
+        max_concurrency=max_workers,
+    )
+
+
+def prefetch_scans(
+    i: Collection | File,
+    max_workers: int = 8,
+    cache: FileCache | None = METS_CACHE,
+    session: requests.Session | Requester | None = None,
+    mets_url: str = GAF_METS_URL,
+) -> dict[str, list[tuple[str, str]]]:
+    """
+    Fetch the scans of all files in a collection concurrently.
+
+    The METS documents of all files in the hierarchy are retrieved
+    through a bounded thread pool that shares one connection pool,
+    so that `to_manifest` can read the scans from memory afterwards.
+
+    Args:
+        i (Collection | File): Fonds, Series, FileGroup or File to prefetch.
+        max_workers (int, optional): Maximum number of concurrent
+        requests to the GAF API. Defaults to 8.
+        cache (FileCache, optional): Cache for METS files, or None to
+        disable caching. Defaults to METS_CACHE.
+        session (requests.Session | Requester, optional): Session to use.
+        Defaults to a new session with a pool of max_workers connections.
+        mets_url (str, optional): Base URL of the METS API.
+
+    Returns:
+        dict[str, list[tuple[str, str]] | None]: Scans per METS id, see
+        `fetch_scans`.
+    """
+    files = i.files() if isinstance(i, Collection) else [i]
+    metsids = list(dict.fromkeys(f.metsid for f in files if f.metsid))
+
+    return fetch_scans(
+        metsids,
+        max_workers=max_workers,
+        cache=cache,
+        session=session,
+        mets_url=mets_url,
+    )
+
+
+def fetch_scans(
+    metsids: list[str],
+    max_workers: int = 8,
+    cache: FileCache | None = METS_CACHE,
+    session: requests.Session | Requester | None = None,
+    mets_url: str = GAF_METS_URL,
+) -> dict[str, list[tuple[str, str]] | None]:
+    """
+    Fetch the scans of some METS ids concurrently.
+
+    METS files that cannot be retrieved get None instead of their
+    scans, so that their manifests are made without them and tried
+    again at the end of the build, see `retry_placeholders`.
+
+    Args:
+        metsids (list[str]): METS identifiers.
+        See `prefetch_scans` for the other arguments.
+
+    Returns:
+        dict[str, list[tuple[str, str]] | None]: Scans per METS id.
+    """
+    if session is None:
+        session = make_session(max_workers)
+
+    def fetch(metsid):
+        try:
+            return get_scans(metsid, cache=cache, session=session, mets_url=mets_url)
+        except requests.exceptions.RequestException as e:
+            print("Could not get METS", metsid, e)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(metsids, executor.map(fetch, metsids)))
+
+
+def prefetch(
+    i: Collection | File,
+    max_workers: int = 8,
+    cache: FileCache | None = METS_CACHE,
+    image_info: ImageInfoCache | None = IMAGE_INFO_CACHE,
+    mets_url: str = GAF_METS_URL,
+    requester: Requester | None = None,
+) -> dict[str, list[tuple[str, str]]]:
+    """
+    Fetch the METS files and image information of a collection.
+
+    Runs `prefetch_scans` and `prefetch_image_info` with one shared
+    requester, so that building the collection afterwards only needs
+    the returned scans and the image information cache.
+
+    Args:
+        i (Collection | File): Fonds, Series, FileGroup or File to prefetch.
+        max_workers (int, optional): Maximum number of concurrent
+        requests. Defaults to 8.
+        cache (FileCache, optional): Cache for METS files, or None to
+        disable caching. Defaults to METS_CACHE.
+        image_info (ImageInfoCache, optional): Image information cache
+        to fill, or None to disable caching. Defaults to IMAGE_INFO_CACHE.
+        mets_url (str, optional): Base URL of the METS API.
+        requester (Requester, optional): Request layer to use. Defaults
+        to a new requester with a pool of max_workers connections.
+
+    Returns:
+        dict[str, list[tuple[str, str]]]: Scans per METS id.
+    """
+    if requester is None:
+        requester = make_requester(max_workers)
+
+    mets_scans = prefetch_scans(
+        i,
+        max_workers=max_workers,
+        cache=cache,
+        session=requester,
+        mets_url=mets_url,
+    )
+
+    prefetch_image_info(
+        (url for scans in mets_scans.values() if scans for _, url in scans),
+        max_workers=max_workers,
+        cache=image_info,
+        session=requester,
+    )
+
+    return mets_scans
+
+
+def lookup_scans(
+    metsid: str,
+    mets_scans: dict | None = None,
+    session: requests.Session | Requester | None = None,
+    cache: FileCache | None = METS_CACHE,
+    mets_url: str = GAF_METS_URL,
+) -> list[tuple[str, str]]:
+    """
+    Get the scans of a METS id, preferably from prefetched results.
+
+    Args:
+        metsid (str): METS identifier.
+        mets_scans (dict, optional): Result of `prefetch_scans`.
+        session (requests.Session | Requester, optional): Session to use
+        if the scans were not prefetched.
+        cache (FileCache, optional): Cache for METS files that were not
+        prefetched, or None to disable caching. Defaults to METS_CACHE.
+        mets_url (str, optional): Base URL of the METS API.
+
+    Raises:
+        requests.exceptions.RequestException: If the METS file cannot be
+        retrieved (or could not be prefetched).
+
+    Returns:
+        list[tuple[str, str]]: List of (file_name, service_info_url).
+    """
+    if mets_scans is not None and metsid in mets_scans:
+        if mets_scans[metsid] is None:
+            raise requests.exceptions.RequestException(
+                f"METS {metsid} could not be retrieved"
+            )
+
+        return mets_scans[metsid]
+
+    return get_scans(metsid, cache=cache, session=session, mets_url=mets_url)
+
+
+def get_scans(
+    metsid: str,
+    cache: FileCache | None = METS_CACHE,
+    session: requests.Session | Requester | None = None,
+    mets_url: str = GAF_METS_URL,
+) -> list[tuple[str, str]]:
+    scans = []
+
+    if metsid:
+        xml = cache.get(metsid) if cache else None
+
+        if xml is None:
+            if cache:
+                METRICS.count("mets_cache_misses")
+
+            url = mets_url + metsid
+            with METRICS.timer("mets_fetch"):
+                response = (session or requests).get(url)
+            response.raise_for_status()  # do not cache error pages
+            xml = response.content
+
+            if cache:
+                cache.set(metsid, xml)
+        else:
+            METRICS.count("mets_cache_hits")
+
+        with METRICS.timer("mets_parse"):
+            mets = ET.fromstring(xml)
+
+            scans = parse_mets(mets)
+
+    return scans
+
+
+def parse_mets(mets) -> list[tuple[str, str]]:
+    """
+    Get the scans from a METS document.
+
+    The labels of the structMap are indexed by ID in one pass, so
+    that finding the label of a file does not need a search through
+    the structMap for every file.
+
+    Args:
+        mets (ET._Element): Root element of the METS document.
+
+    Returns:
+        list[tuple[str, str]]: List of (file_name, service_info_url).
+    """
+    scans = []
+
+    labels = {}
+    for div in METS_STRUCTMAP_DIVS(mets):
+        labels.setdefault(div.get("ID"), div.get("LABEL"))
+
+    for file_el in METS_DISPLAY_FILES(mets):
+        file_id = file_el.get("ID")[:-3]  # without IIP
+        service_info_url = METS_FILE_URL(file_el)[0]
+
+        service_info_url = service_info_url.replace("/iip/", "/iipsrv?IIIF=/")
+
+        file_name = labels[file_id].split("/")[-1]
+
+        scans.append((file_name, service_info_url))
+
+    return scans
+
+
+def get_image_info(
+    url: str,
+    cache: ImageInfoCache | None = IMAGE_INFO_CACHE,
+    session: requests.Session | Requester | None = None,
+) -> dict:
+    """
+    Get the info.json of a IIIF image service, preferably from cache.
+
+    Args:
+        url (str): URL of the IIIF image service.
+        cache (ImageInfoCache, optional): Cache for image information,
+        or None to disable caching. Defaults to IMAGE_INFO_CACHE.
+        session (requests.Session | Requester, optional): Session to use.
+
+    Raises:
+        requests.exceptions.HTTPError: If the image service responds
+        with an error.
+
+    Returns:
+        dict: The image information.
+    """
+    info = cache.get(url) if cache else None
+
+    if info is None:
+        if cache:
+            METRICS.count("info_cache_misses")
+
+        with METRICS.timer("info_fetch"):
+            response = (session or requests).get(f"{url.rstrip('/')}/info.json")
+        if response.status_code != requests.codes.ok:
+            response.raise_for_status()
+        info = response.json()
+
+        if cache:
+            cache.set(url, info)
+    else:
+        METRICS.count("info_cache_hits")
+
+    return info
+
+
+def prefetch_image_info(
+    urls,
+    max_workers: int = 8,
+    cache: ImageInfoCache | None = IMAGE_INFO_CACHE,
+    session: requests.Session | Requester | None = None,
+) -> None:
+    """
+    Fill the image information cache concurrently.
+
+    Services that are already cached are skipped, and services that
+    respond with an error are left out of the cache, so that they
+    are retried (and handled) when the canvas is made.
+
+    Args:
+        urls (Iterable[str]): URLs of IIIF image services.
+        max_workers (int, optional): Maximum number of concurrent
+        requests to the image server. Defaults to 8.
+        cache (ImageInfoCache, optional): Cache to fill, or None if
+        caching is disabled, in which case there is nothing to prefetch.
+        Defaults to IMAGE_INFO_CACHE.
+        session (requests.Session | Requester, optional): Session to use.
+        Defaults to a new session with a pool of max_workers connections.
+    """
+    if cache is None:
+        return  # every canvas requests its own image information
+
+    urls = [url for url in dict.fromkeys(urls) if url not in cache]
+
+    if not urls:
+        return
+
+    if session is None:
+        session = make_session(max_workers)
+
+    def fetch(url):
+        try:
+            get_image_info(url, cache=cache, session=session)
+        except requests.exceptions.RequestException:
+            pass
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(fetch, urls))
+
+
+def make_canvas_from_info(
+    manifest: iiif_prezi3.Manifest,
+    info: dict,
+    anno_id=None,
+    anno_page_id=None,
+    **kwargs,
+) -> iiif_prezi3.Canvas:
+    """
+    Add a canvas for a IIIF image to a manifest from its info.json.
+
+    This does the same as `Manifest.make_canvas_from_iiif`, but it
+    takes the (cached) image information instead of requesting it.
+
+    Args:
+        manifest (iiif_prezi3.Manifest): Manifest to add the canvas to.
+        info (dict): The info.json of the image service.
+        anno_id (str, optional): Id of the painting annotation.
+        anno_page_id (str, optional): Id of the annotation page.
+        **kwargs: See iiif_prezi3.Canvas.
+
+    Returns:
+        iiif_prezi3.Canvas: The new canvas.
+    """
+    canvas = iiif_prezi3.Canvas(**kwargs)
+
+    body = iiif_prezi3.ResourceItem(id="http://example.com", type="Image")
+    body.set_hwd(info.get("height"), info.get("width"))
+
+    if "type" not in info:
+        # IIIF Image API 2: the profile contains the URI plus extra features
+        profile = ""
+        for item in info["profile"]:
+            if isinstance(item, str):
+                profile = item
+                break
+
+        service = iiif_prezi3.ServiceItem1(
+            id=info["@id"], profile=profile, type="ImageService2"
+        )
+        body.service = [service]
+        body.id = f'{info["@id"]}/full/full/0/default.jpg'
+        body.format = "image/jpeg"
+    else:
+        service = iiif_prezi3.ServiceItem(
+            id=info["id"], profile=info["profile"], type=info["type"]
+        )
+        body.service = [service]
+        body.id = f'{info["id"]}/full/max/0/default.jpg'
+        body.format = "image/jpeg"
+
+    annotation = iiif_prezi3.Annotation(
+        id=anno_id, motivation="painting", body=body, target=canvas.id
+    )
+
+    annotation_page = iiif_prezi3.AnnotationPage(id=anno_page_id)
+    annotation_page.add_item(annotation)
+
+    canvas.add_item(annotation_page)
+    canvas.set_hwd(info["height"], info["width"])
+
+    manifest.add_item(canvas)
+
+    return canvas
+
+
+def canvases_v2(
+    i: File | FileGroup,
+    manifest_id: str,
+    mets_scans: dict | None = None,
+    cache: FileCache | None = METS_CACHE,
+    mets_url: str = GAF_METS_URL,
+    image_info: ImageInfoCache | None = IMAGE_INFO_CACHE,
+    requester: Requester | None = None,
+) -> list[dict]:
+    """
+    The canvases of a manifest, for its Presentation 2.x version.
+
+    The ids and labels are those of the canvases of the 3.0 manifest.
+    Scans without image information (placeholder canvases) are left out.
+
+    Args:
+        i (File | FileGroup): File or FileGroup of the manifest.
+        manifest_id (str): Id of the (3.0) manifest.
+        mets_scans (dict, optional): Result of `prefetch_scans`.
+        cache (FileCache, optional): Cache for METS files that were not
+        prefetched. Defaults to METS_CACHE.
+        mets_url (str, optional): Base URL of the METS API.
+        image_info (ImageInfoCache, optional): Image information cache.
+        requester (Requester, optional): Request layer for what is not
+        prefetched or cached.
+
+    Returns:
+        list[dict]: Canvases with their "id", "label" and "info".
+    """
+    canvases = []
+
+    ranges = manifest_ranges(
+        i,
+        mets_scans,
+        session=requester,
+        cache=cache,
+        mets_url=mets_url,
+        failed=[],  # left out
+    )
+    scans = [scan for r in ranges for scan in r["scans"]]
+
+    # Numbered as in `iter_canvases`, also if a scan is left out
+    for n, (file_name, iiif_service_info) in enumerate(scans, 1):
+        try:
+            info = get_image_info(
+                iiif_service_info, cache=image_info, session=requester
+            )
+        except requests.exceptions.RequestException:
+            continue
+
+        canvases.append(
+            {
+                "id": f"{manifest_id}/canvas/p{n}",
+                "label": scan_label(file_name),
+                "info": info,
+            }
+        )
+
+    return canvases
+
+
+def make_manifest_v2(id: str, label: str, canvases: list[dict]) -> dict:
+    """
+    Make a IIIF Presentation 2.x manifest, as `ManifestFactory` of the
+    iiif-prezi package does.
+
+    Args:
+        id (str): Id of the manifest.
+        label (str): Label of the manifest.
+        canvases (list[dict]): Canvases with their "id", "label",
+        "metadata" (a dict) and "info" (the info.json of the image).
+
+    Returns:
+        dict: The manifest.
+    """
+    items = []
+
+    for c in canvases:
+        info = c["info"]
+        items.append(
+            iiif_v2.canvas(
+                c["id"],
+                c["label"],
+                c["metadata"],
+                info.get("@id", info.get("id")),
+                info["height"],
+                info["width"],
+            )
+        )
+
+    return iiif_v2.manifest(id, label, items)
+
+
+def write_manifests_v2(
+    fondses: list[Fonds],
+    v2_manifests: dict[str, list[str]],
+    base_url_manifests: str,
+    target_dir: str,
+    base_url_v2: str = V2_BASE_URL,
+    use_filegroup: bool = False,
+    mets_scans: dict | None = None,
+    cache: FileCache | None = METS_CACHE,
+    mets_url: str = GAF_METS_URL,
+    image_info: ImageInfoCache | None = IMAGE_INFO_CACHE,
+    requester: Requester | None = None,
+    max_workers: int = 8,
+) -> int:
+    """
+    Write Presentation 2.x manifests (e.g. for Recogito) of some series.
+
+    Every v2 manifest combines the canvases of all manifests in one or
+    more collections, with the metadata of their manifest, in the same
+    order as in the 3.0 collections. The canvases are made from the
+    hierarchy and the scans of the build, not from the written files.
+
+    Args:
+        fondses (list[Fonds]): The hierarchies of the build.
+        v2_manifests (dict[str, list[str]]): For the name of every v2
+        manifest, the paths of its collections (e.g.
+        "4.VEL/B/B.3/B.3.16.json"). Manifests with collections that are
+        not in the fondses are skipped.
+        base_url_manifests (str): Base URL for the (3.0) manifests.
+        target_dir (str): Folder to write the v2 manifests to.
+        base_url_v2 (str, optional): Base URL for the v2 manifests.
+        use_filegroup (bool, optional): A FileGroup is one manifest, as in
+        the build. Defaults to False.
+        mets_scans (dict, optional): Result of `prefetch_scans`. If None,
+        the scans of the collections are prefetched (from the METS
+        cache, after a build).
+        cache (FileCache, optional): Cache for METS files.
+        mets_url (str, optional): Base URL of the METS API.
+        image_info (ImageInfoCache, optional): Image information cache.
+        requester (Requester, optional): Request layer for what is not
+        prefetched or cached.
+        max_workers (int, optional): Number of concurrent requests for
+        the prefetch. Defaults to 8.
+
+    Returns:
+        int: Number of v2 manifests written.
+    """
+    # The collections of the build by their path, as in `to_collection`
+    collections = {}
+
+    def add_collections(i, prefix=""):
+        collections[f"{prefix}{i.code}.json"] = (i, f"{prefix}{i.code}/")
+
+        for c in i.hasPart:
+            if isinstance(c, Series) or (
+                isinstance(c, FileGroup) and not use_filegroup
+            ):
+                add_collections(c, f"{prefix}{i.code}/")
+
+    for fonds in fondses:
+        add_collections(fonds)
+
+    written = 0
+    for name, paths in v2_manifests.items():
+        if not all(path in collections for path in paths):
+            continue
+
+        canvases = []
+        for path in paths:
+            i, parts_prefix = collections[path]
+
+            if mets_scans is None:
+                scans = prefetch(
+                    i,
+                    max_workers=max_workers,
+                    cache=cache,
+                    image_info=image_info,
+                    mets_url=mets_url,
+                    requester=requester,
+                )
+            else:
+                scans = mets_scans
+
+            # The manifests in the collection, sub-collections are left out
+            for c in i.hasPart:
+                if not (
+                    isinstance(c, File) or (isinstance(c, FileGroup) and use_filegroup)
+                ):
+                    continue
+
+                label = f"{c.code} - {c.title}".strip()
+                metadata = {
+                    m["label"]["en"][0]: m["value"]["en"][0]
+                    for m in file_metadata(c)
+                }
+
+                for canvas in canvases_v2(
+                    c,
+                    f"{base_url_manifests}{parts_prefix}{c.code}.json",
+                    mets_scans=scans,
+                    cache=cache,
+                    mets_url=mets_url,
+                    image_info=image_info,
+                    requester=requester,
+                ):
+                    canvas_label = canvas["label"].strip()
+                    canvas["label"] = f"{canvas_label} - {label}"
+                    canvas["metadata"] = {"Label": canvas_label, **metadata}
+                    canvases.append(canvas)
+
+        manifest = make_manifest_v2(f"{base_url_v2}{name}.json", name, canvases)
+
+        os.makedirs(target_dir, exist_ok=True)
+        with open(os.path.join(target_dir, f"{name}.json"), "w") as outfile:
+            json.dump(manifest, outfile, indent=4)
+
+        METRICS.count("v2_manifests_written")
+        written += 1
+
+    return written
+
+
+def parse_ead(ead_file_path: str, filter_codes: set = set()) -> Fonds:
+    tree = ET.parse(ead_file_path)
+
+    fonds_code = tree.find("eadheader/eadid").text
+    fonds_title = tree.find("eadheader/filedesc/titlestmt/titleproper").text
+    permalink = tree.find("eadheader/eadid[@url]").attrib["url"]
+
+    fonds = Fonds(
+        code=fonds_code,
+        title=fonds_title,
+        uri=permalink,
+    )
+
+    series_els = tree.findall(".//c[@level='series']")
+    subseries_els = tree.findall(".//dsc[@type='combined']/c[@level='subseries']")
+    dsc_el = tree.find(".//dsc[@type='combined']")
+    if series_els:
+        for series_el in series_els:
+            s = get_series(series_el, filter_codes=filter_codes)
+            fonds.hasPart.append(s)
+    elif subseries_els:
+        for subseries_el in subseries_els:
+            s = get_series(subseries_el, filter_codes=filter_codes)
+            fonds.hasPart.append(s)
+    elif dsc_el is not None:
+        parts = get_file_and_filegrp_els(dsc_el, filter_codes=filter_codes)
+        fonds.hasPart += parts
+
+    return fonds
+
+
+def c_kind(el) -> str | None:
+    """
+    Kind of part that a `c` element is made into: "file", "filegrp",
+    "series" or None (ignored). Same precedence as in
+    `get_file_and_filegrp_els`.
+    """
+    if el.get("level") == "file":
+        return "file"
+    elif el.get("otherlevel") == "filegrp":
+        return "filegrp"
+    elif el.get("level") in ("subseries", "series"):
+        return "series"
+
+
+def iterparse_ead(ead_file_path: str, filter_codes: set = set()) -> Fonds:
+    """
+    Parse an EAD file in a single streaming pass.
+
+    Gives the same hierarchy as `parse_ead`, but instead of loading
+    the whole document and searching it several times, the file is
+    read with `iterparse`. Every `c` element is turned into a File,
+    FileGroup or Series as soon as it is complete, after which it is
+    removed from the tree. Memory use therefore depends on the depth
+    of the hierarchy, not on the size of the EAD.
+
+    Args:
+        ead_file_path (str): Path to the EAD file.
+        filter_codes (set, optional): Inventory numbers to include.
+        Defaults to all.
+
+    Returns:
+        Fonds: The parsed hierarchy.
+    """
+
+    fonds = None
+    series = []  # (document order, Series) of all c[@level='series']
+    subseries = []  # Series of dsc[@type='combined']/c[@level='subseries']
+    dsc_parts = None  # Parts of the first dsc[@type='combined']
+
+    # For each open c or dsc element: [element, build, recurse, parts, order]
+    stack = []
+    order = count()
+
+    for event, el in ET.iterparse(ead_file_path, events=("start", "end")):
+        if event == "start":
+            if el.tag == "dsc":
+                combined = el.get("type") == "combined"
+                stack.append([el, combined, combined, [], None])
+
+            elif el.tag == "c":
+                parent_recurses = bool(stack) and stack[-1][2]
+                k = c_kind(el)
+
+                build = k is not None and (
+                    el.get("level") == "series" or parent_recurses
+                )
+                stack.append([el, build, build and k != "file", [], next(order)])
+
+            continue
+
+        if el.tag == "eadheader" and fonds is None:
+            fonds = Fonds(
+                code=el.find("eadid").text,
+                title=el.find("filedesc/titlestmt/titleproper").text,
+                uri=el.find("eadid[@url]").attrib["url"],
+            )
+            el.clear()
+
+        elif el.tag == "dsc":
+            _, combined, _, parts, _ = stack.pop()
+            if combined and dsc_parts is None:
+                dsc_parts = parts
+            el.clear()
+
+        elif el.tag == "c":
+            _, build, _, parts, position = stack.pop()
+
+            if build:
+                k = c_kind(el)
+                if k == "file":
+                    i = get_file(el, filter_codes)
+                elif k == "filegrp":
+                    i = get_filegrp(el, filter_codes, parts=parts)
+                else:
+                    i = get_series(el, filter_codes, parts=parts)
+
+                parent = el.getparent()
+                if el.get("level") == "series":
+                    series.append((position, i))
+                elif (
+                    el.get("level") == "subseries"
+                    and parent.tag == "dsc"
+                    and parent.get("type") == "combined"
+                ):
+                    subseries.append(i)
+
+                # Add to the parts of the parent, if it collects them
+                if i and stack and stack[-1][2] and el.get("level") != "series":
+                    stack[-1][3].append(i)
+
+            # Everything needed is extracted, so drop the element
+            el.clear()
+            el.getparent().remove(el)
+
+        elif el.getparent() is not None and el.getparent().tag == "archdesc":
+            el.clear()
+
+    if series:
+        fonds.hasPart += [s for _, s in sorted(series, key=lambda x: x[0])]
+    elif subseries:
+        fonds.hasPart += subseries
+    elif dsc_parts is not None:
+        fonds.hasPart += dsc_parts
+
+    return fonds
+
+
+def load_ead(
+    ead_file_path: str,
+    filter_codes: set = set(),
+    snapshots: FileCache | None = EAD_SNAPSHOTS,
+) -> Fonds:
+    """
+    Get the hierarchy of an EAD file, from a snapshot if possible.
+
+    The first time an EAD file is seen, it is parsed with
+    `iterparse_ead` and the complete hierarchy is stored as a pickled
+    snapshot, keyed by the SHA-256 hash of the file. As long as the
+    file does not change, later calls load the snapshot instead, which
+    is much faster than parsing the XML. The filter on inventory
+    numbers is applied afterwards, so that one snapshot serves every
+    selection.
+
+    Snapshots are only read from the local cache folder, that must be
+    trusted like the other caches (unpickling runs code).
+
+    Args:
+        ead_file_path (str): Path to the EAD file.
+        filter_codes (set, optional): Inventory numbers to include.
+        Defaults to all.
+        snapshots (FileCache, optional): Cache of the snapshots, or None
+        to always parse the file. Defaults to EAD_SNAPSHOTS.
+
+    Returns:
+        Fonds: The parsed hierarchy.
+    """
+    if snapshots is None:
+        return iterparse_ead(ead_file_path, filter_codes=filter_codes)
+
+    key = f"{file_digest(ead_file_path)}-v{EAD_SNAPSHOT_VERSION}"
+
+    data = snapshots.get(key)
+    if data is not None:
+        METRICS.count("ead_snapshot_hits")
+        fonds = pickle.loads(data)
+    else:
+        METRICS.count("ead_snapshot_misses")
+        fonds = iterparse_ead(ead_file_path)
+        intern_strings(fonds)
+        snapshots.set(key, pickle.dumps(fonds, protocol=pickle.HIGHEST_PROTOCOL))
+
+    if filter_codes:
+        fonds = filter_collection(fonds, filter_codes)
+
+    return fonds
+
+
+def intern_strings(c: Collection) -> None:
+    """
+    Intern the titles and dates in a hierarchy, in place.
+
+    Many files share a date (and some a title), so that every distinct
+    value is kept in memory, and pickled, only once.
+
+    Args:
+        c (Collection): Fonds, Series or FileGroup.
+    """
+    for i in c.hasPart:
+        i.title = sys.intern(i.title)
+        if isinstance(i, (File, FileGroup)) and i.date:
+            i.date = sys.intern(i.date)
+
+        if isinstance(i, Collection):
+            intern_strings(i)
+
+
+def filter_collection(c: Collection, filter_codes: set) -> Collection:
+    """
+    Copy a collection with only the files of a selection.
+
+    Gives the same hierarchy as parsing with the same `filter_codes`:
+    Series and FileGroups are kept, even if none of their files are
+    selected.
+
+    Args:
+        c (Collection): Fonds, Series or FileGroup.
+        filter_codes (set): Inventory numbers to include.
+
+    Returns:
+        Collection: Filtered copy of the collection.
+    """
+    parts = [
+        filter_collection(i, filter_codes) if isinstance(i, Collection) else i
+        for i in c.hasPart
+        if isinstance(i, Collection) or i.code in filter_codes
+    ]
+
+    return replace(c, hasPart=parts)
+
+
+def file_digest(path: str) -> str:
+    """
+    Hash the contents of a file.
+
+    Args:
+        path (str): Path of the file.
+
+    Returns:
+        str: Hexadecimal SHA-256 digest.
+    """
+    with open(path, "rb") as infile:
+        return hashlib.sha256(infile.read()).hexdigest()
+
+
+C_ELEMENT_TAGS = re.compile(rb"<!--.*?-->|<c[\s>]|</c\s*>", re.DOTALL)
+
+
+def c_element_offsets(data: bytes) -> list[tuple[int, int]]:
+    """
+    Find the byte range of every `c` element in an XML document.
+
+    Args:
+        data (bytes): The XML document.
+
+    Returns:
+        list[tuple[int, int]]: Start and end offset of every `c`
+        element, in document order (the order of their start tags).
+    """
+    offsets = []
+    stack = []
+
+    for match in C_ELEMENT_TAGS.finditer(data):
+        tag = match.group()
+
+        if tag.startswith(b"<!--"):
+            continue
+        elif tag.startswith(b"</"):
+            n = stack.pop()
+            offsets[n] = (offsets[n][0], match.end())
+        else:
+            stack.append(len(offsets))
+            offsets.append((match.start(), -1))
+
+    return offsets
+
+
+def index_ead(
+    ead_file_path: str,
+    snapshots: FileCache | None = EAD_SNAPSHOTS,
+) -> tuple[str, list[dict]]:
+    """
+    Index the files of an EAD by their place in the document.
+
+    For every file in the hierarchy of `iterparse_ead`, the entry has
+    its inventory number, handle and METS id, and the path from the
+    top-level part of the fonds down to the file. Every part on the
+    path has its kind ("series", "filegrp" or "file"), its code, and
+    the byte offset and length of its `c` element in the EAD, so that
+    the part can later be parsed on its own (see `read_part`).
+
+    Args:
+        ead_file_path (str): Path to the EAD file.
+        snapshots (FileCache, optional): Cache of the EAD snapshots,
+        used to check the entries against the hierarchy. Defaults to
+        EAD_SNAPSHOTS.
+
+    Returns:
+        tuple[str, list[dict]]: Code of the fonds, and the entries in
+        document order.
+    """
+    with open(ead_file_path, "rb") as infile:
+        data = infile.read()
+
+    offsets = c_element_offsets(data)
+
+    fonds_code = ""
+    entries = []
+
+    # For each open c or dsc element: [number, kind, build, recurse, path]
+    stack = []
+    order = count()
+
+    for event, el in ET.iterparse(io.BytesIO(data), events=("start", "end")):
+        if event == "start":
+            if el.tag == "dsc":
+                combined = el.get("type") == "combined"
+                stack.append([None, None, combined, combined, []])
+
+            elif el.tag == "c":
+                # Same selection as in iterparse_ead
+                parent_recurses = bool(stack) and stack[-1][3]
+                k = c_kind(el)
+
+                build = k is not None and (
+                    el.get("level") == "series" or parent_recurses
+                )
+                if el.get("level") == "series" or not stack:
+                    path = []  # every series is a top-level part
+                else:
+                    path = stack[-1][4]
+                stack.append([next(order), k, build, build and k != "file", path])
+
+            continue
+
+        if el.tag == "eadheader" and not fonds_code:
+            fonds_code = el.find("eadid").text
+
+        elif el.tag == "did" and el.getparent().tag == "c" and stack[-1][2]:
+            # The did of a part comes before its sub-parts, so that the
+            # path is complete before they are reached
+            n, k, _, _, path = stack[-1]
+            c_el = el.getparent()
+            start, end = offsets[n]
+
+            if k == "file":
+                i = get_file(c_el)
+            elif k == "filegrp":
+                i = get_filegrp(c_el, parts=[])
+            else:
+                i = get_series(c_el, parts=[])
+
+            if i is None:
+                continue
+
+            path = path + [
+                {"kind": k, "code": i.code, "offset": start, "length": end - start}
+            ]
+            stack[-1][4] = path
+
+            if k == "file":
+                entries.append(
+                    {
+                        "fonds": fonds_code,
+                        "ead": ead_file_path,
+                        "inventory": i.code,
+                        "handle": i.uri,
+                        "metsid": i.metsid,
+                        "parts": path,
+                    }
+                )
+
+        elif el.tag in ("c", "dsc"):
+            stack.pop()
+            el.clear()
+
+    # Leave out files that are not in the hierarchy (e.g. outside of the
+    # part of the EAD that iterparse_ead uses)
+    def file_paths(c, path=()):
+        for i in c.hasPart:
+            if isinstance(i, File):
+                yield path + (i.code,)
+            else:
+                yield from file_paths(i, path + (i.code,))
+
+    paths = set(file_paths(load_ead(ead_file_path, snapshots=snapshots)))
+    entries = [e for e in entries if tuple(p["code"] for p in e["parts"]) in paths]
+
+    return fonds_code, entries
+
+
+def update_inventory_index(
+    ead_file_paths: list[str],
+    index: InventoryIndex,
+    snapshots: FileCache | None = EAD_SNAPSHOTS,
+) -> int:
+    """
+    Index the EAD files that changed since they were last indexed.
+
+    Args:
+        ead_file_paths (list[str]): Paths to the EAD files.
+        index (InventoryIndex): The index to update.
+        snapshots (FileCache, optional): Cache of the EAD snapshots.
+        Defaults to EAD_SNAPSHOTS.
+
+    Returns:
+        int: Number of (re)indexed EAD files.
+    """
+    updated = 0
+
+    for path in ead_file_paths:
+        digest = file_digest(path)
+        if index.get(f"ead:{path}") == digest:
+            continue
+
+        fonds_code, entries = index_ead(path, snapshots=snapshots)
+        index.add_fonds(fonds_code, path, digest, entries)
+        print("Indexed", len(entries), "files of", fonds_code)
+
+        updated += 1
+
+    return updated
+
+
+def read_part(ead_file_path: str, part: dict) -> File | FileGroup | Series | None:
+    """
+    Parse one part of an EAD, from its entry in the inventory index.
+
+    Only the bytes of its `c` element are read and parsed.
+
+    Args:
+        ead_file_path (str): Path to the EAD file.
+        part (dict): Part on the path of an entry of `index_ead`.
+
+    Returns:
+        File | FileGroup | Series | None: The part with its sub-parts.
+    """
+    with open(ead_file_path, "rb") as infile:
+        infile.seek(part["offset"])
+        el = ET.fromstring(infile.read(part["length"]))
+
+    if part["kind"] == "file":
+        return get_file(el)
+    elif part["kind"] == "filegrp":
+        return get_filegrp(el)
+    else:
+        return get_series(el)
+
+
+def build_manifests(
+    identifiers: list[str],
+    base_url: str,
+    target_dir: str,
+    fonds_code: str = "",
+    use_filegroup: bool = False,
+    index: InventoryIndex | None = None,
+    cache: FileCache | None = METS_CACHE,
+    mets_url: str = GAF_METS_URL,
+    image_info: ImageInfoCache | None = IMAGE_INFO_CACHE,
+    build_state: BuildState | None = None,
+    fast_json: bool = False,
+    requester: Requester | None = None,
+    quiet: bool = False,
+) -> list:
+    """
+    Build the manifests of a few files, without parsing their EADs.
+
+    The files are looked up in the inventory index, after which only
+    the `c` element of each manifest (the file, or with use_filegroup
+    the filegroup it is in) is read from the EAD. The manifests are
+    written to the same paths as in a full build; since their ids and
+    labels do not change, the collections are left as they are.
+
+    Entries of EAD files that changed since they were indexed are
+    indexed again first.
+
+    Args:
+        identifiers (list[str]): Inventory numbers, handles or METS ids.
+        base_url (str): Base URL for the manifests.
+        target_dir (str): Folder to write the IIIF files to.
+        fonds_code (str, optional): Only look in this fonds (inventory
+        numbers are only unique within a fonds). Defaults to all.
+        use_filegroup (bool, optional): Make a single manifest for a
+        FileGroup. Defaults to False.
+        index (InventoryIndex, optional): The inventory index. Defaults
+        to the index in data/cache/.
+        cache (FileCache, optional): Cache for METS files, or None to
+        disable caching. Defaults to METS_CACHE.
+        mets_url (str, optional): Base URL of the METS API.
+        image_info (ImageInfoCache, optional): Image information cache.
+        build_state (BuildState, optional): Hashes of earlier builds. If
+        given, only manifests with changed inputs are written.
+        fast_json (bool, optional): Make the manifests with `iiif_json`
+        instead of iiif_prezi3. Defaults to False.
+        requester (Requester, optional): Request layer for the METS files
+        and image information that are not cached.
+        quiet (bool, optional): Do not print a line for every manifest
+        and canvas. Defaults to False.
+
+    Returns:
+        list: The manifests (None for files without scans).
+    """
+    if index is None:
+        index = InventoryIndex()
+
+    def lookup():
+        return {i: index.lookup(i, fonds_code) for i in identifiers}
+
+    found = lookup()
+    ead_file_paths = sorted({e["ead"] for es in found.values() for e in es})
+    if update_inventory_index(ead_file_paths, index):
+        found = lookup()  # offsets changed
+
+    entries = []
+    for identifier, identifier_entries in found.items():
+        if not identifier_entries:
+            print("Not in the index:", identifier)
+        entries += identifier_entries
+
+    manifests = []
+    done = set()
+
+    for entry in entries:
+        parts = entry["parts"]
+
+        n = len(parts) - 1
+        if use_filegroup:
+            n = next(k for k, p in enumerate(parts) if p["kind"] in ("filegrp", "file"))
+
+        if (entry["ead"], parts[n]["offset"]) in done:
+            continue
+        done.add((entry["ead"], parts[n]["offset"]))
+
+        prefix = "/".join([entry["fonds"]] + [p["code"] for p in parts[:n]]) + "/"
+
+        manifests.append(
+            to_manifest(
+                read_part(entry["ead"], parts[n]),
+                base_url,
+                target_dir,
+                prefix=prefix,
+                cache=cache,
+                mets_url=mets_url,
+                image_info=image_info,
+                build_state=build_state,
+                fast_json=fast_json,
+                requester=requester,
+                quiet=quiet,
+            )
+        )
+
+    return manifests
+
+
+def get_series(
+    series_el, filter_codes: set = set(), parts: list | None = None
+) -> Series:
+    series_code_el = series_el.find("did/unitid[@type='series_code']")
+    series_title = "".join(series_el.find("did/unittitle").itertext()).strip()
+
+    while "  " in series_title:  # double space
+        series_title = series_title.replace("  ", " ")
+
+    if series_code_el is not None:
+        series_code = normalize_id(series_code_el.text)
+    else:
+        series_code = normalize_title(series_title)
+
+    s = Series(code=series_code, title=series_title)
+
+    if parts is None:
+        parts = get_file_and_filegrp_els(series_el, filter_codes=filter_codes)
+    s.hasPart += parts
+
+    return s
+
+
+def get_file_and_filegrp_els(series_el, filter_codes: set = set()):
+    parts = []
+
+    file_and_filegrp_els = series_el.xpath("child::*")
     for el in file_and_filegrp_els:
         if el.get("level") == "file":
             i = get_file(el, filter_codes)
@@ -564,7 +2917,9 @@ def get_file_and_filegrp_els(series_el, filter_codes: set = set()):
     return parts
 
 
-def get_filegrp(filegrp_el, filter_codes: set = set()) -> FileGroup:
+def get_filegrp(
+    filegrp_el, filter_codes: set = set(), parts: list | None = None
+) -> FileGroup:
     filegrp_code = normalize_id(filegrp_el.find("did/unitid").text)
 
     # Title
@@ -588,7 +2943,8 @@ def get_filegrp(filegrp_el, filter_codes: set = set()) -> FileGroup:
         date=date,
     )
 
-    parts = get_file_and_filegrp_els(filegrp_el, filter_codes=filter_codes)
+    if parts is None:
+        parts = get_file_and_filegrp_els(filegrp_el, filter_codes=filter_codes)
     filegrp.hasPart += parts
 
     return filegrp
@@ -648,6 +3004,27 @@ def main(
     filter_codes_path: str = "",
     use_filegroup: bool = False,
     target_dir: str = "iiif/",
+    max_workers: int = 8,
+    mets_url: str = GAF_METS_URL,
+    cache_path: str = "data/cache/",
+    compress_cache: bool = False,
+    image_info_path: str = "data/cache/image_info.sqlite",
+    snapshot_path: str = "data/cache/ead/",
+    incremental: bool = False,
+    build_state_path: str = "data/cache/build_state.sqlite",
+    fast_json: bool = False,
+    rate: float | None = 25.0,
+    quiet: bool = False,
+    metrics_path: str = "",
+    prometheus_path: str = "",
+    low_memory: bool = False,
+    pipeline: bool = False,
+    canvas_workers: int = 2,
+    write_workers: int = 2,
+    page_size: int = 0,
+    v2_config_path: str = "",
+    v2_target_dir: str = "static/manifests/v2/",
+    base_url_v2: str = V2_BASE_URL,
 ) -> None:
     """
     Generate IIIF Collections and Manifests from an EAD file.
@@ -655,8 +3032,53 @@ def main(
     Args:
         ead_file_path (str): Path to the EAD file.
         base_url (str): Base URL for the manifests.
-        filter_codes_path (str, optional): Path to a JSON file with a list of inventory numbers to include. Defaults to "".
-        hwd_data_path (str, optional): Path to a JSON file with the height and width of each scan. Defaults to "".
+        filter_codes_path (str, optional): Path to a JSON file with a list of inventory
+        numbers to include. Defaults to "".
+        max_workers (int, optional): Number of concurrent METS requests. Defaults to 8.
+        mets_url (str, optional): Base URL of the METS API. Defaults to the GAF API.
+        cache_path (str, optional): Folder of the METS cache, or "" to disable it.
+        Defaults to "data/cache/".
+        compress_cache (bool, optional): Store new METS files gzip compressed. Defaults
+        to False.
+        image_info_path (str, optional): Path of the image information (height, width
+        and service) cache. Defaults to "data/cache/image_info.sqlite".
+        snapshot_path (str, optional): Folder of the pre-parsed EAD snapshots (see
+        `load_ead`), or "" to always parse the EAD file. Defaults to "data/cache/ead/".
+        incremental (bool, optional): Only write the manifests whose inputs (EAD record,
+        scans and image information) changed since the previous build, and the
+        collections on their path. Defaults to False.
+        build_state_path (str, optional): Path of the input hashes of the previous
+        build. Defaults to "data/cache/build_state.sqlite".
+        fast_json (bool, optional): Write compact JSON with the lightweight `iiif_json`
+        emitter instead of iiif_prezi3. Defaults to False.
+        rate (float, optional): Maximum number of requests per second to the GAF API and
+        the image server, or None for no limit. Defaults to 25.
+        quiet (bool, optional): Do not print a line for every manifest and canvas.
+        Defaults to False.
+        metrics_path (str, optional): Path to write the timers and counters of the build
+        to as JSON, or "" to not write them. Defaults to "".
+        prometheus_path (str, optional): Path to write the timers and counters to in the
+        Prometheus text format, or "" to not write them. Defaults to "".
+        low_memory (bool, optional): Keep only a shallow reference to every manifest
+        once it is written, so that memory is bounded by the largest manifest instead of
+        the whole fonds. Defaults to False.
+        pipeline (bool, optional): Fetch, build and write the manifests in a staged
+        pipeline (see `build_pipeline`) instead of prefetching everything first. Always
+        keeps only references to the manifests. Defaults to False.
+        canvas_workers (int, optional): Threads that construct manifests in the
+        pipeline. Defaults to 2.
+        write_workers (int, optional): Threads that serialize and write manifests in the
+        pipeline. Defaults to 2.
+        page_size (int, optional): Split collections with more items into pages of this
+        many items, nested sub-collections that are referenced from the collection
+        (`{prefix}{code}/page-{n}.json`), so that viewers can load them progressively.
+        Defaults to 0 (no pages).
+        v2_config_path (str, optional): Path to a JSON file with, for the name of every
+        IIIF Presentation 2.x manifest to write, the paths of its collections (see
+        `write_manifests_v2`). Defaults to "" (no v2 manifests).
+        v2_target_dir (str, optional): Folder to write the v2 manifests to. Defaults to
+        "static/manifests/v2/".
+        base_url_v2 (str, optional): Base URL for the v2 manifests.
 
     Returns:
         None
@@ -669,29 +3091,381 @@ def main(
     else:
         code_selection = []
 
+    # Series to write Presentation 2.x manifests of
+    if v2_config_path:
+        with open(v2_config_path, "r") as infile:
+            v2_manifests = json.load(infile)
+    else:
+        v2_manifests = {}
+
     # Parse EAD, filter on relevant inventory numbers
-    fonds = parse_ead(ead_file_path, filter_codes=code_selection)
+    start = time.perf_counter()
+    snapshots = FileCache(snapshot_path, suffix=".pickle") if snapshot_path else None
+    fonds = load_ead(ead_file_path, filter_codes=code_selection, snapshots=snapshots)
+
+    with METRICS.fonds(fonds.code):
+        METRICS.add_time("ead_parse", time.perf_counter() - start)
+
+        # Fetch all METS files and image information up front
+        cache = FileCache(cache_path, compress=compress_cache) if cache_path else None
+        image_info = ImageInfoCache(image_info_path)
+        requester = make_requester(max_workers, rate=rate)
+        if pipeline:
+            mets_scans = {}  # fetched in the pipeline
+        else:
+            with METRICS.timer("prefetch"):
+                mets_scans = prefetch(
+                    fonds,
+                    max_workers=max_workers,
+                    cache=cache,
+                    image_info=image_info,
+                    mets_url=mets_url,
+                    requester=requester,
+                )
 
-    # Generate IIIF Collections and Manifests from hierarchy
-    to_collection(
-        fonds,
-        base_url_collections,
-        target_dir,
-        base_url_manifests=base_url_manifests,
-        use_filegroup=use_filegroup,
+        build_state = BuildState(build_state_path) if incremental else None
+
+        # Generate IIIF Collections and Manifests from hierarchy
+        config = BuildConfig(
+            base_url=base_url_collections,
+            target_dir=target_dir,
+            base_url_manifests=base_url_manifests,
+            use_filegroup=use_filegroup,
+            mets_scans=mets_scans,
+            cache=cache,
+            mets_url=mets_url,
+            image_info=image_info,
+            build_state=build_state,
+            fast_json=fast_json,
+            requester=requester,
+            retry_queue=[],
+            quiet=quiet,
+            low_memory=low_memory,
+            page_size=page_size,
+        )
+
+        with METRICS.timer("build"):
+            if pipeline:
+                build_pipeline(
+                    fonds,
+                    config,
+                    scan_workers=max_workers,
+                    canvas_workers=canvas_workers,
+                    write_workers=write_workers,
+                )
+            else:
+                to_collection(fonds, config)
+
+        if config.retry_queue:
+            with METRICS.timer("retry"):
+                changed = retry_placeholders(
+                    config.retry_queue, config, max_workers=max_workers
+                )
+
+                # Add the manifests that were empty to their collections
+                if changed:
+                    remake_collections(fonds, changed, config)
+
+        if v2_manifests:
+            with METRICS.timer("v2"):
+                write_manifests_v2(
+                    [fonds],
+                    v2_manifests,
+                    base_url_manifests,
+                    v2_target_dir,
+                    base_url_v2=base_url_v2,
+                    use_filegroup=use_filegroup,
+                    mets_scans=None if pipeline else mets_scans,
+                    cache=cache,
+                    mets_url=mets_url,
+                    image_info=image_info,
+                    requester=requester,
+                    max_workers=max_workers,
+                )
+
+    if cache:
+        print("METS cache", cache.stats())
+    print("Image info cache", image_info.stats())
+    print("Requests", requester.stats())
+
+    write_metrics(metrics_path, prometheus_path)
+
+
+def build_parallel(
+    ead_file_paths: list[str],
+    processes: int | None = None,
+    base_url_collections: str = "https://example.org/",
+    base_url_manifests: str = "https://example.org/",
+    filter_codes_path: str = "",
+    use_filegroup: bool = False,
+    target_dir: str = "iiif/",
+    max_workers: int = 8,
+    mets_url: str = GAF_METS_URL,
+    cache_path: str = "data/cache/",
+    compress_cache: bool = False,
+    image_info_path: str = "data/cache/image_info.sqlite",
+    snapshot_path: str = "data/cache/ead/",
+    incremental: bool = False,
+    build_state_path: str = "data/cache/build_state.sqlite",
+    fast_json: bool = False,
+    rate: float | None = 25.0,
+    quiet: bool = False,
+    metrics_path: str = "",
+    prometheus_path: str = "",
+    low_memory: bool = False,
+    page_size: int = 0,
+    v2_config_path: str = "",
+    v2_target_dir: str = "static/manifests/v2/",
+    base_url_v2: str = V2_BASE_URL,
+) -> None:
+    """
+    Generate IIIF Collections and Manifests from several EAD files in parallel.
+
+    All EAD files are parsed first, after which every top-level part
+    of every fonds (usually a Series) is built in a process pool. The
+    collection of each fonds is written at the end from the parts in
+    their original order, so the output is the same as that of `main`.
+
+    Args:
+        ead_file_paths (list[str]): Paths to the EAD files.
+        processes (int, optional): Number of processes, at most max_workers. Defaults to
+        the number of CPUs.
+        max_workers (int, optional): Maximum number of concurrent requests, shared
+        equally by the processes. Defaults to 8.
+        rate (float, optional): Maximum number of requests per second, shared equally by
+        the processes, or None for no limit. Defaults to 25.
+        See `main` for the other arguments.
+
+    Returns:
+        None
+    """
+
+    # Restrict to a selection of inventory numbers
+    if filter_codes_path:
+        with open(filter_codes_path, "r") as infile:
+            code_selection = set(json.load(infile))
+    else:
+        code_selection = []
+
+    if v2_config_path:
+        with open(v2_config_path, "r") as infile:
+            v2_manifests = json.load(infile)
+    else:
+        v2_manifests = {}
+
+    snapshots = FileCache(snapshot_path, suffix=".pickle") if snapshot_path else None
+
+    fondses = []
+    for path in ead_file_paths:
+        start = time.perf_counter()
+        fonds = load_ead(path, filter_codes=code_selection, snapshots=snapshots)
+
+        with METRICS.fonds(fonds.code):
+            METRICS.add_time("ead_parse", time.perf_counter() - start)
+
+        fondses.append(fonds)
+
+    # Start with the largest parts, so that they do not end up last in the queue
+    tasks = [
+        (n, k, c)
+        for n, fonds in enumerate(fondses)
+        for k, c in enumerate(fonds.hasPart)
+    ]
+    tasks.sort(
+        key=lambda t: (
+            sum(1 for _ in t[2].files()) if isinstance(t[2], Collection) else 1
+        ),
+        reverse=True,
     )
 
+    # Every process needs at least one request at a time
+    processes = min(processes or os.cpu_count(), max_workers)
 
-if __name__ == "__main__":
-    NA_EAD_FOLDER = "data/NA/ead"
+    with ProcessPoolExecutor(processes) as executor:
+        futures = {
+            (n, k): executor.submit(
+                _build_part,
+                c,
+                base_url_collections,
+                target_dir,
+                prefix=f"{fondses[n].code}/",
+                base_url_manifests=base_url_manifests,
+                use_filegroup=use_filegroup,
+                max_workers=max_workers // processes,
+                mets_url=mets_url,
+                cache_path=cache_path,
+                compress_cache=compress_cache,
+                image_info_path=image_info_path,
+                build_state_path=build_state_path if incremental else "",
+                fast_json=fast_json,
+                rate=rate / processes if rate else None,
+                quiet=quiet,
+                low_memory=low_memory,
+                page_size=page_size,
+                fonds_code=fondses[n].code,
+            )
+            for n, k, c in tasks
+        }
+
+        build_state = BuildState(build_state_path) if incremental else None
+
+        for n, fonds in enumerate(fondses):
+            sub_parts = []
+            for k in range(len(fonds.hasPart)):
+                sub_part, metrics = futures[(n, k)].result()
+                sub_parts.append(sub_part)
+                METRICS.merge(metrics)
+
+            with METRICS.fonds(fonds.code), METRICS.timer("build"):
+                write_collection(
+                    fonds,
+                    sub_parts,
+                    base_url_collections,
+                    target_dir,
+                    build_state=build_state,
+                    fast_json=fast_json,
+                    page_size=page_size,
+                )
+
+    # After the build, the METS files and image information are cached
+    if v2_manifests:
+        cache = FileCache(cache_path, compress=compress_cache) if cache_path else None
+
+        with METRICS.timer("v2"):
+            write_manifests_v2(
+                fondses,
+                v2_manifests,
+                base_url_manifests,
+                v2_target_dir,
+                base_url_v2=base_url_v2,
+                use_filegroup=use_filegroup,
+                cache=cache,
+                mets_url=mets_url,
+                image_info=ImageInfoCache(image_info_path),
+                requester=make_requester(max_workers, rate=rate),
+                max_workers=max_workers,
+            )
 
-    for f in os.listdir(NA_EAD_FOLDER):
-        path = os.path.join(NA_EAD_FOLDER, f)
+    write_metrics(metrics_path, prometheus_path)
 
-        main(
-            ead_file_path=path,
-            base_url_manifests="https://data.globalise.huygens.knaw.nl/manifests/maps/",
-            base_url_collections="https://data.globalise.huygens.knaw.nl/manifests/maps/",
-            target_dir="maps/",
-            use_filegroup=True,
+
+def _build_part(
+    c: Series | FileGroup | File,
+    base_url: str,
+    target_dir: str,
+    prefix: str,
+    base_url_manifests: str,
+    use_filegroup: bool,
+    max_workers: int,
+    mets_url: str,
+    cache_path: str,
+    compress_cache: bool,
+    image_info_path: str,
+    build_state_path: str,
+    fast_json: bool,
+    rate: float | None,
+    quiet: bool,
+    low_memory: bool,
+    page_size: int,
+    fonds_code: str,
+):
+    """
+    Prefetch and build one part of a fonds in a worker process.
+
+    Returns the sub-collection or manifest, and the metrics of the
+    part (see `Metrics.snapshot`).
+    """
+    cache = FileCache(cache_path, compress=compress_cache) if cache_path else None
+    image_info = ImageInfoCache(image_info_path)
+    build_state = BuildState(build_state_path) if build_state_path else None
+    requester = make_requester(max_workers, rate=rate)
+
+    # Worker processes build several parts, report each part separately
+    METRICS.reset()
+
+    with METRICS.fonds(fonds_code):
+        with METRICS.timer("prefetch"):
+            mets_scans = prefetch(
+                c,
+                max_workers=max_workers,
+                cache=cache,
+                image_info=image_info,
+                mets_url=mets_url,
+                requester=requester,
+            )
+
+        config = BuildConfig(
+            base_url=base_url,
+            target_dir=target_dir,
+            base_url_manifests=base_url_manifests,
+            use_filegroup=use_filegroup,
+            mets_scans=mets_scans,
+            cache=cache,
+            mets_url=mets_url,
+            image_info=image_info,
+            build_state=build_state,
+            fast_json=fast_json,
+            requester=requester,
+            retry_queue=[],
+            quiet=quiet,
+            low_memory=low_memory,
+            page_size=page_size,
         )
+
+        with METRICS.timer("build"):
+            sub_part = to_part(c, config, prefix=prefix)
+
+        if config.retry_queue:
+            with METRICS.timer("retry"):
+                changed = retry_placeholders(
+                    config.retry_queue, config, max_workers=max_workers
+                )
+
+                # Add the manifests that were empty to their collections
+                if changed:
+                    sub_part = remake_collections(c, changed, config, prefix=prefix)
+
+    return sub_part, METRICS.snapshot()
+
+
+def write_metrics(metrics_path: str = "", prometheus_path: str = "") -> None:
+    """
+    Print the totals of the timers and counters of the build, and
+    optionally write them (with the values per fonds) to files.
+
+    Args:
+        metrics_path (str, optional): Path of a JSON summary. Defaults to "".
+        prometheus_path (str, optional): Path of a Prometheus textfile. Defaults to "".
+    """
+    total = METRICS.summary()["total"]
+
+    for name, timer in total["timers"].items():
+        print(f"{name:<24} {timer['seconds']:>10.2f}s {timer['calls']:>8} calls")
+    for name, value in total["counters"].items():
+        print(f"{name:<24} {value:>11}")
+
+    if metrics_path:
+        METRICS.write_json(metrics_path)
+    if prometheus_path:
+        METRICS.write_prometheus(prometheus_path)
+
+
+if __name__ == "__main__":
+    NA_EAD_FOLDER = "data/NA/ead"
+
+    parser = argparse.ArgumentParser(description="Build the IIIF collections")
+    parser.add_argument(
+        "--v2-config",
+        default="",
+        help="Also write the v2 manifests of this file (e.g. data/manifests_v2.json)",
+    )
+    args = parser.parse_args()
+
+    build_parallel(
+        [os.path.join(NA_EAD_FOLDER, f) for f in os.listdir(NA_EAD_FOLDER)],
+        base_url_manifests="https://data.globalise.huygens.knaw.nl/manifests/maps/",
+        base_url_collections="https://data.globalise.huygens.knaw.nl/manifests/maps/",
+        target_dir="maps/",
+        use_filegroup=True,
+        v2_config_path=args.v2_config,
+    )
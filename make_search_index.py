@@ -0,0 +1,318 @@
+"""
+Make a static search index of the maps, for the viewer page.
+
+The titles, inventory numbers and dates of every manifest in the EAD
+files are written as small JSON files, so that a page can search them
+without a server, and without loading the collections:
+
+    meta.json            the shards below, and the settings of the index
+    docs/<n>.json        the documents, `DOCS_PER_SHARD` per file:
+                         [path, label, first year, last year]
+    terms/<prefix>.json  for every term starting with the (one or two
+                         character) prefix, the ids of its documents
+    dates/<decade>.json  the documents with a date in the decade, and
+                         their first and last year
+
+The ids in a list of documents are sorted and delta-encoded (each id is
+stored as the difference with the previous one). A query like "Malabar
+1700-1750" fetches the terms shard "ma", the dates shards 1700 to 1750
+and the documents of the results. See `static/search.js`.
+
+Usage (from the root of the repository):
+
+    python make_search_index.py [--target-dir maps/] [--output static/search/]
+        [ead files...]
+"""
+
+import argparse
+import json
+import os
+import re
+
+from unidecode import unidecode
+
+from make_iiif_manifests import Collection, File, FileGroup, Series, load_ead
+
+NA_EAD_FOLDER = "data/NA/ead"
+BASE_URL = "https://data.globalise.huygens.knaw.nl/manifests/maps/"
+
+# Increase when the format of the index changes
+INDEX_VERSION = 2
+
+DOCS_PER_SHARD = 100
+PREFIX_LENGTH = 2
+
+# Words in nearly every title, which are not indexed
+STOPWORDS = {
+    "aan",
+    "and",
+    "de",
+    "den",
+    "der",
+    "des",
+    "en",
+    "het",
+    "in",
+    "met",
+    "of",
+    "op",
+    "the",
+    "te",
+    "van",
+}
+
+TOKEN = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)*")
+YEAR = re.compile(r"(?:^|/)(\d{4})")  # at the start of both ends of a range
+
+
+def tokenize(s: str) -> list[str]:
+    """
+    Split a title or code into search terms.
+
+    Diacritics are removed and the terms are in lowercase. Dots between
+    letters or digits are kept, so that an inventory number is one term.
+
+    Args:
+        s (str): Title or code.
+
+    Returns:
+        list[str]: The terms, without stopwords.
+
+    >>> tokenize("Kaart van het eiland Ceylon, 849.17")
+    ['kaart', 'eiland', 'ceylon', '849.17']
+    """
+    return [t for t in TOKEN.findall(unidecode(s).lower()) if t not in STOPWORDS]
+
+
+def parse_years(date: str) -> tuple[int, int] | None:
+    """
+    Get the first and last year of a normalized `unitdate`.
+
+    Args:
+        date (str): Date as in the EAD (e.g. "1742", "1700/1750" or
+        "17420301/17420415").
+
+    Returns:
+        tuple[int, int] | None: First and last year, or None if the date
+        has no year (e.g. "z.j.").
+
+    >>> parse_years("1700-05/17500101")
+    (1700, 1750)
+    """
+    years = [int(y) for y in YEAR.findall(date)]
+    if not years:
+        return None
+
+    return min(years), max(years)
+
+
+def iter_documents(i: Collection, prefix: str = "", use_filegroup: bool = True):
+    """
+    For every manifest in a collection, yield its path and its part.
+
+    The paths are the same as those of `to_collection`.
+
+    Args:
+        i (Collection): Fonds or Series.
+        prefix (str, optional): Path of the folder of the collection.
+        Defaults to "".
+        use_filegroup (bool, optional): A FileGroup is one manifest.
+        Defaults to True.
+
+    Yields:
+        Iterator[tuple[str, File | FileGroup]]: Path (e.g.
+        "4.VEL/A/1.json") and part of every manifest.
+    """
+    parts_prefix = f"{prefix}{i.code}/"
+
+    for c in i.hasPart:
+        if isinstance(c, Series) or (isinstance(c, FileGroup) and not use_filegroup):
+            yield from iter_documents(c, parts_prefix, use_filegroup=use_filegroup)
+        elif isinstance(c, (File, FileGroup)):
+            yield f"{parts_prefix}{c.code}.json", c
+
+
+def delta_encode(ids: list[int]) -> list[int]:
+    """Store every id of a sorted list as the difference with the previous one."""
+    return [n - m for n, m in zip(ids, [0] + ids[:-1])]
+
+
+def make_search_index(
+    ead_file_paths: list[str],
+    base_url: str = BASE_URL,
+    use_filegroup: bool = True,
+    target_dir: str = "",
+) -> dict[str, dict | list]:
+    """
+    Make the files of the search index.
+
+    Args:
+        ead_file_paths (list[str]): Paths to the EAD files.
+        base_url (str, optional): Base URL of the manifests, which the
+        paths of the documents are relative to.
+        use_filegroup (bool, optional): A FileGroup is one manifest, as in
+        the build. Defaults to True.
+        target_dir (str, optional): Folder of the IIIF files. If given,
+        only the manifests that were written (those with scans) are
+        indexed. Defaults to "" (all).
+
+    Returns:
+        dict[str, dict | list]: The content of every file, by its path in
+        the index (e.g. "terms/ma.json").
+    """
+    docs = []
+    postings = {}  # term -> ids
+    decades = {}  # decade -> ids
+
+    seen = {}  # path -> id, of which the last part is indexed
+    for ead_file_path in ead_file_paths:
+        fonds = load_ead(ead_file_path)
+
+        for path, c in iter_documents(fonds, use_filegroup=use_filegroup):
+            if target_dir and not os.path.exists(os.path.join(target_dir, path)):
+                continue
+
+            years = parse_years(c.date or "")
+            doc = [path, f"{c.code} - {c.title}", *(years or [])]
+
+            if path in seen:
+                docs[seen[path]] = doc
+                continue
+
+            seen[path] = len(docs)
+            docs.append(doc)
+
+    for n, (path, label, *years) in enumerate(docs):
+        for term in set(tokenize(label)):
+            postings.setdefault(term, []).append(n)
+
+        if years:
+            first, last = years
+            for decade in range(first // 10 * 10, last + 1, 10):
+                decades.setdefault(decade, []).append(n)
+
+    files = {}
+
+    for k in range(0, len(docs), DOCS_PER_SHARD):
+        files[f"docs/{k // DOCS_PER_SHARD}.json"] = docs[k : k + DOCS_PER_SHARD]
+
+    shards = {}
+    for term in sorted(postings):
+        shards.setdefault(term[:PREFIX_LENGTH], {})[term] = delta_encode(
+            postings[term]
+        )
+    for prefix, terms in shards.items():
+        files[f"terms/{prefix}.json"] = terms
+
+    for decade, ids in sorted(decades.items()):
+        files[f"dates/{decade}.json"] = {
+            "ids": delta_encode(ids),
+            "years": [docs[n][2:] for n in ids],
+        }
+
+    # How `tokenize` folds the characters that are not ASCII, so that a
+    # query is folded the same way in the browser (e.g. "ß" to "ss")
+    fold = {
+        ch: unidecode(ch)
+        for ch in sorted(set("".join(label for _, label, *_ in docs)))
+        if not ch.isascii()
+    }
+
+    files["meta.json"] = {
+        "version": INDEX_VERSION,
+        "base_url": base_url,
+        "docs": len(docs),
+        "docs_per_shard": DOCS_PER_SHARD,
+        "prefix_length": PREFIX_LENGTH,
+        "terms": sorted(shards),
+        "decades": sorted(decades),
+        "stopwords": sorted(STOPWORDS),
+        "fold": fold,
+    }
+
+    return files
+
+
+def write_search_index(files: dict[str, dict | list], output_dir: str) -> None:
+    """
+    Write the files of a search index as minified JSON.
+
+    Files of a previous index that are no longer part of it are removed.
+
+    Args:
+        files (dict[str, dict | list]): See `make_search_index`.
+        output_dir (str): Folder of the index.
+    """
+    for path, content in files.items():
+        path = os.path.join(output_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "w") as outfile:
+            json.dump(content, outfile, ensure_ascii=False, separators=(",", ":"))
+
+    for folder in ("docs", "terms", "dates"):
+        folder = os.path.join(output_dir, folder)
+        if not os.path.isdir(folder):
+            continue  # e.g. no dates/ for an index without dated documents
+
+        for f in os.listdir(folder):
+            if os.path.relpath(os.path.join(folder, f), output_dir) not in files:
+                os.remove(os.path.join(folder, f))
+
+
+def main(
+    ead_file_paths: list[str],
+    output_dir: str = "static/search/",
+    base_url: str = BASE_URL,
+    target_dir: str = "",
+    use_filegroup: bool = True,
+) -> None:
+    """
+    Make the search index of the maps.
+
+    Args:
+        ead_file_paths (list[str]): Paths to the EAD files.
+        output_dir (str, optional): Folder of the index. Defaults to
+        "static/search/".
+        base_url (str, optional): Base URL of the manifests.
+        target_dir (str, optional): Folder of the IIIF files, to only
+        index the manifests that were written. Defaults to "" (all).
+        use_filegroup (bool, optional): A FileGroup is one manifest.
+        Defaults to True.
+    """
+    files = make_search_index(
+        ead_file_paths,
+        base_url=base_url,
+        use_filegroup=use_filegroup,
+        target_dir=target_dir,
+    )
+    write_search_index(files, output_dir)
+
+    meta = files["meta.json"]
+    size = sum(os.path.getsize(os.path.join(output_dir, path)) for path in files)
+    print(
+        f"Indexed {meta['docs']} documents: {len(meta['terms'])} term shards, "
+        f"{len(meta['decades'])} decades, {size:,} bytes"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("ead_files", nargs="*")
+    parser.add_argument("--output", default="static/search/")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--target-dir", default="", help="Only index written manifests")
+    parser.add_argument("--no-filegroup", action="store_true")
+    args = parser.parse_args()
+
+    ead_files = args.ead_files or [
+        os.path.join(NA_EAD_FOLDER, f) for f in sorted(os.listdir(NA_EAD_FOLDER))
+    ]
+
+    main(
+        ead_files,
+        output_dir=args.output,
+        base_url=args.base_url,
+        target_dir=args.target_dir,
+        use_filegroup=not args.no_filegroup,
+    )
@@ -0,0 +1,417 @@
+"""
+Serve IIIF Collections and Manifests on request, straight from the EADs.
+
+Instead of writing every collection and manifest to disk, the server
+makes them when they are requested, with the same functions (and so
+the same output) as `make_iiif_manifests.main`. Generated documents are
+kept in a bounded LRU cache, optionally spilled to disk, and served
+with an ETag, so that clients can revalidate with If-None-Match.
+
+Usage (from the root of the repository):
+
+    python manifest_server.py [--port 8000] [--cache-mb 256]
+        [--spill data/cache/served/] [ead files...]
+
+The documents are served under their path in the output folder, e.g.
+http://localhost:8000/4.VEL/A/1.json.
+"""
+
+import argparse
+import hashlib
+import os
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import make_iiif_manifests as m
+from cache import FileCache, ImageInfoCache, LRUCache
+from requester import Requester
+
+NA_EAD_FOLDER = "data/NA/ead"
+BASE_URL = "https://data.globalise.huygens.knaw.nl/manifests/maps/"
+
+CONTENT_TYPE = (
+    'application/ld+json;profile="http://iiif.io/api/presentation/3/context.json"'
+)
+
+
+class ManifestServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server that makes collections and manifests on request.
+
+    Attributes:
+        routes (dict[str, tuple[str, list]]): For the path of every
+        collection and manifest, its kind ("collection" or "manifest")
+        and the (part, prefix) pairs it is made of (more than one for a
+        duplicate code, of which the last one with scans is used, as in
+        a full build).
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        ead_file_paths: list[str],
+        port: int = 8000,
+        base_url_collections: str = BASE_URL,
+        base_url_manifests: str = BASE_URL,
+        use_filegroup: bool = True,
+        max_bytes: int = 256 * 2**20,
+        spill_path: str = "",
+        mets_url: str = m.GAF_METS_URL,
+        cache: FileCache | None = m.METS_CACHE,
+        image_info: ImageInfoCache | None = m.IMAGE_INFO_CACHE,
+        requester: Requester | None = None,
+        max_workers: int = 8,
+        fast_json: bool = False,
+    ):
+        """
+        Args:
+            ead_file_paths (list[str]): Paths to the EAD files to serve.
+            port (int, optional): Port to listen on. Defaults to 8000.
+            base_url_collections (str, optional): Base URL for the
+            collections.
+            base_url_manifests (str, optional): Base URL for the manifests.
+            use_filegroup (bool, optional): Make a single manifest for a
+            FileGroup. Defaults to True.
+            max_bytes (int, optional): Maximum size of the documents kept
+            in memory. Defaults to 256 MiB.
+            spill_path (str, optional): Folder to spill documents to when
+            they are evicted from memory, or "" to drop them. Defaults
+            to "".
+            mets_url (str, optional): Base URL of the METS API.
+            cache (FileCache, optional): Cache for METS files. Defaults to
+            METS_CACHE.
+            image_info (ImageInfoCache, optional): Image information cache.
+            Defaults to IMAGE_INFO_CACHE.
+            requester (Requester, optional): Request layer for the METS
+            files and image information that are not cached. Defaults to
+            `make_requester(max_workers)`.
+            max_workers (int, optional): Maximum number of concurrent
+            requests for the METS files of a collection. Defaults to 8.
+            fast_json (bool, optional): Make the documents with `iiif_json`
+            instead of iiif_prezi3. Defaults to False.
+        """
+        super().__init__(("127.0.0.1", port), ManifestHandler)
+
+        self.base_url_collections = base_url_collections
+        self.base_url_manifests = base_url_manifests
+        self.use_filegroup = use_filegroup
+        self.mets_url = mets_url
+        self.cache = cache
+        self.image_info = image_info
+        self.requester = requester or m.make_requester(max_workers)
+        self.max_workers = max_workers
+        self.fast_json = fast_json
+
+        spill = FileCache(spill_path, suffix=".json") if spill_path else None
+        self.documents = LRUCache(max_bytes, spill=spill)
+
+        # Requests for a document that is being made wait for it
+        self._lock = threading.Lock()
+        self._pending = {}
+
+        self.routes = {}
+        self.versions = {}  # EAD hash per fonds, part of the cache keys
+        for path in ead_file_paths:
+            fonds = m.load_ead(path)
+            self.versions[fonds.code] = m.file_digest(path)
+            self.add_routes(fonds)
+
+    def add_routes(self, i: m.Collection, prefix: str = "") -> None:
+        """Add the paths of a collection and everything in it, as `to_collection`."""
+        filename = f"{prefix}{i.code}.json"
+        self.routes.setdefault(filename, ("collection", []))[1].append((i, prefix))
+
+        parts_prefix = filename.replace(".json", "/")
+        for c in i.hasPart:
+            if isinstance(c, m.Series) or (
+                isinstance(c, m.FileGroup) and not self.use_filegroup
+            ):
+                self.add_routes(c, parts_prefix)
+            else:
+                route = self.routes.setdefault(
+                    f"{parts_prefix}{c.code}.json", ("manifest", [])
+                )
+                route[1].append((c, parts_prefix))
+
+    def get(self, filename: str) -> bytes | None:
+        """
+        Get a collection or manifest as JSON, from the cache if possible.
+
+        Args:
+            filename (str): Path of the document (e.g. "4.VEL/A/1.json").
+
+        Returns:
+            bytes | None: The document, or None if it does not exist (or
+            has no scans).
+        """
+        if filename not in self.routes:
+            return None
+
+        fonds_code = filename.split("/")[0].removesuffix(".json")
+        key = hashlib.sha1(
+            f"{self.versions[fonds_code]}:{self.fast_json}:{filename}".encode("utf-8")
+        ).hexdigest()
+
+        data = self.documents.get(key)
+        if data is not None:
+            return data or None  # b"" if it has no scans
+
+        # Make every document only once, also for concurrent requests
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = pending = {"event": threading.Event()}
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            pending["event"].wait()
+            if "error" in pending:
+                raise pending["error"]
+
+            return pending["data"]
+
+        try:
+            data, complete = self.make(filename)
+            if complete:
+                self.documents.set(key, data or b"")
+            pending["data"] = data
+        except Exception as e:
+            pending["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending["event"].set()
+
+        return data
+
+    def make(self, filename: str) -> tuple[bytes | None, bool]:
+        """
+        Make a collection or manifest.
+
+        Args:
+            filename (str): Path of the document.
+
+        Returns:
+            tuple[bytes | None, bool]: The document (None if it has no
+            scans), and whether it is complete: a manifest with
+            placeholder canvases, or a collection of which some METS
+            files could not be retrieved, is not cached, so that they are
+            tried again on the next request.
+
+        Raises:
+            requests.exceptions.RequestException: If the document has no
+            scans, but some METS files could not be retrieved.
+        """
+        kind, candidates = self.routes[filename]
+
+        if kind == "manifest":
+            complete = True
+            for c, prefix in reversed(candidates):
+                task = self.manifest_task(c, prefix)
+                complete = complete and not task.failed_mets
+                if task.ranges:
+                    m.construct_manifest(
+                        task,
+                        image_info=self.image_info,
+                        fast_json=self.fast_json,
+                        requester=self.requester,
+                        quiet=True,
+                    )
+                    data = m.serialize(task.manifest, fast_json=self.fast_json)
+
+                    return data, complete and not task.placeholders
+
+            return self.not_found(filename, complete)
+
+        # Fetch the METS files of all manifests in the collection at once
+        i, prefix = candidates[-1]
+        mets_scans = m.prefetch_scans(
+            i,
+            max_workers=self.max_workers,
+            cache=self.cache,
+            session=self.requester,
+            mets_url=self.mets_url,
+        )
+
+        complete = all(scans is not None for scans in mets_scans.values())
+
+        collection = self.make_collection(i, prefix, mets_scans=mets_scans)
+        if collection is None:
+            return self.not_found(filename, complete)
+
+        return m.serialize(collection, fast_json=self.fast_json), complete
+
+    def not_found(self, filename: str, complete: bool) -> tuple[None, bool]:
+        """A document without scans, which may have some after an outage."""
+        if not complete:
+            raise requests.exceptions.RequestException(
+                f"METS files of {filename} could not be retrieved"
+            )
+
+        return None, True
+
+    def manifest_task(
+        self, c: m.File | m.FileGroup, prefix: str, mets_scans: dict | None = None
+    ) -> m.ManifestTask:
+        """The task of a manifest, with its scans resolved."""
+        if mets_scans is None:
+            files = c.files() if isinstance(c, m.FileGroup) else [c]
+            mets_scans = {
+                f.metsid: m.get_scans(
+                    f.metsid,
+                    cache=self.cache,
+                    session=self.requester,
+                    mets_url=self.mets_url,
+                )
+                for f in files
+                if f.metsid
+            }
+
+        task = m.ManifestTask(
+            part=c,
+            base_url=self.base_url_manifests,
+            target_dir="",
+            prefix=prefix,
+        )
+
+        return m.resolve_manifest(
+            task,
+            mets_scans=mets_scans,
+            cache=self.cache,
+            mets_url=self.mets_url,
+            image_info=self.image_info,
+            requester=self.requester,
+        )
+
+    def make_collection(self, i: m.Collection, prefix: str, mets_scans: dict):
+        """
+        Make a collection, with references to the manifests that have scans.
+
+        Args:
+            i (Collection): Fonds, Series or FileGroup.
+            prefix (str): Path of the collection in the output folder.
+            mets_scans (dict): Result of `prefetch_scans` for the collection.
+        """
+        parts_prefix = f"{prefix}{i.code}/"
+
+        sub_parts = []
+        for c in i.hasPart:
+            if isinstance(c, m.Series) or (
+                isinstance(c, m.FileGroup) and not self.use_filegroup
+            ):
+                sub_parts.append(self.make_collection(c, parts_prefix, mets_scans))
+            else:
+                task = self.manifest_task(c, parts_prefix, mets_scans)
+                sub_parts.append(
+                    m.manifest_reference(task.id, task.label, fast_json=self.fast_json)
+                    if task.ranges
+                    else None
+                )
+
+        return m.make_collection(
+            i,
+            sub_parts,
+            self.base_url_collections,
+            prefix=prefix,
+            fast_json=self.fast_json,
+        )
+
+    def start(self) -> "ManifestServer":
+        """Serve in a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+        return self
+
+
+class ManifestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status: int, body: bytes = b"", headers={}):
+        self.send_response(status)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        filename = self.path.split("?")[0].lstrip("/")
+
+        try:
+            data = self.server.get(filename)
+        except requests.exceptions.RequestException as e:
+            return self.send(502, f"{e.__class__.__name__}\n".encode("utf-8"))
+        except Exception as e:
+            traceback.print_exc()
+            return self.send(500, f"{e.__class__.__name__}\n".encode("utf-8"))
+
+        if data is None:
+            return self.send(404)
+
+        etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+        if etag in self.headers.get("If-None-Match", "").replace(" ", "").split(","):
+            return self.send(304, headers={"ETag": etag})
+
+        self.send(200, data, {"Content-Type": CONTENT_TYPE, "ETag": etag})
+
+    do_HEAD = do_GET
+
+
+def serve(**kwargs) -> ManifestServer:
+    """
+    Start a manifest server in a background thread.
+
+    Args:
+        **kwargs: See `ManifestServer`.
+
+    Returns:
+        ManifestServer: The running server.
+    """
+    return ManifestServer(**kwargs).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("ead_files", nargs="*")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--cache-mb", type=int, default=256)
+    parser.add_argument("--spill", default="", help="Folder for evicted documents")
+    parser.add_argument("--mets-url", default=m.GAF_METS_URL)
+    parser.add_argument("--rate", type=float, default=25.0, help="0 for no limit")
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--fast-json", action="store_true")
+    args = parser.parse_args()
+
+    ead_files = args.ead_files or [
+        os.path.join(NA_EAD_FOLDER, f) for f in sorted(os.listdir(NA_EAD_FOLDER))
+    ]
+
+    server = ManifestServer(
+        ead_files,
+        port=args.port,
+        base_url_collections=args.base_url,
+        base_url_manifests=args.base_url,
+        max_bytes=args.cache_mb * 2**20,
+        spill_path=args.spill,
+        mets_url=args.mets_url,
+        requester=m.make_requester(args.max_workers, rate=args.rate or None),
+        max_workers=args.max_workers,
+        fast_json=args.fast_json,
+    )
+    print(f"Serving {len(server.routes)} documents at http://127.0.0.1:{args.port}/")
+    server.serve_forever()
@@ -0,0 +1,212 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    Timers and counters of the stages of a build, per fonds.
+
+    Timers add up the time spent in a stage over all calls (and all
+    threads, so concurrent stages can add up to more than the wall
+    time). Everything is recorded for the fonds that is being built
+    (see `fonds`), and the totals are the sums over all fondses.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current_fonds = ""
+        self.timers = {}  # (fonds, name) -> [calls, seconds]
+        self.counters = {}  # (fonds, name) -> value
+
+    @contextmanager
+    def fonds(self, code: str):
+        """
+        Record everything in the block for a fonds.
+
+        Args:
+            code (str): Code of the fonds.
+        """
+        previous = self.current_fonds
+        self.current_fonds = code
+        try:
+            yield
+        finally:
+            self.current_fonds = previous
+
+    @contextmanager
+    def timer(self, name: str):
+        """
+        Time the block as a call of a stage.
+
+        Args:
+            name (str): Name of the stage (e.g. "mets_fetch").
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float, calls: int = 1) -> None:
+        key = (self.current_fonds, name)
+
+        with self._lock:
+            timer = self.timers.setdefault(key, [0, 0.0])
+            timer[0] += calls
+            timer[1] += seconds
+
+    def count(self, name: str, n: int = 1) -> None:
+        """
+        Increase a counter.
+
+        Args:
+            name (str): Name of the counter (e.g. "mets_cache_hits").
+            n (int, optional): Increment. Defaults to 1.
+        """
+        key = (self.current_fonds, name)
+
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def reset(self) -> None:
+        with self._lock:
+            self.timers = {}
+            self.counters = {}
+
+    def snapshot(self) -> dict:
+        """
+        Copy of the recorded values, that can be sent to another process.
+
+        Returns:
+            dict: Timers and counters, see `merge`.
+        """
+        with self._lock:
+            return {
+                "timers": [[*k, *v] for k, v in self.timers.items()],
+                "counters": [[*k, v] for k, v in self.counters.items()],
+            }
+
+    def merge(self, snapshot: dict) -> None:
+        """
+        Add the values of a snapshot (e.g. of a worker process).
+
+        Args:
+            snapshot (dict): Result of `snapshot`.
+        """
+        with self._lock:
+            for fonds, name, calls, seconds in snapshot["timers"]:
+                timer = self.timers.setdefault((fonds, name), [0, 0.0])
+                timer[0] += calls
+                timer[1] += seconds
+
+            for fonds, name, value in snapshot["counters"]:
+                key = (fonds, name)
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def summary(self) -> dict:
+        """
+        Totals and values per fonds.
+
+        Returns:
+            dict: {"total": {...}, "fonds": {code: {...}}}, where every
+            value has "timers" ({name: {"calls", "seconds"}}) and
+            "counters" ({name: value}).
+        """
+
+        def empty():
+            return {"timers": {}, "counters": {}}
+
+        total = empty()
+        per_fonds = {}
+
+        with self._lock:
+            for (fonds, name), (calls, seconds) in sorted(self.timers.items()):
+                for values in (total, per_fonds.setdefault(fonds or "-", empty())):
+                    timer = values["timers"].setdefault(
+                        name, {"calls": 0, "seconds": 0.0}
+                    )
+                    timer["calls"] += calls
+                    timer["seconds"] += seconds
+
+            for (fonds, name), value in sorted(self.counters.items()):
+                for values in (total, per_fonds.setdefault(fonds or "-", empty())):
+                    values["counters"][name] = values["counters"].get(name, 0) + value
+
+        return {"total": total, "fonds": per_fonds}
+
+    def write_json(self, path: str) -> None:
+        """
+        Write the summary as JSON.
+
+        Args:
+            path (str): Path of the JSON file.
+        """
+        _write_atomic(path, json.dumps(self.summary(), indent=2))
+
+    def write_prometheus(self, path: str, prefix: str = "iiif_build") -> None:
+        """
+        Write the values in the Prometheus text format, e.g. for the
+        textfile collector of the node exporter.
+
+        Args:
+            path (str): Path of the .prom file.
+            prefix (str, optional): Prefix of the metric names. Defaults
+            to "iiif_build".
+        """
+        with self._lock:
+            timers = sorted(self.timers.items())
+            counters = sorted(self.counters.items())
+
+        def labels(fonds, **kwargs):
+            kwargs["fonds"] = fonds or "-"
+            return ",".join(f'{k}="{v}"' for k, v in kwargs.items())
+
+        lines = [
+            f"# HELP {prefix}_stage_seconds_total Time spent in a stage of the build.",
+            f"# TYPE {prefix}_stage_seconds_total counter",
+        ]
+        lines += [
+            f"{prefix}_stage_seconds_total{{{labels(fonds, stage=name)}}} {seconds}"
+            for (fonds, name), (_, seconds) in timers
+        ]
+        lines += [
+            f"# HELP {prefix}_stage_calls_total "
+            "Number of times a stage of the build ran.",
+            f"# TYPE {prefix}_stage_calls_total counter",
+        ]
+        lines += [
+            f"{prefix}_stage_calls_total{{{labels(fonds, stage=name)}}} {calls}"
+            for (fonds, name), (calls, _) in timers
+        ]
+        lines += [
+            f"# HELP {prefix}_events_total Number of events during the build.",
+            f"# TYPE {prefix}_events_total counter",
+        ]
+        lines += [
+            f"{prefix}_events_total{{{labels(fonds, event=name)}}} {value}"
+            for (fonds, name), value in counters
+        ]
+
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def _write_atomic(path: str, text: str) -> None:
+    """Write a file via a temporary file, so that readers never see half of it."""
+    dirname = os.path.dirname(path) or "."
+    os.makedirs(dirname, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as outfile:
+            outfile.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+METRICS = Metrics()
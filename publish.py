@@ -0,0 +1,311 @@
+"""
+Prepare the generated IIIF files for hosting.
+
+Every JSON file in the given folders is rewritten as minified JSON,
+with a gzip (and, if the brotli package is installed, a brotli)
+compressed variant next to it (`x.json.gz`, `x.json.br`), so that a web
+server can send them as they are (e.g. nginx `gzip_static` and
+`brotli_static`). A `hashes.json` in each folder lists the SHA-256 hash
+and sizes of every file, to use as ETag. Files whose content did not
+change since the previous run are skipped.
+
+With `--activity-url`, the files that were added, changed or removed
+since the previous run are also added to a IIIF Change Discovery
+activity stream in the folder (see `change_discovery.py`).
+
+Usage (from the root of the repository):
+
+    python publish.py maps/ static/manifests/ [--no-brotli] [--no-gzip]
+    python publish.py maps/
+        --activity-url https://data.globalise.huygens.knaw.nl/manifests/maps/
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from change_discovery import (
+    ACTIVITY_FOLDER,
+    diff_hashes,
+    document_type,
+    update_activity_stream,
+)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HASHES_FILENAME = "hashes.json"
+
+# Suffix of the compressed variant of a file, per entry in the hashes
+VARIANTS = {"gzip": ".gz", "br": ".br"}
+
+
+def _dumps(document) -> bytes:
+    return json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode(
+        "utf-8"
+    )
+
+
+def write_file(path: str, data: bytes) -> None:
+    """Replace a file atomically, keeping the usual file permissions."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+
+    with open(tmp_path, "wb") as outfile:
+        outfile.write(data)
+    os.replace(tmp_path, path)
+
+
+def remove_variants(path: str, keys=VARIANTS) -> int:
+    """
+    Remove the compressed variants of a file, if they exist.
+
+    Args:
+        path (str): Path of the JSON file.
+        keys (optional): Variants to remove ("gzip", "br"). Defaults to
+        all variants.
+
+    Returns:
+        int: The number of files removed.
+    """
+    removed = 0
+    for k in keys:
+        try:
+            os.remove(path + VARIANTS[k])
+            removed += 1
+        except FileNotFoundError:
+            pass
+
+    return removed
+
+
+def publish_file(
+    path: str,
+    previous: dict | None = None,
+    use_gzip: bool = True,
+    use_brotli: bool = True,
+) -> dict:
+    """
+    Minify and compress one JSON file, in place.
+
+    Args:
+        path (str): Path of the JSON file.
+        previous (dict, optional): Its entry in the hashes of the previous
+        run. If the hash is the same and the variants exist, nothing is
+        written.
+        use_gzip (bool, optional): Write a gzip variant. Defaults to True.
+        use_brotli (bool, optional): Write a brotli variant. Defaults to True.
+
+    Returns:
+        dict: Entry for `hashes.json`: "sha256", "etag", the "type" of the
+        document (e.g. "Manifest", see `document_type`), the sizes in
+        bytes of the original ("source"), minified ("bytes") and
+        compressed ("gzip", "br") file, whether it was "written", and the
+        number of variants of disabled compressions that were "removed".
+    """
+    with open(path, "rb") as infile:
+        source = infile.read()
+
+    document = json.loads(source)
+    data = _dumps(document)
+    digest = hashlib.sha256(data).hexdigest()
+
+    enabled = {"gzip": use_gzip, "br": use_brotli}
+    variants = {k: path + VARIANTS[k] for k in VARIANTS if enabled[k]}
+
+    # Variants of a previous run with other options would be outdated
+    removed = remove_variants(path, [k for k in VARIANTS if not enabled[k]])
+
+    entry = {
+        "sha256": digest,
+        "etag": f'"{digest[:32]}"',
+        "type": document_type(document),
+        "source": len(source),
+        "bytes": len(data),
+    }
+
+    if previous and previous["sha256"] == digest and data == source:
+        # Published before: keep the size of the original
+        entry["source"] = previous["source"]
+
+        if all(k in previous and os.path.exists(p) for k, p in variants.items()):
+            return (
+                entry
+                | {k: previous[k] for k in variants}
+                | {"written": False, "removed": removed}
+            )
+
+    if data != source:
+        write_file(path, data)
+
+    if use_gzip:
+        # Without a timestamp, so that the same input gives the same file
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        write_file(variants["gzip"], compressed)
+        entry["gzip"] = len(compressed)
+
+    if use_brotli:
+        compressed = brotli.compress(data, quality=11)
+        write_file(variants["br"], compressed)
+        entry["br"] = len(compressed)
+
+    return entry | {"written": True, "removed": removed}
+
+
+def _publish_files(paths, previous, use_gzip, use_brotli):
+    return [publish_file(p, previous.get(p), use_gzip, use_brotli) for p in paths]
+
+
+def publish(
+    folder: str,
+    use_gzip: bool = True,
+    use_brotli: bool = True,
+    processes: int | None = None,
+    activity_url: str = "",
+) -> dict:
+    """
+    Minify and compress every JSON file in a folder (recursively), in place.
+
+    Args:
+        folder (str): Folder of the IIIF files (e.g. "maps/").
+        use_gzip (bool, optional): Write gzip variants. Defaults to True.
+        use_brotli (bool, optional): Write brotli variants, if the brotli
+        package is installed. Defaults to True.
+        processes (int, optional): Number of processes. Defaults to the
+        number of CPUs.
+        activity_url (str, optional): URL of the folder. If given, the
+        changes since the previous run are added to its activity
+        stream. Defaults to "".
+
+    Returns:
+        dict: Totals of the sizes in bytes ("source", "bytes", "gzip",
+        "br") and the number of "files", "written" files, "removed"
+        variants (of files that are gone or of disabled compressions)
+        and, with an activity_url, "activities" added.
+    """
+    use_brotli = use_brotli and brotli is not None
+
+    hashes_path = os.path.join(folder, HASHES_FILENAME)
+    try:
+        with open(hashes_path, "rb") as infile:
+            previous = {
+                os.path.join(folder, k): v for k, v in json.load(infile).items()
+            }
+    except FileNotFoundError:
+        previous = {}
+
+    activity_dir = os.path.join(folder, ACTIVITY_FOLDER)
+    paths = sorted(
+        os.path.join(root, f)
+        for root, _, files in os.walk(folder)
+        if root != activity_dir and not root.startswith(activity_dir + os.sep)
+        for f in files
+        if f.endswith(".json") and f != HASHES_FILENAME
+    )
+
+    # Compressing is CPU bound, so send the files in chunks to a process pool
+    processes = processes or os.cpu_count()
+    chunk_size = max(1, min(256, len(paths) // (4 * processes)))
+    chunks = [paths[n : n + chunk_size] for n in range(0, len(paths), chunk_size)]
+
+    hashes = {}
+    with ProcessPoolExecutor(processes) as executor:
+        futures = [
+            executor.submit(
+                _publish_files,
+                chunk,
+                {p: previous[p] for p in chunk if p in previous},
+                use_gzip,
+                use_brotli,
+            )
+            for chunk in chunks
+        ]
+
+        for chunk, future in zip(chunks, futures):
+            for path, entry in zip(chunk, future.result()):
+                hashes[os.path.relpath(path, folder)] = entry
+
+    # The variants of files that were removed since the previous run
+    removed = sum(
+        remove_variants(p)
+        for p in previous
+        if os.path.relpath(p, folder) not in hashes
+    )
+
+    totals = {
+        "files": len(hashes),
+        "written": 0,
+        "removed": removed,
+        "source": 0,
+        "bytes": 0,
+    }
+    for entry in hashes.values():
+        totals["written"] += entry.pop("written")
+        totals["removed"] += entry.pop("removed")
+        for k in ("source", "bytes", "gzip", "br"):
+            if k in entry:
+                totals[k] = totals.get(k, 0) + entry[k]
+
+    # Before the hashes, so that no change is missed if this fails
+    if activity_url:
+        changes = diff_hashes(
+            {os.path.relpath(p, folder): v for p, v in previous.items()}, hashes
+        )
+        update_activity_stream(folder, activity_url, changes)
+        totals["activities"] = len(changes)
+
+    write_file(
+        hashes_path, json.dumps(hashes, indent=2, sort_keys=True).encode("utf-8")
+    )
+
+    return totals
+
+
+def print_report(folder: str, totals: dict) -> None:
+    """Print the sizes of a published folder and the bytes saved."""
+    source = totals["source"]
+
+    print(f"{folder}: {totals['files']} files, {totals['written']} written")
+    if totals.get("removed"):
+        print(f"  {totals['removed']} outdated compressed files removed")
+    if "activities" in totals:
+        print(f"  {totals['activities']} activities added to the activity stream")
+    print(f"  {'original':<9} {source:>14,} bytes")
+
+    for k, label in (("bytes", "minified"), ("gzip", "gzip"), ("br", "brotli")):
+        if k in totals:
+            saved = source - totals[k]
+            print(
+                f"  {label:<9} {totals[k]:>14,} bytes"
+                f"  (saved {saved:,} bytes, {saved / source if source else 0:.0%})"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("folders", nargs="+")
+    parser.add_argument("--no-gzip", action="store_true")
+    parser.add_argument("--no-brotli", action="store_true")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--activity-url", default="", help="URL of the folder")
+    args = parser.parse_args()
+
+    if args.activity_url and len(args.folders) > 1:
+        parser.error("--activity-url can only be used with one folder")
+
+    if brotli is None and not args.no_brotli:
+        print("The brotli package is not installed, skipping brotli variants")
+
+    for folder in args.folders:
+        totals = publish(
+            folder,
+            use_gzip=not args.no_gzip,
+            use_brotli=not args.no_brotli,
+            processes=args.processes,
+            activity_url=args.activity_url,
+        )
+        print_report(folder, totals)
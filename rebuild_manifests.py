@@ -0,0 +1,108 @@
+"""
+Rebuild the manifests of a few files, e.g. to fix a single map.
+
+The files are looked up in the inventory index (see
+`make_iiif_manifests.index_ead`), which is brought up to date with the
+EAD files first, so that only the changed EADs are parsed. After that
+only the part of the EAD that a manifest is made of is read.
+
+Usage (from the root of the repository):
+
+    python rebuild_manifests.py [--fonds 4.VEL] 1234 ...
+
+Inventory numbers, handles (http://hdl.handle.net/10648/...) and METS
+ids can be mixed.
+"""
+
+import argparse
+import os
+
+from cache import BuildState, InventoryIndex
+from make_iiif_manifests import build_manifests, make_requester, update_inventory_index
+
+NA_EAD_FOLDER = "data/NA/ead"
+
+
+def main(
+    identifiers: list[str],
+    fonds_code: str = "",
+    ead_folder: str = NA_EAD_FOLDER,
+    index_path: str = "data/cache/inventory_index.sqlite",
+    base_url_manifests: str = "https://data.globalise.huygens.knaw.nl/manifests/maps/",
+    target_dir: str = "maps/",
+    use_filegroup: bool = True,
+    incremental: bool = False,
+    build_state_path: str = "data/cache/build_state.sqlite",
+    fast_json: bool = False,
+    rate: float | None = 25.0,
+) -> None:
+    """
+    Rebuild the manifests of some files.
+
+    Args:
+        identifiers (list[str]): Inventory numbers, handles or METS ids.
+        fonds_code (str, optional): Only look in this fonds. Defaults to all.
+        ead_folder (str, optional): Folder of the EAD files to index. Defaults to
+        "data/NA/ead".
+        index_path (str, optional): Path of the inventory index. Defaults to
+        "data/cache/inventory_index.sqlite".
+        base_url_manifests (str, optional): Base URL for the manifests.
+        target_dir (str, optional): Folder of the IIIF files. Defaults to "maps/".
+        use_filegroup (bool, optional): Make a single manifest for a FileGroup. Defaults
+        to True.
+        incremental (bool, optional): Only write the manifests whose inputs changed.
+        Defaults to False.
+        build_state_path (str, optional): Path of the input hashes of the previous
+        build. Defaults to "data/cache/build_state.sqlite".
+        fast_json (bool, optional): Write compact JSON with `iiif_json`. Defaults to
+        False.
+        rate (float, optional): Maximum number of requests per second, or None for no
+        limit. Defaults to 25.
+    """
+    index = InventoryIndex(index_path)
+    update_inventory_index(
+        [os.path.join(ead_folder, f) for f in sorted(os.listdir(ead_folder))],
+        index,
+    )
+
+    manifests = build_manifests(
+        identifiers,
+        base_url_manifests,
+        target_dir,
+        fonds_code=fonds_code,
+        use_filegroup=use_filegroup,
+        index=index,
+        build_state=BuildState(build_state_path) if incremental else None,
+        fast_json=fast_json,
+        requester=make_requester(rate=rate),
+    )
+
+    print("Built", sum(1 for m in manifests if m is not None), "manifests")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("identifiers", nargs="+")
+    parser.add_argument("--fonds", default="", help="Only look in this fonds")
+    parser.add_argument("--ead-folder", default=NA_EAD_FOLDER)
+    parser.add_argument("--index", default="data/cache/inventory_index.sqlite")
+    parser.add_argument("--target-dir", default="maps/")
+    parser.add_argument(
+        "--use-filegroup", action=argparse.BooleanOptionalAction, default=True
+    )
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--fast-json", action="store_true")
+    parser.add_argument("--rate", type=float, default=25.0, help="0 for no limit")
+    args = parser.parse_args()
+
+    main(
+        args.identifiers,
+        fonds_code=args.fonds,
+        ead_folder=args.ead_folder,
+        index_path=args.index,
+        target_dir=args.target_dir,
+        use_filegroup=args.use_filegroup,
+        incremental=args.incremental,
+        fast_json=args.fast_json,
+        rate=args.rate or None,
+    )
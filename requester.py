@@ -0,0 +1,299 @@
+import random
+import threading
+import time
+
+import requests
+
+# Responses that signal throttling or a (possibly) transient server error
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter that can be shared between threads.
+
+    Tokens are added at a fixed rate up to the capacity of the bucket,
+    and every request takes one, so that bursts up to the capacity are
+    allowed but the average rate is bounded.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        """
+        Args:
+            rate (float): Tokens (requests) per second.
+            capacity (float, optional): Maximum number of tokens. Defaults
+            to the rate (a burst of one second).
+        """
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def acquire(self) -> None:
+        """Take a token, waiting until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+
+                if now >= self._paused_until:
+                    self._tokens = min(
+                        self.capacity,
+                        self._tokens + (now - self._updated) * self.rate,
+                    )
+                    self._updated = now
+
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    wait = self._paused_until - now
+
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hand out no tokens for a while (e.g. after a Retry-After header).
+
+        Args:
+            seconds (float): Duration of the pause.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+            self._updated = self._paused_until
+
+
+class AdaptiveLimiter:
+    """
+    Limit on the number of concurrent requests that adapts to the server.
+
+    The limit grows by about one for every round of fast, successful
+    requests (additive increase) and is halved when the server throttles
+    or fails (multiplicative decrease), at most once per round. Requests
+    that take much longer than the fastest observed request lower the
+    limit slightly, so that a slowing server gets less load before it
+    starts to fail.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        latency_tolerance: float = 3.0,
+        fast_latency: float = 0.05,
+    ):
+        """
+        Args:
+            max_concurrency (int, optional): Upper bound (and start value)
+            of the limit. Defaults to 8.
+            min_concurrency (int, optional): Lower bound of the limit.
+            Defaults to 1.
+            latency_tolerance (float, optional): Requests slower than this
+            multiple of the fastest request count as a sign of congestion.
+            Defaults to 3.0.
+            fast_latency (float, optional): Requests faster than this (in
+            seconds) never count as a sign of congestion. Defaults to 0.05.
+        """
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.latency_tolerance = latency_tolerance
+        self.fast_latency = fast_latency
+
+        self._condition = threading.Condition()
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.min_latency = None
+        self._last_decrease = 0.0
+
+    def acquire(self) -> None:
+        """Wait until a request may start."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, ok: bool) -> None:
+        """
+        Register a finished request and adapt the limit.
+
+        Args:
+            latency (float): Duration of the request in seconds.
+            ok (bool): False if the server throttled or failed.
+        """
+        with self._condition:
+            self.in_flight -= 1
+
+            if ok and (self.min_latency is None or latency < self.min_latency):
+                self.min_latency = latency
+
+            now = time.monotonic()
+            if not ok:
+                # At most one decrease per round of requests
+                if now - self._last_decrease > (self.min_latency or latency):
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = now
+            elif latency > self.latency_tolerance * max(
+                self.min_latency, self.fast_latency
+            ):
+                self.limit = max(self.min_concurrency, self.limit - 1 / self.limit)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+            self._condition.notify_all()
+
+
+class Requester:
+    """
+    Rate limited HTTP GET with retries, shared by all requests of a build.
+
+    Throttled (429) and failed (5xx) requests, connection errors and
+    timeouts are retried with jittered exponential backoff. A
+    Retry-After header pauses all requests. It can be used in place of
+    a `requests.Session` (only `get` is supported).
+    """
+
+    def __init__(
+        self,
+        session: requests.Session | None = None,
+        rate: float | None = 25.0,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        timeout: float = 60.0,
+        retry_statuses=RETRY_STATUSES,
+    ):
+        """
+        Args:
+            session (requests.Session, optional): Session to use. Defaults
+            to a new session.
+            rate (float, optional): Maximum number of requests per second,
+            or None for no limit. Defaults to 25.
+            max_concurrency (int, optional): Maximum number of concurrent
+            requests. Defaults to 8.
+            max_retries (int, optional): Number of retries of a failed
+            request. Defaults to 3.
+            backoff (float, optional): Base of the backoff in seconds: the
+            n-th retry waits a random time up to backoff * 2 ** n seconds.
+            Defaults to 0.5.
+            max_backoff (float, optional): Maximum backoff in seconds.
+            Defaults to 30.
+            timeout (float, optional): Timeout of a request in seconds.
+            Defaults to 60.
+            retry_statuses (tuple[int], optional): Status codes to retry.
+            Defaults to RETRY_STATUSES.
+        """
+        self.session = session or requests.Session()
+        self.bucket = TokenBucket(rate) if rate else None
+        self.limiter = AdaptiveLimiter(max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.retry_statuses = retry_statuses
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+
+    def _request(self, url: str, **kwargs) -> requests.Response:
+        if self.bucket:
+            self.bucket.acquire()
+
+        self.limiter.acquire()
+        start = time.monotonic()
+        ok = False
+        try:
+            response = self.session.get(url, timeout=self.timeout, **kwargs)
+            ok = response.status_code not in self.retry_statuses
+
+            return response
+        finally:
+            self.limiter.release(time.monotonic() - start, ok)
+
+            with self._lock:
+                self.requests += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        GET a URL, retrying throttled and failed requests.
+
+        Args:
+            url (str): URL to get.
+            **kwargs: Passed on to `requests.Session.get`.
+
+        Raises:
+            requests.exceptions.RequestException: If the request still
+            fails with a connection error or timeout after the last retry.
+
+        Returns:
+            requests.Response: The response. After the last retry, this
+            can still be an error response.
+        """
+        for attempt in range(self.max_retries + 1):
+            response = None
+            last_attempt = attempt == self.max_retries
+
+            try:
+                response = self._request(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_attempt:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+            else:
+                if response.status_code not in self.retry_statuses:
+                    return response
+
+                if response.status_code == 429:
+                    with self._lock:
+                        self.throttled += 1
+
+                if last_attempt:
+                    with self._lock:
+                        self.failures += 1
+                    return response
+
+            # Full jitter, so that failed requests do not retry in lockstep
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+            retry_after = ""
+            if response is not None:
+                retry_after = response.headers.get("Retry-After", "")
+
+            if retry_after.isdigit():
+                if self.bucket:
+                    # Pause all requests, not only this one
+                    self.bucket.pause(min(int(retry_after), self.max_backoff))
+                else:
+                    delay = max(delay, min(int(retry_after), self.max_backoff))
+
+            with self._lock:
+                self.retries += 1
+
+            time.sleep(delay)
+
+    def stats(self) -> dict:
+        """
+        Statistics of the requests since the requester was created.
+
+        Returns:
+            dict: Number of requests, retries, throttled responses (429)
+            and requests that failed after the last retry, and the
+            current concurrency limit.
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "failures": self.failures,
+                "concurrency": int(self.limiter.limit),
+            }
@@ -0,0 +1,146 @@
+// Search the static index of `make_search_index.py`, e.g.
+//
+//   const index = new MapSearch("search/");
+//   const results = await index.search("Malabar 1700-1750");
+//
+// Every result is {id, label, years}. Only the shards that a query
+// needs are fetched, and each of them only once.
+
+class MapSearch {
+  constructor(indexUrl) {
+    this.indexUrl = indexUrl;
+    this.shards = new Map();
+  }
+
+  fetchShard(path) {
+    if (!this.shards.has(path)) {
+      this.shards.set(
+        path,
+        fetch(this.indexUrl + path)
+          .then((response) => {
+            if (!response.ok) throw new Error(`${path}: ${response.status}`);
+            return response.json();
+          })
+          .catch((error) => {
+            this.shards.delete(path); // try again on the next search
+            throw error;
+          })
+      );
+    }
+    return this.shards.get(path);
+  }
+
+  meta() {
+    return this.fetchShard("meta.json");
+  }
+
+  static deltaDecode(deltas) {
+    let id = 0;
+    return deltas.map((delta) => (id += delta));
+  }
+
+  // Same terms as `tokenize` in make_search_index.py, with its folding of
+  // the characters that are not ASCII (the "fold" of the index)
+  static tokenize(s, fold = {}) {
+    return (
+      s
+        .normalize("NFC")
+        .replace(/[^\x00-\x7f]/g, (ch) => fold[ch] ?? ch)
+        .normalize("NFD")
+        .replace(/[\u0300-\u036f]/g, "")
+        .toLowerCase()
+        .match(/[a-z0-9]+(?:\.[a-z0-9]+)*/g) || []
+    );
+  }
+
+  // Split a query in terms and numbers of four digits, which are a range
+  // of years ("1700-1750" or "1742") but may also be terms (e.g. an
+  // inventory number)
+  static parseQuery(query, fold = {}) {
+    const terms = [];
+    const numbers = [];
+
+    for (const term of MapSearch.tokenize(query, fold)) {
+      if (/^\d{4}$/.test(term)) numbers.push(term);
+      else terms.push(term);
+    }
+
+    const years = numbers.map((n) => parseInt(n));
+    return {
+      terms,
+      numbers,
+      years: years.length ? [Math.min(...years), Math.max(...years)] : null,
+    };
+  }
+
+  // Ids of the documents of a term, or of every term it is the prefix of
+  async termIds(term, meta) {
+    const prefix = term.slice(0, meta.prefix_length);
+    if (!meta.terms.includes(prefix)) return new Set();
+
+    const shard = await this.fetchShard(`terms/${prefix}.json`);
+    const ids = new Set();
+    for (const [t, deltas] of Object.entries(shard)) {
+      if (t === term || (term.length >= meta.prefix_length && t.startsWith(term))) {
+        MapSearch.deltaDecode(deltas).forEach((id) => ids.add(id));
+      }
+    }
+
+    return ids;
+  }
+
+  // Ids of the documents with a date that overlaps a range of years
+  async yearIds([first, last], meta) {
+    const decades = meta.decades.filter((d) => d + 9 >= first && d <= last);
+    const shards = await Promise.all(decades.map((d) => this.fetchShard(`dates/${d}.json`)));
+
+    const ids = new Set();
+    for (const shard of shards) {
+      MapSearch.deltaDecode(shard.ids).forEach((id, n) => {
+        const [start, end] = shard.years[n];
+        if (start <= last && end >= first) ids.add(id);
+      });
+    }
+
+    return ids;
+  }
+
+  // Ids of the documents in every set
+  static intersect(sets) {
+    const [first, ...rest] = [...sets].sort((a, b) => a.size - b.size);
+    return new Set([...first].filter((id) => rest.every((s) => s.has(id))));
+  }
+
+  // Ids of the documents with a date in the range of the numbers, or
+  // with every number as a term
+  async numberIds(numbers, years, meta) {
+    const [dated, ...terms] = await Promise.all([
+      this.yearIds(years, meta),
+      ...numbers.map((n) => this.termIds(n, meta)),
+    ]);
+
+    return new Set([...dated, ...MapSearch.intersect(terms)]);
+  }
+
+  async search(query, limit = 50) {
+    const meta = await this.meta();
+    const { terms, numbers, years } = MapSearch.parseQuery(query, meta.fold);
+
+    const stopwords = new Set(meta.stopwords);
+    const lookups = terms.filter((t) => !stopwords.has(t)).map((t) => this.termIds(t, meta));
+    if (years) lookups.push(this.numberIds(numbers, years, meta));
+    if (lookups.length === 0) return [];
+
+    // Documents that match every term and the years (or numbers)
+    const ids = [...MapSearch.intersect(await Promise.all(lookups))];
+    ids.sort((a, b) => a - b);
+
+    return Promise.all(
+      ids.slice(0, limit).map(async (id) => {
+        const docs = await this.fetchShard(`docs/${Math.floor(id / meta.docs_per_shard)}.json`);
+        const [path, label, ...docYears] = docs[id % meta.docs_per_shard];
+        return { id: meta.base_url + path, label, years: docYears };
+      })
+    );
+  }
+}
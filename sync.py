@@ -0,0 +1,360 @@
+"""
+Publish the generated IIIF files to the hosting target, differentially.
+
+Instead of copying the whole tree, the files are compared with an
+inventory of the SHA-256 hashes of what was published before
+(`inventory.json` on the target), and only the added and changed files
+are transferred, in parallel, and the removed ones deleted.
+
+Every file is replaced atomically, and the files are transferred in an
+order in which a viewer never finds a reference to a missing file:
+
+1. manifests (and other files that are not collections)
+2. collections, the most deeply nested first, so that a collection is
+   only replaced once everything it refers to is there
+3. the activity stream (see `change_discovery.py`)
+4. the removed collections (the top-level ones first), and then the
+   other removed files
+
+The target is a local folder, or a URL that accepts HTTP PUT and DELETE.
+
+Usage (from the root of the repository):
+
+    python sync.py maps/ /var/www/manifests/maps/ [--workers 8] [--dry-run]
+    python sync.py maps/ https://upload.example.org/maps/
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+from urllib3.util import Retry
+
+from change_discovery import ACTIVITY_FOLDER
+from iiif_files import read_header
+
+INVENTORY_FILENAME = "inventory.json"
+
+CONTENT_TYPES = {
+    ".json": "application/json",
+    ".gz": "application/gzip",
+    ".br": "application/x-brotli",
+}
+
+
+class DirectoryTarget:
+    """A local folder to publish to."""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def read_inventory(self) -> dict[str, str]:
+        try:
+            with open(os.path.join(self.folder, INVENTORY_FILENAME), "rb") as infile:
+                return json.load(infile)
+        except FileNotFoundError:
+            return {}
+
+    def put(self, path: str, data: bytes) -> None:
+        """Replace a file atomically."""
+        target_path = os.path.join(self.folder, path)
+        tmp_path = f"{target_path}.tmp-{os.getpid()}"
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        with open(tmp_path, "wb") as outfile:
+            outfile.write(data)
+        os.replace(tmp_path, target_path)
+
+    def delete(self, path: str) -> None:
+        """Remove a file, and the folders that are left empty."""
+        try:
+            os.remove(os.path.join(self.folder, path))
+        except FileNotFoundError:
+            pass
+
+        folder = os.path.dirname(path)
+        while folder:
+            try:
+                os.rmdir(os.path.join(self.folder, folder))
+            except OSError:
+                break  # not empty (or removed by another thread)
+
+            folder = os.path.dirname(folder)
+
+
+class HTTPTarget:
+    """A web server to publish to with HTTP PUT and DELETE."""
+
+    def __init__(self, url: str, max_workers: int = 8, timeout: float = 60.0):
+        """
+        Args:
+            url (str): URL of the folder on the server.
+            max_workers (int, optional): Number of connections. Defaults to 8.
+            timeout (float, optional): Timeout of a request in seconds.
+            Defaults to 60.
+        """
+        self.url = url if url.endswith("/") else url + "/"
+        self.timeout = timeout
+
+        # Retry transient errors, also for PUT and DELETE (both idempotent)
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods={"GET", "PUT", "DELETE"},
+        )
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=max_workers, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def read_inventory(self) -> dict[str, str]:
+        response = self.session.get(self.url + INVENTORY_FILENAME, timeout=self.timeout)
+        if response.status_code == 404:
+            return {}
+        response.raise_for_status()
+
+        return response.json()
+
+    def put(self, path: str, data: bytes) -> None:
+        content_type = CONTENT_TYPES.get(os.path.splitext(path)[1], "")
+
+        response = self.session.put(
+            self.url + quote(path),
+            data=data,
+            headers={"Content-Type": content_type} if content_type else {},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
+    def delete(self, path: str) -> None:
+        response = self.session.delete(self.url + quote(path), timeout=self.timeout)
+        if response.status_code != 404:
+            response.raise_for_status()
+
+
+def make_target(location: str, max_workers: int = 8) -> DirectoryTarget | HTTPTarget:
+    """The target for a folder or URL."""
+    if location.startswith(("http://", "https://")):
+        return HTTPTarget(location, max_workers=max_workers)
+
+    return DirectoryTarget(location)
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as infile:
+        return hashlib.sha256(infile.read()).hexdigest()
+
+
+def make_inventory(folder: str, max_workers: int = 8) -> dict[str, str]:
+    """
+    Hash every file in a folder (recursively).
+
+    Args:
+        folder (str): The folder.
+        max_workers (int, optional): Number of files hashed at once.
+        Defaults to 8.
+
+    Returns:
+        dict[str, str]: SHA-256 hash of every file, by its path in the
+        folder (with "/" as separator).
+    """
+    paths = sorted(
+        os.path.relpath(os.path.join(root, f), folder).replace(os.sep, "/")
+        for root, _, files in os.walk(folder)
+        for f in files
+        if f != INVENTORY_FILENAME and ".tmp-" not in f
+    )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        hashes = executor.map(file_hash, (os.path.join(folder, p) for p in paths))
+
+        return dict(zip(paths, hashes))
+
+
+def diff_inventories(
+    local: dict[str, str], remote: dict[str, str]
+) -> tuple[list[str], list[str], list[str]]:
+    """
+    Compare the files to publish with what was published.
+
+    Args:
+        local (dict[str, str]): Inventory of the files to publish.
+        remote (dict[str, str]): Inventory of the target.
+
+    Returns:
+        tuple[list[str], list[str], list[str]]: The added, changed and
+        removed paths.
+    """
+    added = [p for p in local if p not in remote]
+    changed = [p for p in local if p in remote and local[p] != remote[p]]
+    removed = [p for p in remote if p not in local]
+
+    return added, changed, removed
+
+
+def document_path(path: str) -> str:
+    """The JSON document of a file, also for a compressed variant (x.json.gz)."""
+    return path.removesuffix(".gz").removesuffix(".br")
+
+
+def plan_transfers(
+    folder: str, uploads: list[str], removed: list[str], remote: dict[str, str]
+) -> list[tuple[str, list[str]]]:
+    """
+    Order the transfers in batches, see the module docstring.
+
+    Args:
+        folder (str): Folder of the files to publish.
+        uploads (list[str]): Added and changed paths.
+        removed (list[str]): Removed paths.
+        remote (dict[str, str]): Inventory of the target.
+
+    Returns:
+        list[tuple[str, list[str]]]: Batches of ("put" or "delete", paths).
+        The files in a batch can be transferred in parallel.
+    """
+    # The parts of a collection are in a folder of its name (see
+    # `to_collection`), so a removed collection is known by its folder
+    remote_folders = {
+        "/".join(parts[:n])
+        for parts in (p.split("/") for p in remote)
+        for n in range(1, len(parts))
+    }
+
+    def is_collection(path):
+        document = document_path(path)
+        if not document.endswith(".json"):
+            return False
+
+        try:
+            header = read_header(os.path.join(folder, document), fields=("type",))
+        except FileNotFoundError:
+            return document.removesuffix(".json") in remote_folders
+        except ValueError:
+            return False  # not a JSON object
+
+        return header.get("type") == "Collection"
+
+    def depth(path):
+        return path.count("/")
+
+    def is_activity(path):
+        return path.startswith(ACTIVITY_FOLDER + "/")
+
+    files = [p for p in uploads if not is_activity(p) and not is_collection(p)]
+    collections = [p for p in uploads if not is_activity(p) and is_collection(p)]
+    activity = [p for p in uploads if is_activity(p)]
+
+    removed_collections = [p for p in removed if is_collection(p)]
+    removed_files = [p for p in removed if not is_collection(p)]
+
+    batches = [("put", files)]
+    for d in sorted({depth(p) for p in collections}, reverse=True):
+        batches.append(("put", [p for p in collections if depth(p) == d]))
+    batches.append(("put", activity))
+    for d in sorted({depth(p) for p in removed_collections}):
+        batches.append(("delete", [p for p in removed_collections if depth(p) == d]))
+    batches.append(("delete", removed_files))
+
+    return [(action, paths) for action, paths in batches if paths]
+
+
+def sync(
+    folder: str,
+    target: DirectoryTarget | HTTPTarget,
+    max_workers: int = 8,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Publish the changes in a folder to a target.
+
+    The inventory of the target is updated with every file that was
+    transferred, also if some transfers failed, so that only those are
+    tried again in the next run.
+
+    Args:
+        folder (str): Folder of the IIIF files (e.g. "maps/").
+        target (DirectoryTarget | HTTPTarget): Where to publish them.
+        max_workers (int, optional): Number of files transferred at once.
+        Defaults to 8.
+        dry_run (bool, optional): Only report what would be transferred.
+        Defaults to False.
+
+    Returns:
+        dict: Number of "files", "added", "changed", "removed" and
+        "unchanged" files, and the number of bytes "transferred".
+    """
+    local = make_inventory(folder, max_workers=max_workers)
+    remote = target.read_inventory()
+
+    added, changed, removed = diff_inventories(local, remote)
+    totals = {
+        "files": len(local),
+        "added": len(added),
+        "changed": len(changed),
+        "removed": len(removed),
+        "unchanged": len(local) - len(added) - len(changed),
+        "transferred": 0,
+    }
+
+    if dry_run or not (added or changed or removed):
+        return totals
+
+    batches = plan_transfers(folder, added + changed, removed, remote)
+
+    def put(path):
+        with open(os.path.join(folder, path), "rb") as infile:
+            data = infile.read()
+
+        target.put(path, data)
+
+        return len(data)
+
+    published = dict(remote)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for action, paths in batches:
+                if action == "put":
+                    for path, size in zip(paths, executor.map(put, paths)):
+                        published[path] = local[path]
+                        totals["transferred"] += size
+                else:
+                    for path, _ in zip(paths, executor.map(target.delete, paths)):
+                        published.pop(path, None)
+    finally:
+        target.put(
+            INVENTORY_FILENAME,
+            json.dumps(published, indent=2, sort_keys=True).encode("utf-8"),
+        )
+
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("folder")
+    parser.add_argument("target", help="Folder or URL")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    totals = sync(
+        args.folder,
+        make_target(args.target, max_workers=args.workers),
+        max_workers=args.workers,
+        dry_run=args.dry_run,
+    )
+
+    print(
+        f"{args.folder} -> {args.target}: {totals['files']} files, "
+        f"{totals['added']} added, {totals['changed']} changed, "
+        f"{totals['removed']} removed, {totals['unchanged']} unchanged, "
+        f"{totals['transferred']:,} bytes transferred"
+    )